@@ -0,0 +1,557 @@
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+import chunk
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_BASELINE = Path('benchmark_baseline.json')
+
+TOKEN_HEADER = ['paragraph_ID', 'sentence_ID', 'token_ID_within_sentence', 'token_ID_within_document', 'word', 'lemma',
+                'byte_onset', 'byte_offset', 'POS_tag', 'fine_POS_tag', 'dependency_relation', 'syntactic_head_ID', 'event']
+QUOTE_HEADER = ['quote_start', 'quote_end', 'mention_start', 'mention_end', 'mention_phrase', 'char_id', 'quote']
+
+
+def peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def generate_book(dest_path: os.PathLike, tokens: int = 1_000_000, quote_density: float = 0.3, paragraph_length: int = 60,
+                  speakers: int = 20, vocab_size: int = 20000, seed: int = 0):
+    """
+    Writes synthetic BookNLP output (`parsed/book.tokens` and `parsed/book.quotes`) to `dest_path`.
+
+    Words follow a Zipf distribution over a made-up vocabulary, sentences average 15 tokens,
+    paragraphs average `paragraph_length` tokens, and `quote_density` is the fraction of paragraphs
+    that contain dialogue, attributed to one of `speakers` characters. Written as a stream, so
+    millions of tokens don't need much memory.
+    """
+    rng = random.Random(seed)
+    dest_path = Path(dest_path)
+    parsed = dest_path / 'parsed'
+    parsed.mkdir(parents=True, exist_ok=True)
+    (dest_path / 'text').mkdir(parents=True, exist_ok=True)
+
+    consonants = 'bcdfghjklmnprstvwz'
+    vowels = 'aeiou'
+    vocab = []
+    for i in range(vocab_size):
+        syl = 1 + min(3, int(rng.expovariate(1.2)))
+        vocab.append(''.join(rng.choice(consonants) + rng.choice(vowels) for _ in range(syl)))
+    # Zipf weights, drawn through a cumulative table
+    cum = []
+    total = 0.0
+    for r in range(vocab_size):
+        total += 1 / (r + 1)
+        cum.append(total)
+    contractions = ["n't", "'s", "'ll", "'re"]
+
+    def _sentence() -> list:
+        n = max(2, int(rng.gauss(15, 7)))
+        words = rng.choices(vocab, cum_weights=cum, k=n)
+        words[0] = words[0].capitalize()
+        for _ in range(n // 8):
+            words.insert(rng.randrange(1, len(words)), ',')
+        if rng.random() < 0.05:
+            words.insert(rng.randrange(1, len(words)), rng.choice(contractions))
+        words.append(rng.choices(['.', '?', '!'], weights=[0.85, 0.1, 0.05])[0])
+        return words
+
+    i = 0
+    sentence_id = 0
+    paragraph_id = 0
+    with open(parsed / 'book.tokens', 'w', encoding='utf-8') as tf, open(parsed / 'book.quotes', 'w', encoding='utf-8') as qf:
+        tf.write('\t'.join(TOKEN_HEADER) + '\n')
+        qf.write('\t'.join(QUOTE_HEADER) + '\n')
+
+        def _write(words: list, sentence_id: int):
+            nonlocal i
+            for k, w in enumerate(words):
+                tf.write(f"{paragraph_id}\t{sentence_id}\t{k}\t{i}\t{w}\t{w.lower()}\t0\t0\tX\tX\tdep\t0\tO\n")
+                i += 1
+
+        while i < tokens:
+            target = max(3, int(rng.expovariate(1 / paragraph_length)))
+            start = i
+            dialogue = rng.random() < quote_density
+            while i - start < target and i < tokens:
+                sentence = _sentence()
+                if dialogue:
+                    # "Quote," attribution. "More quote."
+                    speaker = rng.randrange(speakers)
+                    q0 = i
+                    _write(['"'] + sentence + ['"'], sentence_id)
+                    qf.write(f"{q0}\t{i - 1}\t{i}\t{i + 1}\the\t{speaker}\t-\n")
+                    if rng.random() < 0.5:
+                        sentence_id += 1
+                        _write(['he', 'said', '.'], sentence_id)
+                else:
+                    _write(sentence, sentence_id)
+                sentence_id += 1
+            paragraph_id += 1
+
+
+def _distribution(values: list) -> dict:
+    values = sorted(values)
+    if not values:
+        return {}
+    def _pct(p):
+        return values[min(len(values) - 1, int(p * len(values)))]
+    return {
+        'count': len(values),
+        'mean': statistics.mean(values),
+        'stdev': statistics.stdev(values) if len(values) > 1 else 0.0,
+        'p5': _pct(0.05),
+        'p50': _pct(0.5),
+        'p95': _pct(0.95),
+        'max': values[-1],
+    }
+
+
+def run_chunking(book_path: os.PathLike, algorithm: str = 'heuristic', length_model='tokens', min_length: float = 5,
+                 max_length: float = 80, speakers: int = 20) -> dict:
+    """Times each chunking phase on the book at `book_path` the same way `chunk.generate_chunks` runs them."""
+    book_path = Path(book_path)
+    scene_names = {i: f"voice{i % 5}" for i in range(speakers)}
+    timings = {}
+    rss = {}
+
+    cache = book_path / 'parsed' / 'book.npz'
+    if cache.exists():
+        cache.unlink()
+    t = time.perf_counter()
+    chunk.import_data(book_path)
+    timings['import_cold'] = time.perf_counter() - t
+    rss['import_cold'] = peak_rss_mb()
+
+    t = time.perf_counter()
+    book = chunk.import_data(book_path)
+    book.set_length_model(length_model)
+    timings['import_warm'] = time.perf_counter() - t
+    rss['import_warm'] = peak_rss_mb()
+
+    t = time.perf_counter()
+    data = chunk.prepare_data(book, scene_names)
+    timings['prepare'] = time.perf_counter() - t
+    rss['prepare'] = peak_rss_mb()
+
+    t = time.perf_counter()
+    charchunks = []
+    for i in data:
+        if algorithm == 'optimal':
+            chunks = chunk.optimal_chunks(book, i['paragraphs'], min_length, max_length)
+        else:
+            chunks = chunk.heuristic_chunks(book, i['paragraphs'], min_length, max_length)
+        charchunks.append({'character': i['character'], 'chunks': chunks})
+    timings['segment'] = time.perf_counter() - t
+    rss['segment'] = peak_rss_mb()
+
+    t = time.perf_counter()
+    chunk.export_chunks(charchunks, book_path / 'text')
+    timings['export'] = time.perf_counter() - t
+    rss['export'] = peak_rss_mb()
+
+    lengths = [c.length for i in charchunks for c in i['chunks']]
+    return {'timings': timings, 'peak_rss_mb': rss, 'chunk_lengths': _distribution(lengths)}
+
+
+def compare(result: dict, baseline: dict, threshold: float) -> list:
+    """Returns a line for every phase that got slower (or bigger) than `baseline` by more than `threshold`."""
+    regressions = []
+    for phase, seconds in result['timings'].items():
+        base = baseline['timings'].get(phase)
+        # Ignore noise on phases that only take a few milliseconds
+        if base and seconds > base * (1 + threshold) and seconds - base > 0.05:
+            regressions.append(f"{phase}: {seconds:.3f}s vs. baseline {base:.3f}s (+{(seconds / base - 1) * 100:.0f}%)")
+    peak = max((v for v in result['peak_rss_mb'].values() if v is not None), default=None)
+    base_peak = max((v for v in baseline.get('peak_rss_mb', {}).values() if v is not None), default=None)
+    if peak and base_peak and peak > base_peak * (1 + threshold):
+        regressions.append(f"peak RSS: {peak:.0f}MB vs. baseline {base_peak:.0f}MB")
+    return regressions
+
+
+def print_result(result: dict, title: str = "Chunking Benchmark"):
+    print(f"\n=============== {title} ===============\n")
+    for phase, seconds in result['timings'].items():
+        rss = result['peak_rss_mb'].get(phase)
+        rss_str = f"   peak RSS {rss:.0f}MB" if rss is not None else ""
+        print(f"    {phase + ':':<20}{seconds:8.3f}s{rss_str}")
+    d = result.get('chunk_lengths')
+    if d:
+        print(f"\n    Chunks:             {d['count']}")
+        print(f"    Length mean/stdev:  {d['mean']:.2f} / {d['stdev']:.2f}")
+        print(f"    Length p5/p50/p95:  {d['p5']:.2f} / {d['p50']:.2f} / {d['p95']:.2f}")
+        print(f"    Length max:         {d['max']:.2f}")
+    print("\n" + "=" * (32 + len(title)) + "\n")
+
+
+def main_chunk(args):
+    key = (f"chunk tokens={args.tokens} quotes={args.quote_density} paragraph={args.paragraph_length} "
+           f"speakers={args.speakers} algorithm={args.algorithm} length_model={args.length_model}")
+    work = Path(args.keep) if args.keep else Path(tempfile.mkdtemp(prefix='chunk_bench_'))
+    try:
+        print(f"Generating synthetic book ({args.tokens} tokens) in {work}")
+        generate_book(work, args.tokens, args.quote_density, args.paragraph_length, args.speakers, seed=args.seed)
+        results = [run_chunking(work, args.algorithm, args.length_model, args.min_length, args.max_length, args.speakers)
+                   for _ in range(args.repeat)]
+    finally:
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+    # Best of the repeats is the least noisy estimate
+    result = results[0]
+    for r in results[1:]:
+        for phase, seconds in r['timings'].items():
+            result['timings'][phase] = min(result['timings'][phase], seconds)
+    print_result(result)
+    return key, result
+
+
+def generate_pdf(dest: os.PathLike, pages: int = 1000, seed: int = 0):
+    """Writes a PDF of `pages` pages, each with a handful of paragraph blocks of random words."""
+    import pymupdf
+    rng = random.Random(seed)
+    words = ['the', 'a', 'said', 'house', 'quietly', 'morning', 'river', 'she', 'he', 'was', 'never',
+             'through', 'window', 'light', 'again', '"Yes,"', 'answered', 'before', 'long', 'road.']
+    doc = pymupdf.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        y = 50
+        for _ in range(8):
+            page.insert_textbox(pymupdf.Rect(50, y, 550, y + 85), ' '.join(rng.choices(words, k=60)), fontsize=10)
+            y += 90
+    doc.save(str(dest))
+    doc.close()
+
+
+def main_pdf(args):
+    import book_text
+    key = f"pdf pages={args.pages} workers={args.workers}"
+    work = Path(tempfile.mkdtemp(prefix='pdf_bench_'))
+    try:
+        pdf = work / 'book.pdf'
+        print(f"Generating {args.pages}-page PDF in {work}")
+        generate_pdf(pdf, args.pages)
+        book_text.CACHE_PATH = work / 'cache'
+        timings = {}
+        rss = {}
+        t = time.perf_counter()
+        serial = book_text.extract_pdf(pdf, workers=1, use_cache=False)
+        timings['serial'] = time.perf_counter() - t
+        rss['serial'] = peak_rss_mb()
+        t = time.perf_counter()
+        parallel = book_text.extract_pdf(pdf, workers=args.workers)
+        timings['parallel'] = time.perf_counter() - t
+        rss['parallel'] = peak_rss_mb()
+        t = time.perf_counter()
+        cached = book_text.extract_pdf(pdf, workers=args.workers)
+        timings['cached'] = time.perf_counter() - t
+        rss['cached'] = peak_rss_mb()
+        if not serial == parallel == cached:
+            raise RuntimeError("Parallel or cached extraction differs from serial extraction")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    result = {'timings': timings, 'peak_rss_mb': rss}
+    print_result(result, "PDF Extraction Benchmark")
+    return key, result
+
+
+# Adversarial line shapes for the quote normalizer: unbalanced openers, long gaps, doubled quotes, OCR noise
+ADVERSARIAL_LINES = {
+    'unclosed': lambda n: ' "a' * n,
+    'openers': lambda n: ' " "' * n,
+    'doubled': lambda n: ' " ""' * n,
+    'ocr': lambda n: ' "word "word' * n,
+    'long_gap': lambda n: ' "' + 'a ' * n + '"' + 'b' * n + '"',
+}
+
+
+def check_quotes(cases: int, seed: int = 0):
+    """Checks normalize_quotes() against the original regex on random lines built from quote-heavy pieces."""
+    import book_text
+    rng = random.Random(seed)
+    pieces = ['"', ' ', "'", 'ab', '\n', ' "', '" ', '""', 'word']
+    for i in range(cases):
+        text = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 60)))
+        expected = book_text.normalize_quotes_regex(text)
+        got = book_text.normalize_quotes(text)
+        if got != expected:
+            raise RuntimeError(f"normalize_quotes differs from the regex on {text!r}: {got!r} vs. {expected!r}")
+
+
+def main_quotes(args):
+    import book_text
+    key = f"quotes length={args.length}"
+    t = time.perf_counter()
+    check_quotes(args.cases, args.seed)
+    print(f"{args.cases} random inputs match the regex ({time.perf_counter() - t:.1f}s)")
+    timings = {}
+    rss = {}
+    for name, make in ADVERSARIAL_LINES.items():
+        # Time at 1/4 and full length: a linear normalizer takes ~4x as long, not 16x
+        small, full = make(args.length // 4), make(args.length)
+        t = time.perf_counter()
+        book_text.normalize_quotes(small)
+        t_small = time.perf_counter() - t
+        t = time.perf_counter()
+        out = book_text.normalize_quotes(full)
+        timings[name] = time.perf_counter() - t
+        rss[name] = peak_rss_mb()
+        t = time.perf_counter()
+        expected = book_text.normalize_quotes_regex(full)
+        timings[name + ' (regex)'] = time.perf_counter() - t
+        if out != expected:
+            raise RuntimeError(f"normalize_quotes differs from the regex on the '{name}' line")
+        growth = timings[name] / t_small if t_small > 1e-4 else 0
+        if growth > 8:
+            raise RuntimeError(f"normalize_quotes took {growth:.1f}x longer on a 4x longer '{name}' line")
+    result = {'timings': timings, 'peak_rss_mb': rss}
+    print_result(result, "Quote Normalizer Benchmark")
+    return key, result
+
+
+def generate_text(dest: os.PathLike, megabytes: int, seed: int = 0):
+    """Writes a plain text book of roughly `megabytes` MB, single spaced, with dialogue and nested quotes."""
+    rng = random.Random(seed)
+    words = ['the', 'a', 'said', 'he', 'she', 'went', 'into', 'room', 'and', 'then', 'quietly', 'caf\u00e9', 'na\u00efve']
+    written = 0
+    with open(dest, 'w', encoding='utf-8') as f:
+        while written < megabytes << 20:
+            ws = [rng.choice(words) for _ in range(rng.randint(5, 60))]
+            if rng.random() < 0.3:
+                ws.insert(rng.randint(0, len(ws)), '"Did you say "hello" to him?"...')
+            line = ' '.join(ws) + '\n'
+            f.write(line)
+            written += len(line)
+
+
+def main_sanitize(args):
+    import book_text
+    key = f"sanitize mb={args.mb}"
+    work = Path(tempfile.mkdtemp(prefix='sanitize_bench_'))
+    try:
+        src = work / 'book.txt'
+        print(f"Generating {args.mb}MB text in {work}")
+        generate_text(src, args.mb)
+        timings = {}
+        rss = {}
+        # Streaming first, peak RSS only ever goes up
+        t = time.perf_counter()
+        book_text.sanitize_file(src, work / 'streamed.txt')
+        timings['streaming'] = time.perf_counter() - t
+        rss['streaming'] = peak_rss_mb()
+        if not args.skip_in_memory:
+            t = time.perf_counter()
+            with open(src, 'r') as f:
+                text = book_text.sanitize(f.read())
+            timings['in_memory'] = time.perf_counter() - t
+            rss['in_memory'] = peak_rss_mb()
+            with open(work / 'streamed.txt', 'r') as f:
+                same = f.read() == text
+            del text
+            if not same:
+                raise RuntimeError("Streaming sanitization differs from sanitize()")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    result = {'timings': timings, 'peak_rss_mb': rss}
+    print_result(result, "Sanitizer Benchmark")
+    return key, result
+
+
+def write_wav_f32(path: os.PathLike, samples: np.ndarray, rate: int):
+    # 32-bit float WAV, as torchaudio writes the chunk audio
+    data = samples.astype('<f4').tobytes()
+    with open(path, 'wb') as f:
+        f.write(b'RIFF' + struct.pack('<I', 36 + len(data)) + b'WAVE')
+        f.write(b'fmt ' + struct.pack('<IHHIIHH', 16, 3, 1, rate, rate * 4, 4, 32))
+        f.write(b'data' + struct.pack('<I', len(data)) + data)
+
+
+def generate_audio_chunks(dest: os.PathLike, chunks: int, seconds: float, rate: int = 24000, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    dest = Path(dest)
+    dest.mkdir(parents=True, exist_ok=True)
+    t = np.arange(int(seconds * rate * 1.5)) / rate
+    for i in range(chunks):
+        # Chunk lengths vary like real ones, from half to one and a half times `seconds`
+        n = int(seconds * rate * rng.uniform(0.5, 1.5))
+        tone = 0.3 * np.sin(2 * np.pi * rng.uniform(100, 300) * t[:n]) + 0.01 * rng.standard_normal(n)
+        write_wav_f32(dest / f"chunk_{i:05d}.wav", tone, rate)
+
+
+def main_export(args):
+    import export_audio
+    key = f"export chunks={args.chunks} seconds={args.seconds} workers={args.workers}"
+    work = Path(tempfile.mkdtemp(prefix='export_bench_'))
+    try:
+        audio = work / 'audio'
+        print(f"Generating {args.chunks} chunk WAVs in {work}")
+        generate_audio_chunks(audio, args.chunks, args.seconds)
+        timings = {}
+        rss = {}
+        # Reading alone, without the encoder, to see how much of the export is spent on our side
+        t = time.perf_counter()
+        with open(os.devnull, 'wb') as out:
+            stats = export_audio.stream_pcm(export_audio.wav_files(audio), out)
+        timings['read_pcm'] = time.perf_counter() - t
+        rss['read_pcm'] = peak_rss_mb()
+        print(f"{stats['seconds'] / 3600:.1f}h of audio")
+        if shutil.which('ffmpeg'):
+            t = time.perf_counter()
+            export_audio.export_book(audio, work / 'streamed.mp3', workers=1)
+            timings['streaming'] = time.perf_counter() - t
+            rss['streaming'] = peak_rss_mb()
+            if args.workers > 1:
+                # The same book split into parts encoded at once
+                t = time.perf_counter()
+                export_audio.export_book(audio, work / 'parallel.mp3', workers=args.workers)
+                timings[f'parallel_{args.workers}'] = time.perf_counter() - t
+                rss[f'parallel_{args.workers}'] = peak_rss_mb()
+        else:
+            print("ffmpeg not found, skipping the MP3 exports")
+        if shutil.which('ffmpeg') and not args.skip_pydub:
+            try:
+                from pydub import AudioSegment
+            except ImportError:
+                AudioSegment = None
+                print("pydub not installed, skipping the pydub export")
+            if AudioSegment:
+                # What the export screen used to do
+                t = time.perf_counter()
+                segments = [AudioSegment.from_wav(f) for f in export_audio.wav_files(audio)]
+                combined = sum(segments[1:], segments[0])
+                combined.export(work / 'pydub.mp3', format="mp3")
+                timings['pydub'] = time.perf_counter() - t
+                rss['pydub'] = peak_rss_mb()
+                del segments, combined
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    result = {'timings': timings, 'peak_rss_mb': rss}
+    print_result(result, "Export Benchmark")
+    return key, result
+
+
+# "import time: <self us> | <cumulative us> | <module>", nested imports indented two spaces per level
+IMPORT_TIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+
+def import_times(module: str) -> list:
+    """Imports `module` in a fresh interpreter with -X importtime. Returns (depth, module, cumulative seconds) in import order."""
+    res = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                         capture_output=True, text=True, cwd=Path(__file__).resolve().parent)
+    if res.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed: {res.stderr.strip().splitlines()[-1]}")
+    times = []
+    for line in res.stderr.splitlines():
+        m = IMPORT_TIME.match(line)
+        if m:
+            times.append((len(m.group(3)) // 2, m.group(4), int(m.group(2)) / 1e6))
+    return times
+
+
+def main_startup(args):
+    key = "startup " + " ".join(args.modules)
+    timings = {}
+    for module in args.modules:
+        runs = [import_times(module) for _ in range(max(args.repeat, 1))]
+        best = min(runs, key=lambda times: times[-1][2])
+        timings[f"import {module}"] = best[-1][2]
+        # Direct imports of the module are the depth 1 entries since the previous top level import
+        start = max((i for i, (depth, _, _) in enumerate(best[:-1]) if depth == 0), default=-1) + 1
+        children = sorted(((seconds, name) for depth, name, seconds in best[start:-1] if depth == 1), reverse=True)
+        print(f"Slowest imports under {module}:")
+        for seconds, name in children[:args.top]:
+            print(f"    {name + ':':<28}{seconds:8.3f}s")
+    result = {'timings': timings, 'peak_rss_mb': {}}
+    print_result(result, "Startup Benchmark")
+    return key, result
+
+
+BENCHMARKS = {'chunk': main_chunk, 'pdf': main_pdf, 'quotes': main_quotes, 'sanitize': main_sanitize, 'startup': main_startup, 'export': main_export}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks with regression checks against a stored baseline.")
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help="Baseline file to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="Store this run as the new baseline")
+    parser.add_argument('--threshold', type=float, default=0.25, help="Allowed slowdown before failing, as a fraction")
+    parser.add_argument('--repeat', type=int, default=1)
+    sub = parser.add_subparsers(dest='benchmark', required=True)
+
+    p = sub.add_parser('chunk', help="Chunking phases on a synthetic BookNLP output")
+    p.add_argument('--tokens', type=int, default=1_000_000)
+    p.add_argument('--quote-density', type=float, default=0.3)
+    p.add_argument('--paragraph-length', type=int, default=60)
+    p.add_argument('--speakers', type=int, default=20)
+    p.add_argument('--algorithm', default='heuristic', choices=['heuristic', 'optimal'])
+    p.add_argument('--length-model', default='tokens', choices=list(chunk.LENGTH_MODELS))
+    p.add_argument('--min-length', type=float, default=5)
+    p.add_argument('--max-length', type=float, default=80)
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--keep', help="Generate into (and keep) this folder instead of a temporary one")
+
+    p = sub.add_parser('pdf', help="PDF text extraction, serial vs. parallel vs. cached")
+    p.add_argument('--pages', type=int, default=1000)
+    p.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+
+    p = sub.add_parser('quotes', help="Quote normalizer vs. the original regex, random equivalence checks and adversarial lines")
+    p.add_argument('--cases', type=int, default=20000, help="Random inputs to check against the regex")
+    p.add_argument('--length', type=int, default=200_000, help="Repetitions in each adversarial line")
+    p.add_argument('--seed', type=int, default=0)
+
+    p = sub.add_parser('sanitize', help="Streaming vs. in-memory sanitization of a large plain text book")
+    p.add_argument('--mb', type=int, default=200)
+    p.add_argument('--skip-in-memory', action='store_true', help="Only run the streaming sanitizer")
+
+    p = sub.add_parser('startup', help="Import time of the GUI and heavy modules, measured with -X importtime")
+    p.add_argument('--modules', nargs='+', default=['unified_gui'], help="Modules to import, each in a fresh interpreter")
+    p.add_argument('--top', type=int, default=10, help="How many of the slowest direct imports to list")
+
+    p = sub.add_parser('export', help="Streaming MP3 export of a synthetic book's chunk WAVs, vs. the old pydub export")
+    p.add_argument('--chunks', type=int, default=20000)
+    p.add_argument('--seconds', type=float, default=1.0, help="Average chunk length, the WAVs take about 96KB per second")
+    p.add_argument('--skip-pydub', action='store_true', help="Don't run the pydub export, which holds the whole book in memory")
+    p.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Encoders for the parallel export, compared against one")
+
+    args = parser.parse_args()
+    key, result = BENCHMARKS[args.benchmark](args)
+
+    baseline_path = Path(args.baseline)
+    baselines = {}
+    if baseline_path.is_file():
+        with open(baseline_path, 'r') as f:
+            baselines = json.load(f)
+    if args.save_baseline:
+        baselines[key] = result
+        with open(baseline_path, 'w') as f:
+            json.dump(baselines, f, indent=2)
+        print(f"Saved baseline to {baseline_path}")
+    elif key in baselines:
+        regressions = compare(result, baselines[key], args.threshold)
+        if regressions:
+            print("Performance regressions:")
+            for r in regressions:
+                print(f"    {r}")
+            sys.exit(1)
+        print("No regressions against baseline.")
+    else:
+        print("No baseline for this configuration, run with --save-baseline to store one.")
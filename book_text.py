@@ -0,0 +1,432 @@
+import hashlib
+import json
+import os
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from pathlib import Path
+from urllib.parse import unquote
+import regex as re
+import unidecode
+
+# Reading source books into plain text. Kept free of torch/BookNLP imports so worker processes start quickly.
+
+CACHE_PATH = Path('cache') / 'pages'
+# Bump whenever extraction output changes, so stale cached pages aren't reused
+EXTRACT_VERSION = 1
+# Below this many pages a process pool costs more than it saves
+MIN_PARALLEL_PAGES = 64
+# Plain text files up to this size decide paragraph spacing from the whole text, larger ones from evenly
+# spaced windows adding up to about this much
+SANITIZE_SAMPLE_BYTES = 2 << 20
+SANITIZE_SAMPLE_WINDOWS = 32
+
+
+def file_hash(path: os.PathLike) -> str:
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _extract_pages(path: str, start: int, stop: int) -> list:
+    import pymupdf
+    pages = []
+    with pymupdf.open(path) as doc:
+        for i in range(start, stop):
+            blocks = doc[i].get_text("blocks", sort=True)
+            pages.append("\n\n".join(txt_block.replace("\n", " ") for x0, y0, x1, y1, txt_block, bno, btype in blocks))
+    return pages
+
+
+def extract_pdf_pages(src_path: os.PathLike, workers: int | None = None, use_cache: bool = True) -> list:
+    """
+    Returns the text of every page of a PDF, blocks in reading order separated by blank lines.
+
+    Page ranges are extracted across a process pool, and the result is cached by file content
+    in `cache/pages/`, so importing the same PDF again doesn't touch PyMuPDF at all.
+    """
+    import pymupdf
+    src_path = Path(src_path)
+    cache_file = None
+    if use_cache:
+        cache_file = CACHE_PATH / f"{file_hash(src_path)}.json"
+        if cache_file.is_file():
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    cached = json.load(f)
+                if cached.get('version') == EXTRACT_VERSION:
+                    return cached['pages']
+            except (OSError, ValueError):
+                pass
+
+    with pymupdf.open(src_path) as doc:
+        page_count = doc.page_count
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or page_count < MIN_PARALLEL_PAGES:
+        pages = _extract_pages(str(src_path), 0, page_count)
+    else:
+        # A few ranges per worker, so one slow range doesn't hold up the rest
+        step = max(1, -(-page_count // (workers * 4)))
+        ranges = [(s, min(s + step, page_count)) for s in range(0, page_count, step)]
+        pages = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for part in pool.map(_extract_pages, [str(src_path)] * len(ranges), *zip(*ranges)):
+                pages.extend(part)
+
+    if cache_file:
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cache_file.with_suffix('.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'version': EXTRACT_VERSION, 'pages': pages}, f)
+            os.replace(tmp, cache_file)
+        except OSError as e:
+            print(f"Could not cache extracted pages: {e}")
+    return pages
+
+
+def extract_pdf(src_path: os.PathLike, workers: int | None = None, use_cache: bool = True) -> str:
+    # Pages are joined directly, the same way text has always been read from PDFs
+    return "".join(extract_pdf_pages(src_path, workers, use_cache)).strip()
+
+
+def normalize_quotes_regex(text: str) -> str:
+    # The original nested quote rewrite. Kept as the reference normalize_quotes() is checked against.
+    #                      |
+    #                      |   This motherfucker took me goddamn forever,
+    #                      |   (Like literally 5 hours)
+    #                      |
+    #                      V
+    return re.sub(r'((?: |^)"(?=[^"\n]*? "))(?:([^"\n]*?(?: |\'|"))(")([^"\n]*?)(")((?: |\'|")[^"\n]*?))', lambda m: m.group(1) + m.group(2) + "'" + m.group(4) + "'" + m.group(6), text, flags=re.MULTILINE)
+
+
+def _normalize_line(line: str) -> str:
+    # Quote positions are found once, then every candidate opening quote is resolved by looking at the next
+    # two or three quotes. Each position is visited a constant number of times.
+    if line.count('"') < 3:
+        return line
+    quotes = []
+    i = line.find('"')
+    while i != -1:
+        quotes.append(i)
+        i = line.find('"', i + 1)
+    n = len(line)
+    out = []
+    pos = 0
+    k = 0
+    while k < len(quotes) - 2:
+        o = quotes[k]
+        # An opening quote starts the line or follows a space not already used by the previous match
+        if not (o == 0 or (o - 1 >= pos and line[o - 1] == ' ')):
+            k += 1
+            continue
+        q1 = quotes[k + 1]
+        # The next quote has to follow a space inside the quoted text
+        if q1 - 1 <= o or line[q1 - 1] != ' ':
+            k += 1
+            continue
+        match = None
+        # The nested quote is q1, or q1 + 1 when q1 doubles it. Its closing quote is the quote after it,
+        # and has to be followed by a space, apostrophe or quote.
+        for j in (k + 1, k + 2):
+            if j + 1 >= len(quotes) or (j == k + 2 and quotes[j] != q1 + 1):
+                break
+            g3, g5 = quotes[j], quotes[j + 1]
+            if g5 + 1 < n and line[g5 + 1] in ' \'"':
+                match = (j, g3, g5)
+                break
+        if match is None:
+            k += 1
+            continue
+        j, g3, g5 = match
+        out.append(line[pos:g3])
+        out.append("'")
+        out.append(line[g3 + 1:g5])
+        out.append("'")
+        out.append(line[g5 + 1])
+        pos = g5 + 2
+        # The character after the closing quote may itself be a quote, which can't open the next match
+        k = j + 2 if line[g5 + 1] == '"' else j + 1
+        while k < len(quotes) and quotes[k] < pos:
+            k += 1
+    out.append(line[pos:])
+    return ''.join(out)
+
+
+def normalize_quotes(text: str) -> str:
+    """
+    Turns quotes nested inside a quotation into single quotes, line by line. Same output as
+    normalize_quotes_regex(), in time linear in the length of the text.
+    """
+    if '"' not in text:
+        return text
+    return '\n'.join(_normalize_line(line) for line in text.split('\n'))
+
+
+def sanitize(text: str, fix_paragraphs: bool = True) -> str:
+    """
+    Normalizes text for BookNLP and TTS: ASCII only, nested quotes as single quotes, paragraphs separated by blank lines.
+    Pass `fix_paragraphs=False` when paragraphs are already known to be separated by blank lines (EPUB chapters).
+    """
+    text = to_ascii(text)
+    text = normalize_quotes(text)
+    text = text.replace("...", ".").replace("--", ",")
+    if not fix_paragraphs:
+        return text
+    num_content_lines = len(re.findall(r'^...', text, re.MULTILINE))
+    num_double_newlines = len(re.findall(r'\n\n^...', text, re.MULTILINE))
+    ratio = 1
+    try:
+        ratio = num_double_newlines / num_content_lines
+    except:
+        pass
+    if ratio < .9:
+        text = text.replace("\n", "\n\n")
+    return text
+
+
+NON_ASCII = re.compile(r'[^\x00-\x7f]+')
+
+
+def to_ascii(text: str) -> str:
+    # unidecode works character by character but drops to its slow path for a whole string as soon as it has
+    # any non-ASCII character, so only the non-ASCII runs are passed through it
+    return NON_ASCII.sub(lambda m: unidecode.unidecode(m.group()), text)
+
+
+def _sanitize_block(text: str) -> str:
+    # Everything sanitize() does short of paragraph spacing works line by line, so any run of whole lines
+    # can be sanitized on its own
+    text = to_ascii(text)
+    return normalize_quotes(text).replace("...", ".").replace("--", ",")
+
+
+def _needs_double_newlines(lines) -> bool:
+    # Same rule as sanitize(): fewer than 90% of content lines (3+ characters) follow a blank line
+    content = double = 0
+    prev = prev2 = None
+    for line in lines:
+        if line is None:
+            # Break between sample windows
+            prev = prev2 = None
+            continue
+        if len(line) >= 3:
+            content += 1
+            if prev == '' and prev2 is not None:
+                double += 1
+        prev2, prev = prev, line
+    return content > 0 and double / content < .9
+
+
+def _sample_lines(src_path: Path, size: int) -> list:
+    """Sanitized lines from evenly spaced windows of a large file, used to decide paragraph spacing."""
+    window = SANITIZE_SAMPLE_BYTES // SANITIZE_SAMPLE_WINDOWS
+    lines = []
+    with open(src_path, 'rb') as f:
+        for i in range(SANITIZE_SAMPLE_WINDOWS):
+            f.seek((size - window) * i // (SANITIZE_SAMPLE_WINDOWS - 1))
+            part = f.read(window).decode('utf-8', errors='ignore').replace('\r\n', '\n').split('\n')
+            # Windows start and end mid-line, drop the partial lines. None keeps windows from looking contiguous
+            lines.append(None)
+            lines.extend(_sanitize_block('\n'.join(part[1:-1])).split('\n'))
+    return lines
+
+
+def _line_blocks(f, block_size: int = 1 << 20):
+    # Runs of whole lines adding up to about block_size characters
+    lines = []
+    size = 0
+    for line in f:
+        lines.append(line)
+        size += len(line)
+        if size >= block_size:
+            yield ''.join(lines)
+            lines = []
+            size = 0
+    if lines:
+        yield ''.join(lines)
+
+
+def sanitize_file(src_path: os.PathLike, dest_path: os.PathLike) -> dict:
+    """
+    Streaming version of sanitize() for plain text files: sanitizes `src_path` in blocks of whole lines and
+    writes the result to `dest_path`, so memory stays bounded regardless of file size. Paragraph spacing is
+    decided up front from a sample of the file. Files smaller than the sample are just sanitized in memory.
+    """
+    src_path = Path(src_path)
+    size = os.path.getsize(src_path)
+    if size <= SANITIZE_SAMPLE_BYTES:
+        with open(src_path, 'r') as src:
+            text = sanitize(src.read())
+        with open(dest_path, 'w') as dest:
+            dest.write(text)
+        return {'bytes': size, 'sampled': False}
+
+    double = _needs_double_newlines(_sample_lines(src_path, size))
+    with open(src_path, 'r') as src, open(dest_path, 'w') as dest:
+        for block in _line_blocks(src):
+            block = _sanitize_block(block)
+            if double:
+                block = block.replace('\n', '\n\n')
+            dest.write(block)
+    return {'bytes': size, 'sampled': True, 'double_newlines': double}
+
+
+class _XHTMLText(HTMLParser):
+    """Collects the text of an XHTML document, with a blank line between block elements."""
+    BLOCKS = {'p', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'blockquote', 'section', 'article',
+              'tr', 'br', 'hr', 'pre', 'dd', 'dt', 'figcaption'}
+    SKIP = {'script', 'style', 'head', 'title'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.paragraphs = []
+        self.current = []
+        self.skipping = 0
+        self.heading = None
+        self.in_heading = False
+
+    def _flush(self):
+        text = ' '.join(''.join(self.current).split())
+        if text:
+            self.paragraphs.append(text)
+            if self.in_heading and self.heading is None:
+                self.heading = text
+        self.current = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self.skipping += 1
+        elif tag in self.BLOCKS:
+            self._flush()
+            self.in_heading = tag in ('h1', 'h2', 'h3')
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in self.BLOCKS:
+            self._flush()
+            self.in_heading = False
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.current.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+class _NavLinks(HTMLParser):
+    """Collects the (href, text) of every link in a nav document, as leniently as chapters are read."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links = []
+        self.href = None
+        self.text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            self.href = dict(attrs).get('href')
+            self.text = []
+
+    def handle_endtag(self, tag):
+        if tag == 'a' and self.href is not None:
+            self.links.append((self.href, ' '.join(''.join(self.text).split())))
+            self.href = None
+
+    def handle_data(self, data):
+        if self.href is not None:
+            self.text.append(data)
+
+
+def _xml_children(elem, name: str) -> list:
+    # Matches on local names, EPUBs disagree about namespace prefixes
+    return [e for e in elem.iter() if e.tag.rsplit('}', 1)[-1] == name]
+
+
+def _epub_toc(zf: zipfile.ZipFile, opf_dir: str, manifest: dict, spine_elem) -> dict:
+    """Maps chapter paths to titles, from the EPUB 3 nav document or the EPUB 2 NCX."""
+    titles = {}
+    nav = next((item for item in manifest.values() if 'nav' in item['properties'].split()), None)
+    if nav:
+        base = posixpath.dirname(nav['path'])
+        # Read as HTML rather than XML, nav documents often use HTML entities like &nbsp;
+        parser = _NavLinks()
+        parser.feed(zf.read(nav['path']).decode('utf-8', errors='replace'))
+        parser.close()
+        for href, title in parser.links:
+            if href and title:
+                titles.setdefault(posixpath.normpath(posixpath.join(base, unquote(href.split('#')[0]))), title)
+        return titles
+    ncx_id = spine_elem.get('toc')
+    ncx = manifest.get(ncx_id) or next((i for i in manifest.values() if i['media_type'] == 'application/x-dtbncx+xml'), None)
+    if ncx:
+        base = posixpath.dirname(ncx['path'])
+        try:
+            root = ET.fromstring(zf.read(ncx['path']))
+        except ET.ParseError:
+            # Titles fall back to each chapter's first heading
+            return titles
+        for point in _xml_children(root, 'navPoint'):
+            label = next(iter(_xml_children(point, 'text')), None)
+            content = next(iter(_xml_children(point, 'content')), None)
+            if label is not None and content is not None and content.get('src'):
+                title = ' '.join(''.join(label.itertext()).split())
+                titles.setdefault(posixpath.normpath(posixpath.join(base, unquote(content.get('src').split('#')[0]))), title)
+    return titles
+
+
+def extract_epub(src_path: os.PathLike) -> list:
+    """
+    Reads an EPUB's chapters in spine order. Returns a list of dicts with the chapter's `title`
+    (from the table of contents, or its first heading), its `href` inside the EPUB, and its `text`,
+    with paragraphs separated by blank lines. Documents without any text (covers, image pages), the navigation
+    document and non-linear items are skipped.
+    """
+    chapters = []
+    with zipfile.ZipFile(src_path) as zf:
+        container = ET.fromstring(zf.read('META-INF/container.xml'))
+        rootfile = next(iter(_xml_children(container, 'rootfile')), None)
+        if rootfile is None:
+            raise ValueError("EPUB has no package document.")
+        opf_path = rootfile.get('full-path')
+        opf_dir = posixpath.dirname(opf_path)
+        opf = ET.fromstring(zf.read(opf_path))
+
+        manifest = {}
+        for item in _xml_children(opf, 'item'):
+            manifest[item.get('id')] = {
+                'path': posixpath.normpath(posixpath.join(opf_dir, unquote(item.get('href', '')))),
+                'href': item.get('href', ''),
+                'media_type': item.get('media-type', ''),
+                'properties': item.get('properties', ''),
+            }
+        spine = next(iter(_xml_children(opf, 'spine')), None)
+        if spine is None:
+            raise ValueError("EPUB has no spine.")
+        titles = _epub_toc(zf, opf_dir, manifest, spine)
+
+        for itemref in _xml_children(spine, 'itemref'):
+            item = manifest.get(itemref.get('idref'))
+            if not item or 'html' not in item['media_type']:
+                continue
+            # The table of contents and auxiliary content (linear="no", like footnotes) aren't part of the reading order
+            if 'nav' in item['properties'].split() or itemref.get('linear', 'yes').strip().lower() == 'no':
+                continue
+            parser = _XHTMLText()
+            parser.feed(zf.read(item['path']).decode('utf-8', errors='replace'))
+            parser.close()
+            if not parser.paragraphs:
+                continue
+            chapters.append({
+                'title': titles.get(item['path']) or parser.heading or f"Chapter {len(chapters) + 1}",
+                'href': item['href'],
+                'text': '\n\n'.join(parser.paragraphs),
+            })
+    return chapters
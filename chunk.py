@@ -1,129 +1,465 @@
 import json
+import hashlib
+from collections import defaultdict, deque
 import statistics
 from pathlib import Path
 import os
 import csv
+import re
+from threading import Lock
+import numpy as np
 
-def import_data(src_path: os.PathLike) -> tuple:
+# Bump whenever the layout of the cache file changes, or how import_text tokenizes
+CACHE_VERSION = 2
+
+# Length models measure how much speech a token produces. Chunks are capped in these units, so a
+# model closer to actual speech time makes chunk synthesis costs more uniform.
+SYLLABLES_PER_SECOND = 4.5
+SENTENCE_PAUSE = 0.35
+CLAUSE_PAUSE = 0.15
+VOWEL_GROUPS = re.compile(r'[aeiouy]+')
+
+def syllables(word: str) -> int:
+    """Rough English syllable count, at least 1 for anything with letters or digits."""
+    w = word.lower()
+    if not any(c.isalnum() for c in w):
+        return 0
+    if any(c.isdigit() for c in w):
+        # Numbers are read out, a couple of syllables per digit is close enough
+        return 2 * sum(c.isdigit() for c in w)
+    n = len(VOWEL_GROUPS.findall(w))
+    if w.endswith('e') and not w.endswith(('le', 'ee')) and n > 1:
+        n -= 1
+    return max(1, n)
+
+def speech_seconds(word: str) -> float:
+    """Predicted seconds of audio for one token, including the pause punctuation adds."""
+    if word in ('.', '!', '?'):
+        return SENTENCE_PAUSE
+    if word in (',', ';', ':', '-'):
+        return CLAUSE_PAUSE
+    return syllables(word) / SYLLABLES_PER_SECOND
+
+# name -> (length of one token, unit for the stats report). 'tokens' counts BookNLP tokens.
+LENGTH_MODELS = {
+    'tokens': (None, 'words'),
+    'characters': (lambda w: sum(c.isalnum() for c in w), 'chars'),
+    'syllables': (syllables, 'syllables'),
+    'seconds': (speech_seconds, 's'),
+}
+
+class BookData:
+    """
+    Columnar view of BookNLP's book.tokens and book.quotes, holding only the columns the chunker uses.
+    Words are stored as ids into a string table (`vocab`), so each distinct word is kept once.
+    """
+    def __init__(self, paragraph_ids: np.ndarray, sentence_ids: np.ndarray, word_ids: np.ndarray, vocab: list,
+                 quote_starts: np.ndarray, quote_ends: np.ndarray, quote_chars: np.ndarray):
+        self.paragraph_ids = paragraph_ids
+        self.sentence_ids = sentence_ids
+        self.word_ids = word_ids
+        self.vocab = vocab
+        self.quote_starts = quote_starts
+        self.quote_ends = quote_ends
+        self.quote_chars = quote_chars
+        # Prefix sums of token lengths under the current length model, None to count tokens
+        self.cum_lengths = None
+
+    def __len__(self):
+        return len(self.word_ids)
+
+    def set_length_model(self, length_model):
+        """
+        Measures spans with `length_model`, either a name from `LENGTH_MODELS` or a callable that
+        takes a token and returns its length (e.g. a TTS tokenizer's token count).
+        """
+        if isinstance(length_model, str):
+            if length_model not in LENGTH_MODELS:
+                raise ValueError(f"Unknown length model: {length_model}")
+            length_model = LENGTH_MODELS[length_model][0]
+        if length_model is None:
+            self.cum_lengths = None
+            return
+        # Evaluated once per distinct word, then spread over the tokens
+        weights = np.array([length_model(w) for w in self.vocab], dtype=np.float64)
+        self.cum_lengths = np.concatenate(([0.0], np.cumsum(weights[self.word_ids]) if len(self.word_ids) else []))
+
+    def length(self, start: int, end: int):
+        if self.cum_lengths is None:
+            return end - start
+        return float(self.cum_lengths[end] - self.cum_lengths[start])
+
+    def midpoint(self, start: int, end: int) -> int:
+        """Token offset that splits [start, end) into two halves of about equal length."""
+        if self.cum_lengths is None or end - start < 2:
+            return (start + end) // 2
+        half = (self.cum_lengths[start] + self.cum_lengths[end]) / 2
+        mid = int(np.searchsorted(self.cum_lengths, half))
+        return min(max(mid, start + 1), end - 1)
+
+    @staticmethod
+    def from_tsv(tokens_path: os.PathLike, quotes_path: os.PathLike) -> "BookData":
+        def _columns(src: os.PathLike, names: list):
+            with open(src, newline='', encoding='utf-8') as f:
+                reader = csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE)
+                header = next(reader, [])
+                idx = [header.index(n) for n in names]
+                cols = [[] for _ in names]
+                for row in reader:
+                    if not row:
+                        continue
+                    for col, i in zip(cols, idx):
+                        col.append(row[i])
+                return cols
+
+        paragraphs, sentences, words = _columns(tokens_path, ['paragraph_ID', 'sentence_ID', 'word'])
+        starts, ends, chars = _columns(quotes_path, ['quote_start', 'quote_end', 'char_id'])
+
+        # Intern words into a string table
+        lookup = {}
+        word_ids = np.fromiter((lookup.setdefault(w, len(lookup)) for w in words), dtype=np.int32, count=len(words))
+        return BookData(
+            np.array(paragraphs, dtype=np.int32),
+            np.array(sentences, dtype=np.int32),
+            word_ids,
+            list(lookup),
+            np.array(starts, dtype=np.int64),
+            np.array(ends, dtype=np.int64),
+            np.array(chars, dtype=np.int64)
+        )
+
+    def save(self, path: os.PathLike, source: np.ndarray):
+        # Tokens can't contain newlines (they're rows of a TSV), so the string table is stored as one blob
+        vocab = np.frombuffer('\n'.join(self.vocab).encode('utf-8'), dtype=np.uint8)
+        with open(path, 'wb') as f:
+            np.savez(
+                f,
+                version=np.array([CACHE_VERSION]),
+                source=source,
+                paragraph_ids=self.paragraph_ids,
+                sentence_ids=self.sentence_ids,
+                word_ids=self.word_ids,
+                vocab=vocab,
+                quote_starts=self.quote_starts,
+                quote_ends=self.quote_ends,
+                quote_chars=self.quote_chars
+            )
+
+    @staticmethod
+    def from_text(text: str) -> "BookData":
+        """
+        Tokenizes plain text without BookNLP, for single voice books. Paragraphs are separated by blank lines,
+        tokens and sentence ends roughly follow spaCy's, and there are no quotes.
+        """
+        paragraphs = []
+        sentences = []
+        lookup = {}
+        words = []
+        sentence = 0
+        for p, paragraph in enumerate(PARAGRAPH_BREAK.split(text.strip())):
+            ended = False
+            quoted = False
+            for token in _split_tokens(paragraph):
+                # A sentence ends after terminal punctuation and any closing quotes or brackets right after it.
+                # Straight quotes open and close alternately within a paragraph.
+                closing = token in SENTENCE_CLOSERS or (token == '"' and quoted)
+                if token == '"':
+                    quoted = not quoted
+                if ended and not closing:
+                    sentence += 1
+                    ended = False
+                if token in SENTENCE_ENDS:
+                    ended = True
+                paragraphs.append(p)
+                sentences.append(sentence)
+                words.append(lookup.setdefault(token, len(lookup)))
+            sentence += 1
+        empty = np.zeros(0, dtype=np.int64)
+        return BookData(
+            np.array(paragraphs, dtype=np.int32),
+            np.array(sentences, dtype=np.int32),
+            np.array(words, dtype=np.int32),
+            list(lookup),
+            empty, empty, empty
+        )
+
+    @staticmethod
+    def load(path: os.PathLike, source: np.ndarray) -> "BookData | None":
+        """Loads a cache file, or returns None if it's missing, unreadable, or stale."""
+        try:
+            with np.load(path) as f:
+                if int(f['version'][0]) != CACHE_VERSION or not np.array_equal(f['source'], source):
+                    return None
+                vocab = f['vocab'].tobytes().decode('utf-8')
+                return BookData(
+                    f['paragraph_ids'],
+                    f['sentence_ids'],
+                    f['word_ids'],
+                    vocab.split('\n') if vocab or len(f['word_ids']) else [],
+                    f['quote_starts'],
+                    f['quote_ends'],
+                    f['quote_chars']
+                )
+        except (OSError, ValueError, KeyError):
+            return None
+
+PARAGRAPH_BREAK = re.compile(r'\n[ \t]*\n\s*')
+# Abbreviations keep their periods, words and punctuation are separate tokens. A capital letter and a period is only
+# an initial before another initial or a name, and never "I", so "said I. Then" still ends a sentence.
+TOKEN_PATTERN = re.compile(
+    r"(?:[A-Za-z]\.){2,}"
+    r"|(?:Mrs|Mr|Ms|Dr|St|Jr|Sr|Prof|Mt|Lt|Col|Gen|Capt|Sgt|Rev|vs|etc)\."
+    r"|(?!I\.)[A-Z]\.(?=\s*[A-Z](?:[a-z]|\.))"
+    r"|\w+(?:['.\-]\w+)*|[^\w\s]"
+)
+CONTRACTION = re.compile(r"(?i)^(.+?)(n't|'s|'re|'ve|'ll|'d|'m)$")
+SENTENCE_ENDS = {'.', '!', '?'}
+SENTENCE_CLOSERS = {"'", ')', ']', '.', '!', '?'}
+
+
+def _split_tokens(text: str) -> list:
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text):
+        m = CONTRACTION.match(token) if "'" in token else None
+        if m:
+            # Split the way spaCy does: "don't" -> "do", "n't" and "John's" -> "John", "'s"
+            tokens.extend(m.groups())
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def import_text(src_path: os.PathLike) -> BookData:
+    """
+    Tokenizes `text/sanitized.txt` directly, for single voice books that were never run through BookNLP.
+    Cached in `text/sanitized.npz` the same way `import_data` caches BookNLP output.
+    """
+    text_path = Path(src_path) / "text" / "sanitized.txt"
+    cache_path = Path(src_path) / "text" / "sanitized.npz"
+    if not text_path.is_file():
+        raise ValueError(f"Text file {text_path} does not exist or is not a file.")
+    st = text_path.stat()
+    source = np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+    book = BookData.load(cache_path, source)
+    if book is None:
+        with open(text_path, 'r', encoding='utf-8') as f:
+            book = BookData.from_text(f.read())
+        try:
+            book.save(cache_path, source)
+        except OSError as e:
+            print(f"Could not write token cache {cache_path}: {e}")
+    return book
+
+
+def import_data(src_path: os.PathLike) -> BookData:
+    """
+    Loads BookNLP output through a columnar cache (`parsed/book.npz`), which is rebuilt
+    whenever book.tokens or book.quotes change.
+    """
     src_path = Path(src_path) / "parsed"
     quotes_path = src_path / "book.quotes"
     tokens_path = src_path / f"book.tokens"
+    cache_path = src_path / "book.npz"
     if not quotes_path.exists() or not quotes_path.is_file():
         raise ValueError(f"Quotes file {quotes_path} does not exist or is not a file.")
     if not tokens_path.exists() or not tokens_path.is_file():
         raise ValueError(f"Tokens file {tokens_path} does not exist or is not a file.")
-    
-    def _tsv_to_json(src: os.PathLike) -> dict:
-        with open(src, newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f, delimiter='\t', quoting=csv.QUOTE_NONE)
-            return list(reader)
-    
-    qdata = _tsv_to_json(quotes_path)
-    tdata = _tsv_to_json(tokens_path)
 
-    return (tdata, qdata)
+    ts = tokens_path.stat()
+    qs = quotes_path.stat()
+    source = np.array([ts.st_size, ts.st_mtime_ns, qs.st_size, qs.st_mtime_ns], dtype=np.int64)
 
-def prepare_data(tdata: list, qdata: list, scene_names: dict) -> list:
-    data = []
+    book = BookData.load(cache_path, source)
+    if book is None:
+        book = BookData.from_tsv(tokens_path, quotes_path)
+        try:
+            book.save(cache_path, source)
+        except OSError as e:
+            print(f"Could not write token cache {cache_path}: {e}")
+    return book
+
+def prepare_data(book: BookData, scene_names: dict) -> list:
     def _get_char(id: int) -> str:
         a = scene_names.get(id)
         b = scene_names.get(-1)
         return a if a else b if b else 'narrator'
-    paragraph_index = -2
-    sentence_index = -2
-    previous_character = None
-    for i, token in enumerate(tdata):
-        qde = len(qdata) > 0
-        current_character = None
-        if qde and (int(qdata[0]['quote_start']) <= i <= int(qdata[0]['quote_end'])):
-            current_character = _get_char(int(qdata[0]['char_id']))
-        else:
-            current_character = _get_char(-1)
-        if qde and (i == int(qdata[0]['quote_end'])):
-            del qdata [0]
-        if current_character != previous_character:
-            data.append({'character':current_character,'paragraphs':[[[]]]})
-            paragraph_index = token['paragraph_ID']
-            sentence_index = token['sentence_ID']
-        if paragraph_index != token['paragraph_ID']:
-            data[-1]['paragraphs'].append([[]])
-            sentence_index = token['sentence_ID']
-        if sentence_index != token['sentence_ID']:
-            data[-1]['paragraphs'][-1].append([])
-        data[-1]['paragraphs'][-1][-1].append(token['word'])
-        previous_character = current_character
-        paragraph_index = token['paragraph_ID']
-        sentence_index = token['sentence_ID']
+    n = len(book)
+    if n == 0:
+        return []
+
+    # Resolve every token's speaker as an index into `names`. Quotes are painted latest-start first,
+    # so where quotes overlap the earliest-starting one wins. Overlapping or out-of-order quotes are fine.
+    names = [_get_char(-1)]
+    name_index = {names[0]: 0}
+    speakers = np.zeros(n, dtype=np.int32)
+    order = np.lexsort((book.quote_ends, book.quote_starts))[::-1]
+    for q in order:
+        name = _get_char(int(book.quote_chars[q]))
+        if name not in name_index:
+            name_index[name] = len(names)
+            names.append(name)
+        speakers[max(0, book.quote_starts[q]):max(0, book.quote_ends[q] + 1)] = name_index[name]
+
+    # A new segment starts wherever the speaker changes, a new paragraph wherever the paragraph
+    # changes or a segment starts, and likewise for sentences.
+    def _changes(a: np.ndarray) -> np.ndarray:
+        c = np.empty(n, dtype=bool)
+        c[0] = True
+        np.not_equal(a[1:], a[:-1], out=c[1:])
+        return c
+    segment_starts = _changes(speakers)
+    paragraph_starts = segment_starts | _changes(book.paragraph_ids)
+    sentence_starts = paragraph_starts | _changes(book.sentence_ids)
+
+    bounds = np.flatnonzero(sentence_starts).tolist() + [n]
+    new_segment = segment_starts[bounds[:-1]].tolist()
+    new_paragraph = paragraph_starts[bounds[:-1]].tolist()
+    speaker_at = speakers[bounds[:-1]].tolist()
+
+    # Paragraphs are lists of sentence boundary offsets into `book`: [start, ..., end]
+    data = []
+    for s in range(len(bounds) - 1):
+        if new_segment[s]:
+            data.append({'character': names[speaker_at[s]], 'paragraphs': []})
+        if new_paragraph[s]:
+            data[-1]['paragraphs'].append([bounds[s]])
+        data[-1]['paragraphs'][-1].append(bounds[s + 1])
 
     return data
 
 class Chunk:
-    def __init__(self, data: list):
-        self.sentences = data
-        self.word_count = sum(len(sentence) for sentence in self.sentences)
-    
+    """
+    A run of whole sentences, stored as token offsets into the shared `BookData` rather than as words.
+    `bounds` holds the offset each sentence starts at, followed by the chunk's end offset, so merging
+    and splitting only touch the sentence offsets. Text is only materialized by `tokens()`.
+
+    `word_count` is the number of tokens, `length` is the size under the book's length model.
+    """
+    __slots__ = ('book', 'bounds', 'word_count', 'length')
+
+    def __init__(self, book: BookData, bounds: list):
+        self.book = book
+        self.bounds = bounds
+        self.word_count = bounds[-1] - bounds[0]
+        self.length = book.length(bounds[0], bounds[-1])
+
+    @property
+    def start(self) -> int:
+        return self.bounds[0]
+
+    @property
+    def end(self) -> int:
+        return self.bounds[-1]
+
     def split(self):
-        if len(self.sentences) == 1:
-            sentence = self.sentences[0]
-            mid = len(sentence) // 2
+        b = self.bounds
+        if len(b) == 2:
+            mid = self.book.midpoint(b[0], b[1])
             return (
-                Chunk([sentence[:mid]]),
-                Chunk([sentence[mid:]])
+                Chunk(self.book, [b[0], mid]),
+                Chunk(self.book, [mid, b[1]])
             )
 
-        mid = self.word_count // 2
-        c = 0
-        for i in range(len(self.sentences)):
-            next_c = c + len(self.sentences[i])
+        mid = self.length // 2 if isinstance(self.length, int) else self.length / 2
+        for i in range(len(b) - 1):
+            c = self.book.length(b[0], b[i])
+            next_c = self.book.length(b[0], b[i + 1])
             if next_c >= mid:
                 # Decide whether to split before or after this sentence
                 if mid - c < next_c - mid:
                     return (
-                        Chunk(self.sentences[:i]),
-                        Chunk(self.sentences[i:])
+                        Chunk(self.book, b[:i+1]),
+                        Chunk(self.book, b[i:])
                     )
                 else:
                     return (
-                        Chunk(self.sentences[:i+1]),
-                        Chunk(self.sentences[i+1:])
+                        Chunk(self.book, b[:i+2]),
+                        Chunk(self.book, b[i+1:])
                     )
-            c = next_c
 
         # If we reach here, fallback (shouldn't usually happen)
-        return (Chunk([]), self)
+        return (Chunk(self.book, b[:1]), self)
 
+    def tokens(self) -> list:
+        vocab = self.book.vocab
+        return [vocab[w] for w in self.book.word_ids[self.start:self.end].tolist()]
 
     def to_dict(self):
-        return self.sentences
-    
+        vocab = self.book.vocab
+        ids = self.book.word_ids
+        return [[vocab[w] for w in ids[a:z].tolist()] for a, z in zip(self.bounds, self.bounds[1:])]
+
     def __add__(self, other):
+        # Chunks are only ever merged with their neighbour, so the result is still contiguous
         if isinstance(other, Chunk):
-            return Chunk(self.sentences + other.sentences)
+            return Chunk(self.book, self.bounds + other.bounds[1:])
         return NotImplemented
     
     def __eq__(self, other):
         if isinstance(other, Chunk):
-            return self.word_count == other.word_count
+            return self.length == other.length
         elif other is int:
-            return self.word_count == other
+            return self.length == other
         return NotImplemented
     
     def __lt__(self, other):
         if isinstance(other, Chunk):
-            return self.word_count < other.word_count
+            return self.length < other.length
         elif other is int:
-            return self.word_count < other
+            return self.length < other
         return NotImplemented
     
     def __gt__(self, other):
         if isinstance(other, Chunk):
-            return self.word_count > other.word_count
+            return self.length > other.length
         elif other is int:
-            return self.word_count > other
+            return self.length > other
         return NotImplemented
 
-def export_chunks(charchunks: list, dest_path: os.PathLike):
+def export_chunks(charchunks: list, dest_path: os.PathLike, chapter_starts: list | None = None):
+    tr = chunk_entries(charchunks)
+    if chapter_starts:
+        tag_chapters(tr, chapter_starts)
+    write_chunks(tr, dest_path)
+    return tr
 
+def chapter_token_starts(src_path: os.PathLike, parsed: bool, book: "BookData | None" = None) -> list | None:
+    """
+    The token each chapter in `text/chapters.json` starts at, counted in the tokens the book is chunked from:
+    BookNLP's if `parsed`, otherwise `import_text`'s (`book`, if it's already loaded). None if the book has no chapters.
+    """
+    src_path = Path(src_path)
+    chapters_path = src_path / "text" / "chapters.json"
+    if not chapters_path.is_file():
+        return None
+    with open(chapters_path, 'r', encoding='utf-8') as f:
+        starts = [c['start'] for c in json.load(f)]
+    if parsed:
+        with open(src_path / "parsed" / "book.tokens", newline='', encoding='utf-8') as f:
+            reader = csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE)
+            col = next(reader, []).index('byte_onset')
+            onsets = np.array([int(row[col]) for row in reader if row], dtype=np.int64)
+        return np.searchsorted(onsets, starts).tolist()
+    # Chapters start on paragraphs, which BookData.from_text numbers in the order they're split
+    with open(src_path / "text" / "sanitized.txt", 'r', encoding='utf-8') as f:
+        text = f.read()
+    lead = len(text) - len(text.lstrip())
+    paragraph_starts = [lead] + [lead + m.end() for m in PARAGRAPH_BREAK.finditer(text.strip())]
+    paragraphs = np.maximum(np.searchsorted(paragraph_starts, starts, side='right') - 1, 0)
+    book = book or import_text(src_path)
+    return np.searchsorted(book.paragraph_ids, paragraphs).tolist()
+
+def tag_chapters(entries: list, chapter_starts: list):
+    # Each chunk gets the index of the chapter it starts in, for exports with chapter marks
+    for entry in entries:
+        entry['chapter'] = max(int(np.searchsorted(chapter_starts, entry['start'], side='right')) - 1, 0)
+
+def chunk_entries(charchunks: list, offset: int = 0) -> list:
+    """
+    Turns chunked segments into the entries written to `chunks.jsonl`. `offset` is added to every
+    token span, for chunks of a window of the book rather than the whole of it.
+    """
     NO_SPACE_AFTER = ['#', '$', '(', '@', '[', '\\', '^', '{', '-', '/', '<', '*']
     NO_SPACE_BEFORE = ['!', ')', ',', '-', '/', '.', ':', ';', '@', '\\', ']', '}', '?', '>', '*']
 
@@ -141,18 +477,409 @@ def export_chunks(charchunks: list, dest_path: os.PathLike):
     tr = []
     for character in charchunks:
         for chunk in character['chunks']:
-            chunk = chunk.to_dict()
-            al = [item for sublist in chunk for item in sublist]
-            ta = combine(al)
+            ta = combine(chunk.tokens())
             if ta == "\" \"":
                 continue
-            tr.append({'character': character['character'], 'text': ta})
-        
+            start, end = chunk.start + offset, chunk.end + offset
+            tr.append({
+                'id': chunk_id(character['character'], start, end, ta),
+                'character': character['character'],
+                'text': ta,
+                'start': start,
+                'end': end
+            })
+    return tr
+
+def write_chunks(chunks: list, dest_path: os.PathLike):
+    """
+    Writes `chunks.jsonl`, one chunk per line, and `chunks.idx`, the byte offset of every line
+    followed by the file size as little-endian uint64s. Together they let `ChunkReader` seek
+    straight to any chunk without parsing the rest.
+    """
+    dest_path = Path(dest_path)
+    offsets = [0]
+    tmp = dest_path / 'chunks.jsonl.tmp'
+    with open(tmp, 'wb') as f:
+        for c in chunks:
+            line = (json.dumps(c, ensure_ascii=True) + '\n').encode('ascii')
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+    tmp_idx = dest_path / 'chunks.idx.tmp'
+    np.array(offsets, dtype='<u8').tofile(tmp_idx)
+    os.replace(tmp, dest_path / 'chunks.jsonl')
+    os.replace(tmp_idx, dest_path / 'chunks.idx')
+
+class ChunkReader:
+    """
+    Random access to a book's chunks without loading all of them.
+
+    Reads `chunks.jsonl` through its offset index, so any chunk or range of chunks costs one seek.
+    Books chunked before that format existed only have `chunks.json`, which is loaded whole instead.
+    Safe to share between threads.
+    """
+    def __init__(self, text_path: os.PathLike):
+        text_path = Path(text_path)
+        jsonl_path = text_path / 'chunks.jsonl'
+        json_path = text_path / 'chunks.json'
+        self.lock = Lock()
+        self.file = None
+        self.chunks = None
+        if jsonl_path.is_file():
+            self.file = open(jsonl_path, 'rb')
+            self.offsets = self._load_index(text_path / 'chunks.idx', os.fstat(self.file.fileno()).st_size)
+        elif json_path.is_file():
+            with open(json_path, 'r', encoding='utf-8') as f:
+                self.chunks = json.load(f)
+        else:
+            raise ValueError('Chunks file does not exist. Please generate it first.')
+
+    def _load_index(self, idx_path: Path, size: int) -> list:
+        if idx_path.is_file():
+            offsets = np.fromfile(idx_path, dtype='<u8').tolist()
+            if offsets and offsets[0] == 0 and offsets[-1] == size:
+                return offsets
+        # Missing or out of date, rebuild it from the line breaks
+        offsets = [0]
+        self.file.seek(0)
+        for line in self.file:
+            offsets.append(offsets[-1] + len(line))
+        return offsets
+
+    @staticmethod
+    def exists(text_path: os.PathLike) -> bool:
+        text_path = Path(text_path)
+        return (text_path / 'chunks.jsonl').is_file() or (text_path / 'chunks.json').is_file()
+
+    def __len__(self):
+        return len(self.chunks) if self.chunks is not None else len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> dict:
+        if self.chunks is not None:
+            return self.chunks[index]
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        with self.lock:
+            self.file.seek(self.offsets[index])
+            return json.loads(self.file.read(self.offsets[index + 1] - self.offsets[index]))
+
+    def range(self, start: int, stop: int):
+        """Yields chunks start..stop-1, reading only that part of the file."""
+        stop = min(stop, len(self))
+        if self.chunks is not None:
+            yield from self.chunks[start:stop]
+            return
+        if start >= stop:
+            return
+        with self.lock:
+            self.file.seek(self.offsets[start])
+            data = self.file.read(self.offsets[stop] - self.offsets[start])
+        for line in data.splitlines():
+            yield json.loads(line)
+
+    def items(self, indices):
+        """Yields (index, chunk) for the given indices in ascending order, reading each run of consecutive ones at once."""
+        indices = sorted(set(indices))
+        i = 0
+        while i < len(indices):
+            # Runs are capped like __iter__'s blocks, so memory stays bounded
+            j = i + 1
+            while j < len(indices) and indices[j] == indices[j - 1] + 1 and j - i < 1000:
+                j += 1
+            yield from zip(indices[i:j], self.range(indices[i], indices[j - 1] + 1))
+            i = j
+
+    def __iter__(self):
+        # In blocks, so memory stays bounded on long books
+        for start in range(0, len(self), 1000):
+            yield from self.range(start, start + 1000)
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
 
-    with open(os.path.join(dest_path, 'chunks.json'), 'w', encoding='utf-8') as f:
-        json.dump(tr, f, ensure_ascii=True, indent=2)
+    def __exit__(self, *args):
+        self.close()
 
-def generate_chunks(src_path: os.PathLike, scene_names: dict, multivoice: bool = True, min_length: int = 5, max_length: int = 100, passes: int = 8):
+def chunk_id(character: str, start: int, end: int, text: str) -> str:
+    """
+    Stable id for a chunk. Anything that would change its audio (the token span, the voice, or the text)
+    changes the id, so a chunk keeps its id across re-chunking only if its audio can be reused.
+    """
+    return hashlib.sha1(f"{start}:{end}:{character}:{text}".encode('utf-8')).hexdigest()[:16]
+
+def diff_chunks(old: list, new: list) -> dict:
+    """
+    Compares two chunk lists by id. Returns which new indices can reuse audio from which old
+    indices ('kept', as [old, new] pairs), which new indices need synthesizing ('added'),
+    and which old indices are no longer used ('removed').
+    """
+    old_index = {c['id']: i for i, c in enumerate(old) if 'id' in c}
+    kept = []
+    unmatched = []
+    for i, c in enumerate(new):
+        j = old_index.pop(c['id'], None)
+        if j is None:
+            unmatched.append(i)
+        else:
+            kept.append([j, i])
+    # Ids include token offsets, so an edit to the text changes the id of every chunk after it.
+    # Those chunks still read the same, so what's left is matched up by voice and text, in order.
+    by_text = defaultdict(deque)
+    for j in sorted(old_index.values()):
+        by_text[(old[j].get('character'), old[j].get('text'))].append(j)
+    added = []
+    for i in unmatched:
+        same = by_text.get((new[i]['character'], new[i]['text']))
+        if same:
+            j = same.popleft()
+            del old_index[old[j]['id']]
+            kept.append([j, i])
+        else:
+            added.append(i)
+    kept.sort(key=lambda pair: pair[1])
+    return {'kept': kept, 'added': added, 'removed': sorted(old_index.values())}
+
+# Written before chunk audio is moved, so an interrupted realign can be finished rather than leave audio under
+# names nothing looks for
+REALIGN_JOURNAL = '.realign.json'
+
+def _write_journal(path: Path, state: dict):
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+def realign_audio(plan: dict, audio_path: os.PathLike):
+    """
+    Renames existing chunk audio from old to new indices according to a `diff_chunks` plan.
+    Audio for removed chunks is moved to `audio/stale/` rather than deleted.
+    """
+    audio_path = Path(audio_path)
+    if not audio_path.is_dir():
+        return
+    # An earlier realign has to finish first, the plan was made against the chunks it realigned to
+    recover_realign(audio_path)
+    _write_journal(audio_path / REALIGN_JOURNAL, {'kept': plan['kept'], 'phase': 'aside'})
+    _resume_realign(audio_path)
+
+def recover_realign(audio_path: os.PathLike) -> bool:
+    """Finishes a realign that was interrupted. Returns True if there was one."""
+    audio_path = Path(audio_path)
+    if not (audio_path / REALIGN_JOURNAL).is_file():
+        return False
+    print(f"Finishing an interrupted audio realign in {audio_path}")
+    _resume_realign(audio_path)
+    return True
+
+def _resume_realign(audio_path: Path):
+    journal = audio_path / REALIGN_JOURNAL
+    with open(journal, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    if state['phase'] == 'aside':
+        # Move everything aside first so renames can't collide with files that haven't moved yet.
+        # Until that's done every chunk_*.wav still has its old index.
+        for f in audio_path.glob('chunk_*.wav'):
+            os.replace(f, f.with_name('.' + f.name + '.realign'))
+        state['phase'] = 'placing'
+        _write_journal(journal, state)
+    # From here on chunk_*.wav files are already at their new index, and hidden ones still have their old one
+    kept = {old: new for old, new in state['kept']}
+    for tmp in audio_path.glob('.chunk_*.wav.realign'):
+        old = int(tmp.name[len('.chunk_'):].split('.')[0])
+        if old in kept:
+            os.replace(tmp, audio_path / f"chunk_{kept[old]:05d}.wav")
+        else:
+            stale = audio_path / 'stale'
+            stale.mkdir(exist_ok=True)
+            os.replace(tmp, stale / f"chunk_{old:05d}.wav")
+    journal.unlink()
+
+def heuristic_chunks(book: BookData, paragraphs: list, min_length: int, max_length: int, passes: int = 8) -> list:
+    """
+    Initialize chunks as one per paragraph. Then, loop over each chunk and if it's oversize, split it.
+    If it's undersize, choose the smallest neighbor, and merge into it.
+    """
+    chunks = []
+    for j in paragraphs:
+        chunks.append(Chunk(book, j))
+
+    for passcount in range(passes):
+        new_chunks = []
+        for chunk in chunks:
+            if chunk.length > max_length:
+                a, b = chunk.split()
+                new_chunks.append(a)
+                new_chunks.append(b)
+            else:
+                new_chunks.append(chunk)
+        chunks = new_chunks
+        del new_chunks
+
+        if len(chunks) >= 2 and chunks[0].length < min_length:
+            chunks[1] = chunks[0] + chunks[1]
+            del chunks[0]
+
+        if len(chunks) >= 2 and chunks[-1].length < min_length:
+            chunks[-2] = chunks[-2] + chunks[-1]
+            del chunks[-1]
+
+        if len(chunks) >= 3:
+            c = 1
+            while c < len(chunks) - 1:
+                if chunks[c].length < min_length:
+                    c1l = chunks[c - 1].length
+                    c2l = chunks[c + 1].length
+                    if c1l < c2l:
+                        chunks[c - 1] = chunks[c - 1] + chunks[c]
+                        del chunks[c]
+                    else:
+                        chunks[c + 1] = chunks[c] + chunks[c + 1]
+                        del chunks[c]
+                else:
+                    c += 1
+    new_chunks = []
+    for chunk in chunks:
+        if chunk.length > max_length:
+            a, b = chunk.split()
+            new_chunks.append(a)
+            new_chunks.append(b)
+        else:
+            new_chunks.append(chunk)
+    return new_chunks
+
+# Costs for optimal_chunks. A chunk costs its squared relative deviation from the target length,
+# so anything between 0 and twice the target costs at most 1 and these penalties dominate.
+UNDERSIZE_PENALTY = 10.0
+OVERSIZE_PENALTY = 100.0
+# Cutting inside a paragraph rather than between paragraphs
+MID_PARAGRAPH_PENALTY = 0.1
+
+def optimal_chunks(book: BookData, paragraphs: list, min_length: int, max_length: int, target_length: int | None = None) -> list:
+    """
+    Cuts a run of paragraphs at sentence boundaries so the total cost of the resulting chunks is minimal.
+
+    Sentences longer than `max_length` are first halved until they fit, like `Chunk.split` does. Since
+    a chunk can't grow past `max_length`, each sentence only has to consider the few sentences before
+    it as a chunk start, which makes this linear in the number of sentences.
+    """
+    target = target_length or max(min_length, max_length * 0.75)
+
+    # Units are sentences (halved where needed), as token offsets. Note which ones start a paragraph.
+    starts = []
+    ends = []
+    paragraph_start = []
+    for p in paragraphs:
+        first = True
+        for a, z in zip(p, p[1:]):
+            pending = [(a, z)]
+            while pending:
+                a, z = pending.pop()
+                if book.length(a, z) > max_length and z - a > 1:
+                    mid = book.midpoint(a, z)
+                    pending.append((mid, z))
+                    pending.append((a, mid))
+                    continue
+                starts.append(a)
+                ends.append(z)
+                paragraph_start.append(first)
+                first = False
+    # Unit lengths as prefix sums, so any run of units is measured in O(1)
+    prefix = [0]
+    for a, z in zip(starts, ends):
+        prefix.append(prefix[-1] + book.length(a, z))
+
+    def _cost(length: int) -> float:
+        c = ((length - target) / target) ** 2
+        if length < min_length:
+            c += UNDERSIZE_PENALTY
+        if length > max_length:
+            c += OVERSIZE_PENALTY
+        return c
+
+    m = len(starts)
+    # best[j] is the cheapest way to chunk the first j units, with the last chunk starting at back[j]
+    best = [0.0] + [float('inf')] * m
+    back = [0] * (m + 1)
+    for j in range(1, m + 1):
+        for i in range(j - 1, -1, -1):
+            length = prefix[j] - prefix[i]
+            if length > max_length and i < j - 1:
+                break
+            cost = best[i] + _cost(length)
+            if i > 0 and not paragraph_start[i]:
+                cost += MID_PARAGRAPH_PENALTY
+            if cost < best[j]:
+                best[j] = cost
+                back[j] = i
+
+    chunks = []
+    j = m
+    while j > 0:
+        i = back[j]
+        chunks.append(Chunk(book, starts[i:j] + [ends[j - 1]]))
+        j = i
+    chunks.reverse()
+    return chunks
+
+def fold_attributions(book: BookData, data: list, narrator: str, threshold: float) -> tuple:
+    """
+    Folds short narrator fragments between dialogue (like `she said` in `"Fine," she said, "let's go."`)
+    into the neighbouring dialogue, so the line is one chunk in one voice instead of three.
+
+    A fragment shorter than `threshold` joins the dialogue on both sides if they're the same speaker,
+    otherwise the dialogue before it, otherwise the dialogue after it. Only dialogue in the same
+    paragraph counts, so short lines of narration between paragraphs of dialogue keep the narrator.
+    Returns the new segments and the number of fragments folded.
+    """
+    def _length(seg: dict):
+        return book.length(seg['paragraphs'][0][0], seg['paragraphs'][-1][-1])
+
+    def _join(a: dict, b: dict, character: str) -> dict:
+        pa = [list(p) for p in a['paragraphs']]
+        pb = [list(p) for p in b['paragraphs']]
+        # Segments split on speaker changes, so the join may fall inside a paragraph or even a sentence
+        t = pb[0][0]
+        if book.paragraph_ids[t] == book.paragraph_ids[t - 1]:
+            head = pa[-1][:-1] if book.sentence_ids[t] == book.sentence_ids[t - 1] else pa[-1]
+            pa[-1] = head + pb[0][1:]
+            pb = pb[1:]
+        return {'character': character, 'paragraphs': pa + pb}
+
+    def _same_paragraph(t: int) -> bool:
+        return 0 < t < len(book) and book.paragraph_ids[t] == book.paragraph_ids[t - 1]
+
+    out = []
+    folded = 0
+    i = 0
+    while i < len(data):
+        seg = data[i]
+        if seg['character'] == narrator and _length(seg) < threshold:
+            prev = out[-1] if out and out[-1]['character'] != narrator and _same_paragraph(seg['paragraphs'][0][0]) else None
+            nxt = data[i + 1] if i + 1 < len(data) and data[i + 1]['character'] != narrator and _same_paragraph(seg['paragraphs'][-1][-1]) else None
+            if prev and nxt and prev['character'] == nxt['character']:
+                out[-1] = _join(_join(prev, seg, prev['character']), nxt, prev['character'])
+                folded += 1
+                i += 2
+                continue
+            if prev:
+                out[-1] = _join(prev, seg, prev['character'])
+                folded += 1
+                i += 1
+                continue
+            if nxt:
+                out.append(_join(seg, nxt, nxt['character']))
+                folded += 1
+                i += 2
+                continue
+        out.append(seg)
+        i += 1
+    return (out, folded)
+
+def generate_chunks(src_path: os.PathLike, scene_names: dict, multivoice: bool = True, min_length: float = 5, max_length: float = 100, passes: int = 8, algorithm: str = 'heuristic', target_length: float | None = None, length_model = 'tokens', attribution_threshold: float | None = None):
     """
     Having more context in the TTS prompt usually improves quality, but after around 100 words, it only degrades quality.
 
@@ -161,13 +888,51 @@ def generate_chunks(src_path: os.PathLike, scene_names: dict, multivoice: bool =
     This function is meant to split text into chunks with the most context possible without sacrificing quality.
 
     "Words" in this function, are just tokens like actual words, punctuation, etc.
+
+    `algorithm` is either 'heuristic' (repeated split/merge passes, see `heuristic_chunks`) or 'optimal'
+    (minimum-cost segmentation around `target_length`, see `optimal_chunks`).
+
+    `length_model` decides what the lengths are measured in, see `LENGTH_MODELS` and `BookData.set_length_model`.
+    With 'seconds', `min_length` and `max_length` are predicted seconds of speech rather than tokens.
+
+    If `attribution_threshold` is set, narrator fragments shorter than it are read by the surrounding
+    dialogue's voice instead, see `fold_attributions`.
     """
 
+    if algorithm not in ('heuristic', 'optimal'):
+        raise ValueError(f"Unknown chunking algorithm: {algorithm}")
     if not multivoice:
         scene_names = {}
     charchunks = []
-    tdata, qdata = import_data(src_path)
-    data = prepare_data(tdata, qdata, scene_names)
+    parsed = multivoice
+    if not parsed:
+        # Single voice books don't need BookNLP, the text is tokenized directly. Any parsed/ output is ignored,
+        # it can be from an earlier import of different text under the same title.
+        book = import_text(src_path)
+    else:
+        book = import_data(src_path)
+    book.set_length_model(length_model)
+    unit = LENGTH_MODELS[length_model][1] if isinstance(length_model, str) else 'units'
+    data = prepare_data(book, scene_names)
+
+    def _segment(paragraphs: list) -> list:
+        if algorithm == 'optimal':
+            return optimal_chunks(book, paragraphs, min_length, max_length, target_length)
+        return heuristic_chunks(book, paragraphs, min_length, max_length, passes)
+
+    folded = None
+    joined = set()
+    if attribution_threshold and multivoice:
+        narrator = scene_names.get(-1) or 'narrator'
+        unfolded = data
+        data, folded = fold_attributions(book, data, narrator, attribution_threshold)
+        # Segments folding left alone are passed through as they are and chunk the same either way, so only
+        # the ones it replaced are chunked unfolded, to report what folding saved
+        kept = {id(seg) for seg in data}
+        replaced_chunks = sum(len(_segment(seg['paragraphs'])) for seg in unfolded if id(seg) not in kept)
+        joined = kept - {id(seg) for seg in unfolded}
+        joined_chunks = 0
+        unfolded_switches = len(unfolded) - 1
 
     # Stats trackers
     total_chunks = 0
@@ -176,76 +941,31 @@ def generate_chunks(src_path: os.PathLike, scene_names: dict, multivoice: bool =
     undersize_chunks = 0
     chunk_lengths = []
     chunks_per_character = []
+    # Predicted speech per chunk, whatever the length model, to show how even chunk costs are
+    chunk_seconds = []
+    speech_cum = np.concatenate(([0.0], np.cumsum(np.array([speech_seconds(w) for w in book.vocab], dtype=np.float64)[book.word_ids])))
 
-    # Initialize chunks as one per paragraph. Then, loop over each chunk and if it's oversize, split it.
-    # If it's undersize, choose the smallest neighbor, and merge into it. Only do this within contiguous
-    # regions of text spoken by the same character/narrator.
-
+    # Chunks never cross contiguous regions of text spoken by the same character/narrator.
     for i in data:
         charchunks.append({'character': i['character'], 'chunks': []})
-        chunks = []
-        for j in i['paragraphs']:
-            chunks.append(Chunk(j))
-
-        for passcount in range(passes):
-            new_chunks = []
-            for chunk in chunks:
-                if chunk.word_count > max_length:
-                    a, b = chunk.split()
-                    new_chunks.append(a)
-                    new_chunks.append(b)
-                else:
-                    new_chunks.append(chunk)
-            chunks = new_chunks
-            del new_chunks
-
-            if len(chunks) >= 2 and chunks[0].word_count < min_length:
-                chunks[1] = chunks[0] + chunks[1]
-                del chunks[0]
-
-            if len(chunks) >= 2 and chunks[-1].word_count < min_length:
-                chunks[-2] = chunks[-2] + chunks[-1]
-                del chunks[-1]
-
-            if len(chunks) >= 3:
-                c = 1
-                while c < len(chunks) - 1:
-                    if chunks[c].word_count < min_length:
-                        c1l = chunks[c - 1].word_count
-                        c2l = chunks[c + 1].word_count
-                        if c1l < c2l:
-                            chunks[c - 1] = chunks[c - 1] + chunks[c]
-                            del chunks[c]
-                        else:
-                            chunks[c + 1] = chunks[c] + chunks[c + 1]
-                            del chunks[c]
-                    else:
-                        c += 1
-        new_chunks = []
-        for chunk in chunks:
-            if chunk.word_count > max_length:
-                a, b = chunk.split()
-                new_chunks.append(a)
-                new_chunks.append(b)
-            else:
-                new_chunks.append(chunk)
-        chunks = new_chunks
-        del new_chunks
-
+        chunks = _segment(i['paragraphs'])
 
         charchunks[-1]['chunks'] = chunks
+        if id(i) in joined:
+            joined_chunks += len(chunks)
 
         # Per-character stats
         chunks_per_character.append(len(chunks))
         for chunk in chunks:
-            wc = chunk.word_count
+            wc = chunk.length
             chunk_lengths.append(wc)
-            total_words += wc
+            total_words += chunk.word_count
             total_chunks += 1
             if wc > max_length:
                 oversize_chunks += 1
             elif wc < min_length:
                 undersize_chunks += 1
+            chunk_seconds.append(float(speech_cum[chunk.end] - speech_cum[chunk.start]))
 
     # # Save result
     # with open('fres.json', 'w', encoding='utf-8') as f:
@@ -265,15 +985,38 @@ def generate_chunks(src_path: os.PathLike, scene_names: dict, multivoice: bool =
     print(f"    Characters processed:           {len(charchunks)}")
     print(f"    Total chunks:                   {total_chunks}")
     print(f"    Total words:                    {total_words}")
+    print(f"    Length model:                   {length_model if isinstance(length_model, str) else 'custom'}")
     print(f"    Oversize chunks (> {max_length}):        {oversize_chunks}")
     print(f"    Undersize chunks (< {min_length}):         {undersize_chunks}")
     if chunk_lengths:
-        print(f"    Average chunk length:           {statistics.mean(chunk_lengths):.2f} words")
-        print(f"    Median chunk length:            {statistics.median(chunk_lengths):.2f} words")
-        print(f"    Minimum chunk length:           {min(chunk_lengths)} words")
-        print(f"    Maximum chunk length:           {max(chunk_lengths)} words")
+        _fmt = lambda x: f"{x}" if isinstance(x, int) else f"{x:.2f}"
+        print(f"    Average chunk length:           {statistics.mean(chunk_lengths):.2f} {unit}")
+        print(f"    Median chunk length:            {statistics.median(chunk_lengths):.2f} {unit}")
+        print(f"    Minimum chunk length:           {_fmt(min(chunk_lengths))} {unit}")
+        print(f"    Maximum chunk length:           {_fmt(max(chunk_lengths))} {unit}")
+    if len(chunk_seconds) > 1:
+        print(f"    Est. speech per chunk:          {statistics.mean(chunk_seconds):.2f}s (stdev {statistics.stdev(chunk_seconds):.2f}s)")
     print(f"    Average chunks per character:   {statistics.mean(chunks_per_character):.2f}")
     print(f"    Characters with 1 chunk:        {sum(1 for x in chunks_per_character if x == 1)}")
     print(f"    Characters with >10 chunks:     {sum(1 for x in chunks_per_character if x > 10)}")
+    if folded is not None:
+        print(f"    Attributions folded (< {attribution_threshold}):   {folded}")
+        print(f"    Chunks saved by folding:        {replaced_chunks - joined_chunks}")
+        print(f"    Voice switches saved:           {unfolded_switches - (len(data) - 1)}")
     print("\n===================================================\n")
-    export_chunks(charchunks,src_path / 'text')
+
+    # Keep any audio that's already been generated lined up with the new chunk indices
+    src_path = Path(src_path)
+    previous = []
+    if ChunkReader.exists(src_path / 'text'):
+        with ChunkReader(src_path / 'text') as reader:
+            previous = list(reader)
+    tr = export_chunks(charchunks,src_path / 'text', chapter_token_starts(src_path, parsed, book))
+    if previous and not all('id' in c for c in previous):
+        print("Previous chunks have no ids, existing audio was left as is.")
+    elif previous:
+        plan = diff_chunks(previous, tr)
+        with open(src_path / 'text' / 'chunk_plan.json', 'w', encoding='utf-8') as f:
+            json.dump(plan, f)
+        realign_audio(plan, src_path / 'audio')
+        print(f"Re-chunked: {len(plan['kept'])} chunks kept, {len(plan['added'])} added, {len(plan['removed'])} removed.")
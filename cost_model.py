@@ -0,0 +1,264 @@
+import argparse
+import json
+import os
+import re
+from pathlib import Path
+from threading import Lock
+from chunk import ChunkReader
+
+# Chatterbox renders at 24kHz and chunks are saved as float32 WAVs with 0.2s of trailing silence.
+# These are duplicated here so estimates can be made without importing torch or loading the model.
+SAMPLE_RATE = 24000
+BYTES_PER_SAMPLE = 4
+TRAILING_SILENCE = 0.2
+WAV_HEADER_BYTES = 80
+
+DEFAULT_PATH = Path('cost_model.json')
+# Version of the audio fits. Older ones were fitted on audio including the trailing silence, and are dropped
+AUDIO_MODEL_VERSION = 2
+
+PAUSE_PATTERN = re.compile(r'[.,;:!?]')
+
+# Rough starting points, used until a device has seen some real chunks.
+# Audio: ~15 characters per second of speech plus a short pause per punctuation mark.
+DEFAULT_AUDIO_COEFS = [0.3, 0.065, 0.12]
+# Synthesis seconds per second of audio produced, by device.
+DEFAULT_RTF = {'cuda': 0.8, 'mps': 2.0, 'cpu': 4.0}
+
+# Weight of the prior, in pseudo-observations. Small enough that real data takes over quickly.
+PRIOR_WEIGHT = 1.0
+# A voice needs this many observations before its own fit is trusted over the pooled one.
+MIN_VOICE_OBSERVATIONS = 20
+# Key of the fit shared by all voices
+POOLED = '*'
+
+
+def features(text: str) -> list:
+    return [1.0, float(len(text)), float(len(PAUSE_PATTERN.findall(text)))]
+
+
+def format_duration(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    elif seconds < 3600:
+        return f"{seconds//60:.0f}m {seconds%60:.0f}s"
+    elif seconds < 86400:
+        return f"{seconds//3600:.0f}h {(seconds%3600)//60:.0f}m"
+    days = int(seconds // 86400)
+    remaining_seconds = seconds % 86400
+    hours = int(remaining_seconds // 3600)
+    minutes = int((remaining_seconds % 3600) // 60)
+    return f"{days}d {hours}h {minutes}m"
+
+
+def format_bytes(size: float) -> str:
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def _solve(a: list, b: list) -> list:
+    # Gaussian elimination with partial pivoting, the systems here are only 3x3
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        if abs(m[pivot][col]) < 1e-12:
+            raise ValueError("Singular system")
+        m[col], m[pivot] = m[pivot], m[col]
+        for r in range(col + 1, n):
+            f = m[r][col] / m[col][col]
+            for c in range(col, n + 1):
+                m[r][c] -= f * m[col][c]
+    x = [0.0] * n
+    for r in range(n - 1, -1, -1):
+        x[r] = (m[r][n] - sum(m[r][c] * x[c] for c in range(r + 1, n))) / m[r][r]
+    return x
+
+
+class Regression:
+    """
+    Online least squares over `features()`, regularized toward a prior so it gives sane answers
+    before any observations. Only the normal equations are stored, so it persists as a few numbers.
+    """
+
+    def __init__(self, prior: list, xtx: list | None = None, xty: list | None = None, count: int = 0):
+        n = len(prior)
+        # Features are on very different scales (1 vs. hundreds of characters), so the prior is
+        # weighted by the typical magnitude of each feature to pull equally on every coefficient.
+        scale = [1.0, 150.0, 5.0][:n]
+        if xtx is None:
+            xtx = [[PRIOR_WEIGHT * scale[i] ** 2 if i == j else 0.0 for j in range(n)] for i in range(n)]
+            xty = [PRIOR_WEIGHT * scale[i] ** 2 * prior[i] for i in range(n)]
+        self.xtx = xtx
+        self.xty = xty
+        self.count = count
+        self._coefs = None
+
+    def observe(self, x: list, y: float):
+        n = len(x)
+        for i in range(n):
+            self.xty[i] += x[i] * y
+            for j in range(n):
+                self.xtx[i][j] += x[i] * x[j]
+        self.count += 1
+        self._coefs = None
+
+    def predict(self, x: list) -> float:
+        if self._coefs is None:
+            self._coefs = _solve(self.xtx, self.xty)
+        return max(0.0, sum(c * v for c, v in zip(self._coefs, x)))
+
+    def to_dict(self) -> dict:
+        return {'xtx': self.xtx, 'xty': self.xty, 'count': self.count}
+
+    @staticmethod
+    def from_dict(d: dict, prior: list) -> "Regression":
+        return Regression(prior, d['xtx'], d['xty'], d.get('count', 0))
+
+
+class CostModel:
+    """
+    Predicts synthesis seconds and output audio seconds for a chunk of text, per voice.
+
+    Fits are updated online from finished chunks and persisted per device in `cost_model.json`,
+    so estimates get better the more a machine renders.
+    """
+
+    def __init__(self, device: str, path: os.PathLike = DEFAULT_PATH):
+        self.device = str(device)
+        self.path = Path(path)
+        self.lock = Lock()
+        rtf = DEFAULT_RTF.get(self.device, DEFAULT_RTF['cpu'])
+        # Fixed per-call overhead on top of the realtime factor
+        self.synth_prior = [1.0 + rtf * DEFAULT_AUDIO_COEFS[0]] + [rtf * c for c in DEFAULT_AUDIO_COEFS[1:]]
+        self.audio_prior = list(DEFAULT_AUDIO_COEFS)
+        self.models = {}
+        self._load()
+
+    def _load(self):
+        if not self.path.is_file():
+            return
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        current = data.get('audio_version') == AUDIO_MODEL_VERSION
+        for voice, d in data.get(self.device, {}).items():
+            self.models[voice] = (
+                Regression.from_dict(d['synth'], self.synth_prior),
+                Regression.from_dict(d['audio'], self.audio_prior) if current and 'audio' in d else Regression(self.audio_prior)
+            )
+
+    def save(self):
+        with self.lock:
+            data = {}
+            if self.path.is_file():
+                try:
+                    with open(self.path, 'r') as f:
+                        data = json.load(f)
+                except (OSError, ValueError):
+                    data = {}
+            if data.get('audio_version') != AUDIO_MODEL_VERSION:
+                # Other devices keep their synthesis fits, their audio fits start over
+                data = {
+                    device: {voice: {'synth': d['synth']} for voice, d in fits.items()}
+                    for device, fits in data.items() if isinstance(fits, dict)
+                }
+                data['audio_version'] = AUDIO_MODEL_VERSION
+            data[self.device] = {
+                voice: {'synth': s.to_dict(), 'audio': a.to_dict()} for voice, (s, a) in self.models.items()
+            }
+            tmp = self.path.with_suffix('.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+
+    def _get(self, voice: str) -> tuple:
+        if voice not in self.models:
+            self.models[voice] = (Regression(self.synth_prior), Regression(self.audio_prior))
+        return self.models[voice]
+
+    def predict(self, text: str, voice: str | None = None) -> tuple:
+        """Returns (synthesis_seconds, audio_seconds) for `text` spoken by `voice`."""
+        x = features(text)
+        with self.lock:
+            pooled = self._get(POOLED)
+            models = self.models.get(voice, pooled)
+            # Each fit is trusted on its own, a voice's audio fit can be newer than its synthesis fit
+            synth, audio = (m if m.count >= MIN_VOICE_OBSERVATIONS else p for m, p in zip(models, pooled))
+            return (synth.predict(x), audio.predict(x))
+
+    def observe(self, text: str, voice: str | None, synth_seconds: float, audio_seconds: float):
+        x = features(text)
+        with self.lock:
+            # Every observation also goes into the pooled fit
+            for key in {voice, POOLED}:
+                synth, audio = self._get(key)
+                synth.observe(x, synth_seconds)
+                audio.observe(x, audio_seconds)
+
+    def wav_bytes(self, audio_seconds: float) -> float:
+        # `audio_seconds` is predicted speech, every chunk also ends with TRAILING_SILENCE
+        return WAV_HEADER_BYTES + (audio_seconds + TRAILING_SILENCE) * SAMPLE_RATE * BYTES_PER_SAMPLE
+
+
+def estimate_book(src_path: os.PathLike, device: str, max_workers: int = 1, cost_model: CostModel | None = None) -> dict:
+    """
+    Estimates render time and disk usage for a book's chunks without loading any models.
+    Chunks that already have audio are counted separately.
+    """
+    src_path = Path(src_path)
+    audio_path = src_path / 'audio'
+    generated = set()
+    if audio_path.is_dir():
+        generated = {int(f.stem.split('_')[-1]) for f in audio_path.glob('chunk_*.wav')}
+
+    cost_model = cost_model or CostModel(device)
+    chunks = ChunkReader(src_path / 'text')
+    res = {
+        'chunks': len(chunks),
+        'pending_chunks': 0,
+        'synth_seconds': 0.0,
+        'pending_synth_seconds': 0.0,
+        'audio_seconds': 0.0,
+        'wav_bytes': 0.0,
+        'pending_wav_bytes': 0.0,
+    }
+    for index, chunk in enumerate(chunks):
+        synth, audio = cost_model.predict(chunk['text'], chunk.get('character'))
+        size = cost_model.wav_bytes(audio)
+        res['synth_seconds'] += synth
+        res['audio_seconds'] += audio + TRAILING_SILENCE
+        res['wav_bytes'] += size
+        if index not in generated:
+            res['pending_chunks'] += 1
+            res['pending_synth_seconds'] += synth
+            res['pending_wav_bytes'] += size
+    chunks.close()
+    # Workers share one model, so extra threads help less than linearly. Without measurements
+    # for this machine, assume they overlap perfectly and treat it as a lower bound.
+    res['render_seconds'] = res['pending_synth_seconds'] / max(1, max_workers)
+    return res
+
+
+def print_estimate(res: dict):
+    print("\n=============== Render Estimate ===============\n")
+    print(f"    Chunks:                     {res['chunks']} ({res['pending_chunks']} pending)")
+    print(f"    Audio length:               {format_duration(res['audio_seconds'])}")
+    print(f"    Synthesis time (pending):   {format_duration(res['render_seconds'])}")
+    print(f"    Chunk WAVs (total):         {format_bytes(res['wav_bytes'])}")
+    print(f"    Chunk WAVs (pending):       {format_bytes(res['pending_wav_bytes'])}")
+    print("\n===============================================\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate render time and disk usage for a chunked book.")
+    parser.add_argument('book', help="Book folder, e.g. books/Title")
+    parser.add_argument('--device', default='cpu', choices=['cpu', 'cuda', 'mps'])
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+    print_estimate(estimate_book(args.book, args.device, args.workers))
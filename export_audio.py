@@ -0,0 +1,337 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate
+from pathlib import Path
+from threading import Lock
+import numpy as np
+
+# Exporting a book's chunk audio to one MP3 or M4B. Chunk PCM is read in fixed-size blocks and written straight into
+# ffmpeg's stdin in order, so memory use doesn't grow with the book and encoding starts with the first chunk.
+# Long books are split into parts encoded by several ffmpeg processes at once, then joined.
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# Bytes read from a chunk file at a time
+BLOCK_BYTES = 1 << 20
+CHUNK_FILE = re.compile(r'chunk_(\d+)\.wav', re.IGNORECASE)
+
+
+def wav_info(path: os.PathLike) -> dict:
+    """Reads a WAV file's format and where its samples are, without reading the samples."""
+    with open(path, 'rb') as f:
+        riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave != b'WAVE':
+            raise ValueError(f"{path} is not a WAV file.")
+        info = {}
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no audio data.")
+            chunk_id, size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                fmt = f.read(size)
+                tag, channels, rate, _, _, bits = struct.unpack('<HHIIHH', fmt[:16])
+                if tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                    # The real format is the first two bytes of the sub-format GUID
+                    tag = struct.unpack('<H', fmt[24:26])[0]
+                info.update(tag=tag, channels=channels, rate=rate, bits=bits)
+            elif chunk_id == b'data':
+                if not info:
+                    raise ValueError(f"{path} has audio data before its format.")
+                offset = f.tell()
+                # Files written while streaming can have a placeholder size
+                info.update(offset=offset, size=min(size, os.path.getsize(path) - offset))
+                return info
+            else:
+                f.seek(size + (size & 1), os.SEEK_CUR)
+
+
+def _sample_dtype(info: dict, path: os.PathLike) -> np.dtype:
+    if info['tag'] == WAVE_FORMAT_IEEE_FLOAT and info['bits'] == 32:
+        return np.dtype('<f4')
+    if info['tag'] == WAVE_FORMAT_PCM and info['bits'] in (16, 32):
+        return np.dtype(f"<i{info['bits'] // 8}")
+    raise ValueError(f"Unsupported WAV format in {path}: format {info['tag']}, {info['bits']} bits.")
+
+
+def wav_files(audio_dir: os.PathLike) -> list:
+    # Alphabetical, so chunk_00000.wav, chunk_00001.wav, ... play in order
+    audio_dir = Path(audio_dir)
+    return [audio_dir / f for f in sorted(os.listdir(audio_dir)) if f.lower().endswith(".wav")]
+
+
+def _frames(info: dict) -> int:
+    return info['size'] // (info['bits'] // 8 * info['channels'])
+
+
+def stream_pcm(files: list, out, progress=None, ranges: list | None = None) -> dict:
+    """
+    Writes the samples of `files`, in order, to the binary stream `out` as 32-bit float PCM.
+    Every file must have the same sample rate and channel count. `ranges` optionally limits each file
+    to a (first, last) range of frames. Returns their format and total length.
+    """
+    rate = channels = None
+    samples = 0
+    for i, path in enumerate(files):
+        info = wav_info(path)
+        if rate is None:
+            rate, channels = info['rate'], info['channels']
+        elif (info['rate'], info['channels']) != (rate, channels):
+            raise ValueError(f"{path} is {info['rate']}Hz/{info['channels']}ch, the rest of the book is {rate}Hz/{channels}ch.")
+        dtype = _sample_dtype(info, path)
+        frame_bytes = dtype.itemsize * channels
+        first, last = ranges[i] if ranges else (0, _frames(info))
+        # Blocks end on whole samples so each one converts on its own
+        block = BLOCK_BYTES - BLOCK_BYTES % frame_bytes
+        with open(path, 'rb') as f:
+            f.seek(info['offset'] + first * frame_bytes)
+            remaining = (min(last, _frames(info)) - first) * frame_bytes
+            while remaining > 0:
+                data = f.read(min(block, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                if dtype.kind == 'f':
+                    out.write(data)
+                else:
+                    pcm = np.frombuffer(data, dtype=dtype).astype('<f4')
+                    pcm *= 1.0 / (1 << (dtype.itemsize * 8 - 1))
+                    out.write(pcm.tobytes())
+                samples += len(data) // dtype.itemsize
+        if progress:
+            progress(i + 1, len(files))
+    return {'rate': rate, 'channels': channels, 'seconds': samples / ((rate or 1) * (channels or 1))}
+
+
+def split_segments(files: list, segments: int, frame_size: int = 1, cut_before: set | None = None, lengths: list | None = None) -> list:
+    """
+    Splits a book's chunk files into about `segments` parts of similar length, cut at chunk boundaries
+    (only before the files at the positions in `cut_before`, if given). Cuts are moved back onto a multiple of
+    `frame_size` samples, into the silence every chunk ends with, so each part but the last fills whole codec frames.
+    Returns (files, ranges) for stream_pcm() per part.
+    """
+    lengths = lengths or [_frames(wav_info(f)) for f in files]
+    total = sum(lengths)
+    cuts = []
+    position = 0
+    for k, length in enumerate(lengths[:-1]):
+        position += length
+        if cut_before is not None and k + 1 not in cut_before:
+            continue
+        if len(cuts) + 1 < segments and position >= total * (len(cuts) + 1) / segments:
+            cuts.append(position - position % frame_size)
+    cuts.append(total)
+
+    parts = []
+    start = 0
+    file_start = 0
+    index = 0
+    for cut in cuts:
+        part_files = []
+        part_ranges = []
+        while index < len(files) and file_start < cut:
+            first = max(start - file_start, 0)
+            last = min(cut - file_start, lengths[index])
+            if last > first:
+                part_files.append(files[index])
+                part_ranges.append((first, last))
+            if file_start + lengths[index] > cut:
+                # The rest of this file starts the next part
+                break
+            file_start += lengths[index]
+            index += 1
+        if part_files:
+            parts.append((part_files, part_ranges))
+        start = cut
+    return parts
+
+
+# Codec settings per output format, and the codec's frame size
+FORMATS = {
+    # No Xing or ID3 headers, so the parts' frames can simply be appended to each other
+    'mp3': (['-c:a', 'libmp3lame', '-write_xing', '0', '-id3v2_version', '0', '-write_id3v1', '0', '-f', 'mp3'], 1152),
+    'm4b': (['-c:a', 'aac', '-f', 'ipod'], 1024),
+}
+# Encoder processes run at once. ffmpeg's MP3 and AAC encoders are single-threaded
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+
+def _encode(files: list, ranges: list | None, output_path: Path, codec_args: list, bitrate: str | None, ffmpeg: str, progress=None) -> dict:
+    # The encoder needs the format before the first sample, and every file has the same one
+    first = wav_info(files[0])
+    cmd = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+           '-f', 'f32le', '-ar', str(first['rate']), '-ac', str(first['channels']), '-i', 'pipe:0'] + codec_args
+    if bitrate:
+        cmd += ['-b:a', bitrate]
+    cmd.append(str(output_path))
+    return _run(cmd, lambda stdin: stream_pcm(files, stdin, progress, ranges))
+
+
+def _run(cmd: list, feed=None):
+    # ffmpeg's errors go to a file rather than a pipe, a full pipe nobody reads would stall the encoder
+    with tempfile.TemporaryFile() as log:
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE if feed else subprocess.DEVNULL, stderr=log)
+        res = None
+        try:
+            if feed:
+                res = feed(proc.stdin)
+                proc.stdin.close()
+        except BrokenPipeError:
+            # ffmpeg exited early, its log says why
+            feed = None
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+        code = proc.wait()
+        if code != 0 or (feed and res is None):
+            log.seek(0)
+            raise RuntimeError(f"ffmpeg failed ({code}): {log.read().decode(errors='replace').strip()}")
+    return res
+
+
+def chapter_marks(audio_dir: os.PathLike, files: list) -> list | None:
+    """
+    Where the book's chapters (text/chapters.json) start among `files`, as (file position, title).
+    None if the book has no chapters, or its chunks weren't tagged with them.
+    """
+    from chunk import ChunkReader
+    text_path = Path(audio_dir).parent / 'text'
+    chapters_path = text_path / 'chapters.json'
+    if not chapters_path.is_file() or not ChunkReader.exists(text_path):
+        return None
+    with open(chapters_path, 'r', encoding='utf-8') as f:
+        titles = [c.get('title') or f"Chapter {i + 1}" for i, c in enumerate(json.load(f))]
+    with ChunkReader(text_path) as reader:
+        tags = [c.get('chapter') for c in reader]
+    marks = []
+    for k, path in enumerate(files):
+        m = CHUNK_FILE.fullmatch(path.name)
+        index = int(m.group(1)) if m else -1
+        if not 0 <= index < len(tags) or tags[index] is None or tags[index] >= len(titles):
+            return None
+        if not marks or tags[index] != marks[-1][2]:
+            marks.append((k, titles[tags[index]], tags[index]))
+    return [(k, title) for k, title, _ in marks]
+
+
+def _ffmetadata_escape(value: str) -> str:
+    return re.sub(r'([=;#\\\n])', r'\\\1', value)
+
+
+def _join_m4b(part_paths: list, chapters: list | None, output_path: Path, ffmpeg: str, work: Path):
+    # Parts are remuxed without re-encoding. Chapters are (start seconds, end seconds, title)
+    with open(work / 'parts.txt', 'w', encoding='utf-8') as f:
+        for path in part_paths:
+            f.write(f"file '{path.resolve().as_posix()}'\n")
+    cmd = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y', '-f', 'concat', '-safe', '0', '-i', str(work / 'parts.txt')]
+    if chapters:
+        with open(work / 'chapters.txt', 'w', encoding='utf-8') as f:
+            f.write(";FFMETADATA1\n")
+            for start, end, title in chapters:
+                f.write(f"[CHAPTER]\nTIMEBASE=1/1000\nSTART={round(start * 1000)}\nEND={round(end * 1000)}\ntitle={_ffmetadata_escape(title)}\n")
+        cmd += ['-i', str(work / 'chapters.txt'), '-map_metadata', '1', '-map_chapters', '1']
+    _run(cmd + ['-c', 'copy', '-f', 'ipod', str(output_path)])
+
+
+def export_book(audio_dir: os.PathLike, output_path: os.PathLike, bitrate: str | None = None, workers: int = DEFAULT_WORKERS,
+                progress=None, ffmpeg: str | None = None) -> dict:
+    """
+    Encodes every WAV in audio_dir, in alphabetical order, into one MP3 or M4B (by output_path's extension).
+    With more than one worker, the book is split into that many parts at chunk boundaries, encoded at once,
+    and joined: MP3 frames are appended as they are, M4B parts are remuxed into one file. M4B parts are only cut
+    at chapter starts and get the book's chapters as chapter marks, when it has them (see chapter_marks()).
+    `progress(done, total)` is called after each file. Returns export stats.
+    """
+    start = time.perf_counter()
+    output_path = Path(output_path)
+    fmt = 'm4b' if output_path.suffix.lower() in ('.m4b', '.m4a') else 'mp3'
+    codec_args, frame_size = FORMATS[fmt]
+    files = wav_files(audio_dir)
+    if not files:
+        raise ValueError(f"No WAV files found in {audio_dir}.")
+    ffmpeg = ffmpeg or shutil.which('ffmpeg')
+    if not ffmpeg:
+        raise ValueError("ffmpeg was not found, it's needed to encode audio.")
+
+    lock = Lock()
+    done = [0]
+
+    def _progress(*_):
+        if progress:
+            with lock:
+                done[0] += 1
+                progress(done[0], len(files))
+
+    tmp_path = output_path.with_name(output_path.name + '.tmp')
+    work = Path(tempfile.mkdtemp(prefix='export_', dir=output_path.parent))
+    try:
+        lengths = [_frames(wav_info(f)) for f in files]
+        marks = chapter_marks(audio_dir, files) if fmt == 'm4b' else None
+        cut_before = {k for k, _ in marks} if marks else None
+        parts = split_segments(files, max(workers, 1), frame_size, cut_before, lengths)
+        if len(parts) == 1 and fmt == 'mp3':
+            # One part needs no joining, and keeps the Xing header players read the length from
+            stats = _encode(files, None, tmp_path, ['-f', 'mp3'], bitrate, ffmpeg, _progress)
+        else:
+            part_paths = [work / f"part_{i:03d}.{fmt}" for i in range(len(parts))]
+            with ThreadPoolExecutor(max_workers=len(parts)) as pool:
+                results = list(pool.map(
+                    lambda i: _encode(parts[i][0], parts[i][1], part_paths[i], codec_args, bitrate, ffmpeg, _progress),
+                    range(len(parts))
+                ))
+            if fmt == 'mp3':
+                with open(tmp_path, 'wb') as out:
+                    for path in part_paths:
+                        with open(path, 'rb') as f:
+                            shutil.copyfileobj(f, out, BLOCK_BYTES)
+            else:
+                chapters = None
+                if marks:
+                    rate = results[0]['rate']
+                    offsets = list(accumulate(lengths, initial=0))
+                    starts = [offsets[k] / rate for k, _ in marks] + [offsets[-1] / rate]
+                    chapters = [(starts[i], starts[i + 1], title) for i, (_, title) in enumerate(marks)]
+                _join_m4b(part_paths, chapters, tmp_path, ffmpeg, work)
+            stats = {'rate': results[0]['rate'], 'channels': results[0]['channels'], 'seconds': sum(r['seconds'] for r in results)}
+        os.replace(tmp_path, output_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+        shutil.rmtree(work, ignore_errors=True)
+    stats['files'] = len(files)
+    stats['parts'] = len(parts)
+    stats['format'] = fmt
+    stats['chapters'] = len(marks) if marks else 0
+    stats['elapsed'] = time.perf_counter() - start
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a book's chunk audio to one MP3 or M4B.")
+    parser.add_argument('book', help="Book folder, its audio/ folder is exported")
+    parser.add_argument('output', nargs='?', help=".mp3 or .m4b to write, [book]/[title]_audiobook.mp3 by default")
+    parser.add_argument('--bitrate', default=None, help="e.g. 128k, ffmpeg's default if not set")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Parts encoded at once")
+    args = parser.parse_args()
+    book = Path(args.book)
+    output = args.output or book / f"{book.name}_audiobook.mp3"
+    try:
+        stats = export_book(book / 'audio', output, args.bitrate, args.workers)
+    except (ValueError, RuntimeError) as e:
+        print(e)
+        sys.exit(1)
+    print(f"Exported {stats['files']} files ({stats['seconds'] / 3600:.1f}h of audio) to {output} in {stats['elapsed']:.1f}s ({stats['parts']} parts)")
@@ -14,11 +14,17 @@ _tqdm = tqdm.tqdm
 def tqdmr(*args, **kwargs):
     kwargs['disable'] = True
     return _tqdm(*args, **kwargs)
-tqdm.tqdm= tqdmr
+
+# Silences chatterbox's per-chunk progress bars. Done when a model is loaded rather than on import,
+# so importing this module (e.g. to prewarm it) doesn't hide every other progress bar in the process too.
+def disable_tqdm():
+    tqdm.tqdm = tqdmr
 
 from chatterbox import ChatterboxTTS
 import perth
 from typing import Optional
+from cost_model import CostModel, format_duration
+from chunk import ChunkReader, recover_realign
 
 
 class NoWatermark(perth.WatermarkerBase):
@@ -113,6 +119,7 @@ class VoiceArguments:
 
 class ModelContainer:
     def __init__(self, device: Device):
+        disable_tqdm()
         self.model = ChatterboxTTS.from_pretrained(str(device))
         self.model.watermarker = NoWatermark()
         self.sr = self.model.sr
@@ -207,7 +214,7 @@ class ModelContainer:
 
 class Generate:
 
-    def __init__(self, device: Device, src_path: os.PathLike, voices_path: os.PathLike | None, max_workers: int = 1, quit_event = None):
+    def __init__(self, device: Device, src_path: os.PathLike, voices_path: os.PathLike | None, max_workers: int = 1, quit_event = None, streaming: bool = False):
 
         self.src_path = Path(src_path)
         self.voices_path = Path(voices_path) if voices_path else Path('voices')
@@ -221,6 +228,8 @@ class Generate:
 
         self.max_workers = max_workers
         self.quit_event = quit_event
+        # Streaming: chunks arrive through generate_stream() while the rest of the book is still being chunked
+        self.streaming = streaming
         self.model = ModelContainer(device)
 
         self.default_voice = VoiceArguments.get_default()
@@ -231,12 +240,26 @@ class Generate:
         self.failed_chunks = 0
         self.start_time = None
         self.last_update_time = None
+        self.first_audio_time = None
+        self.wait_time = 0.0
         
-        # Sliding window for ETA calculation (last ~100 chunks)
+        # Sliding window for rate display (last ~100 chunks)
         self.window_size = 100
         self.recent_chunks = []  # List of (timestamp, chunk_duration) tuples
 
         self._load_data()
+
+        # ETA is based on predicted work rather than chunk counts, since chunk lengths vary a lot.
+        # The ratio of wall time to predicted work done so far corrects for threading and for
+        # a cost model that hasn't been calibrated on this machine yet.
+        self.cost_model = CostModel(str(device))
+        # Only the pending chunks are read, runs of them at a time
+        self.predicted_costs = {
+            index: self.cost_model.predict(chunk['text'], chunk.get('character'))[0]
+            for index, chunk in self.reader.items(self.indices)
+        } if self.reader else {}
+        self.completed_cost = 0.0
+        self.remaining_cost = sum(self.predicted_costs.values())
     
     def reset_model(self):
         if self.resetting.is_set():
@@ -253,33 +276,39 @@ class Generate:
     def generate(self):
         self.start_time = time.time()
         self.last_update_time = self.start_time
+        print(f"Estimated synthesis time: {format_duration(self.remaining_cost)} for {len(self.indices)} chunks")
         
-        for chunk, index in zip(self.chunks, self.indices):
+        for index in self.indices:
+            chunk = self.reader[index]
             if self.quit_event.is_set():
                 self.model.device.cleanup()
+                self.cost_model.save()
                 print("Generation exited safely.")
                 sys.exit(0)
             stats = self._generate_chunk(chunk, index, 0)
             if stats:
                 self._print_stats(stats)
+        self.cost_model.save()
 
     def generate_threaded(self):
         self.start_time = time.time()
         self.last_update_time = self.start_time
+        print(f"Estimated synthesis time: {format_duration(self.remaining_cost / self.max_workers)} for {len(self.indices)} chunks")
         
         process_queue = Queue(self.total_chunk_len)
-        # List of tuples that contain _generate_chunk arguments
-        for chunk, index in zip(self.chunks, self.indices):
-            process_queue.put((chunk, index))
+        # Only indices are queued, each worker reads its chunk when it gets to it
+        for index in self.indices:
+            process_queue.put(index)
         
         def _worker(queue: Queue, thread_index: int):
             while not self.quit_event.is_set():
                 chunk = None
                 index = None
                 try:
-                    chunk, index = queue.get(block=False)
+                    index = queue.get(block=False)
                 except Empty:
                     break
+                chunk = self.reader[index]
                 try:
                     stats = self._generate_chunk(chunk, index, thread_index)
                 except Exception as e:
@@ -299,12 +328,64 @@ class Generate:
         for t in threads:
             t.join()
 
+        self.cost_model.save()
         if self.quit_event.is_set():
             self.model.device.cleanup()
             print("Generation exited safely.")
             sys.exit(0)
             
 
+    def generate_stream(self, source: Queue):
+        """
+        Synthesizes chunks as they're produced rather than from a finished chunks.jsonl.
+        `source` yields (index, chunk) pairs, then one None per worker once nothing more is coming.
+        Time workers spend waiting on `source` is kept in `wait_time`, the first saved chunk's time in `first_audio_time`.
+        """
+        self.start_time = time.time()
+        self.last_update_time = self.start_time
+
+        def _worker(thread_index: int):
+            while not self.quit_event.is_set():
+                wait_start = time.time()
+                try:
+                    item = source.get(timeout=0.5)
+                except Empty:
+                    item = False
+                with self.stats_lock:
+                    self.wait_time += time.time() - wait_start
+                if item is None:
+                    break
+                if item is False:
+                    continue
+                index, chunk = item
+                predicted_cost = self.cost_model.predict(chunk['text'], chunk.get('character'))[0]
+                with self.stats_lock:
+                    self.predicted_costs[index] = predicted_cost
+                    self.remaining_cost += predicted_cost
+                    self.indices.append(index)
+                try:
+                    stats = self._generate_chunk(chunk, index, thread_index)
+                except Exception as e:
+                    stats = {"error": str(e), "index": index, "thread_index": thread_index}
+                if stats:
+                    if stats.get("success") and self.first_audio_time is None:
+                        self.first_audio_time = time.time()
+                    self._print_stats(stats)
+            self.model.device.cleanup()
+
+        threads = []
+        for thread_index in range(self.max_workers):
+            t = Thread(target=_worker, args=(thread_index,))
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+
+        self.cost_model.save()
+        if self.quit_event.is_set():
+            self.model.device.cleanup()
+            print("Generation exited safely.")
+
     def _generate_chunk(self, chunk: dict, index: int, thread_index: int):
         if self.quit_event.is_set():
             return None
@@ -343,6 +424,9 @@ class Generate:
         if audio is None:
             return {"error": "Audio generation failed after retries", "index": index, "thread_index": thread_index}
         
+        # The cost model predicts speech alone, the silence is added to its estimates separately
+        speech_duration = len(audio) / self.model.sr
+
         # Save audio file
         silence = np.zeros(int(0.2*self.model.sr), dtype=np.float32)
         audio = np.concatenate([audio,silence])
@@ -366,7 +450,9 @@ class Generate:
             "thread_index": thread_index,
             "chunk_duration": chunk_duration,
             "audio_duration": audio_duration,
+            "speech_duration": speech_duration,
             "text_length": text_length,
+            "text": chunk['text'],
             "character": character,
             "retries_used": retries_used
         }
@@ -375,6 +461,9 @@ class Generate:
         with self.stats_lock:
             current_time = time.time()
             
+            predicted_cost = self.predicted_costs.get(stats['index'], 0.0)
+            self.remaining_cost = max(0.0, self.remaining_cost - predicted_cost)
+
             if "error" in stats:
                 self.failed_chunks += 1
                 print(f"ERROR - Chunk {stats['index']}: {stats['error']}")
@@ -382,6 +471,8 @@ class Generate:
             
             if stats.get("success"):
                 self.completed_chunks += 1
+                self.completed_cost += predicted_cost
+                self.cost_model.observe(stats["text"], stats["character"], stats["chunk_duration"], stats["speech_duration"])
                 
                 # Update sliding window for recent performance
                 self.recent_chunks.append((current_time, stats["chunk_duration"]))
@@ -390,8 +481,8 @@ class Generate:
                 
                 # Calculate progress
                 total_processed = self.completed_chunks + self.failed_chunks
-                total_remaining = len(self.chunks) - total_processed
-                progress_pct = (total_processed / len(self.chunks)) * 100
+                total_remaining = len(self.indices) - total_processed
+                progress_pct = (total_processed / len(self.indices)) * 100
                 
                 # Calculate timing stats using sliding window
                 if len(self.recent_chunks) >= 2:
@@ -408,21 +499,13 @@ class Generate:
                     chunks_per_second = total_processed / elapsed_time if elapsed_time > 0 else 0
                     avg_chunk_time = elapsed_time / total_processed if total_processed > 0 else 0
                 
-                eta_seconds = total_remaining / chunks_per_second if chunks_per_second > 0 else 0
-                
-                # Format ETA
-                if eta_seconds < 60:
-                    eta_str = f"{eta_seconds:.0f}s"
-                elif eta_seconds < 3600:
-                    eta_str = f"{eta_seconds/60:.0f}m {eta_seconds%60:.0f}s"
-                elif eta_seconds < 86400:  # Less than 24 hours
-                    eta_str = f"{eta_seconds/3600:.0f}h {(eta_seconds%3600)/60:.0f}m"
-                else:  # 24 hours or more
-                    days = int(eta_seconds // 86400)
-                    remaining_seconds = eta_seconds % 86400
-                    hours = int(remaining_seconds // 3600)
-                    minutes = int((remaining_seconds % 3600) // 60)
-                    eta_str = f"{days}d {hours}h {minutes}m"
+                # Remaining predicted work, scaled by how long predicted work has actually taken so far
+                elapsed_time = current_time - self.start_time
+                if self.completed_cost > 0:
+                    eta_seconds = self.remaining_cost * (elapsed_time / self.completed_cost)
+                else:
+                    eta_seconds = total_remaining / chunks_per_second if chunks_per_second > 0 else 0
+                eta_str = format_duration(eta_seconds)
                 
                 # Calculate real-time factor (how much faster than real-time)
                 individual_rtf = stats["audio_duration"] / stats["chunk_duration"] if stats["chunk_duration"] > 0 else 0
@@ -440,7 +523,7 @@ class Generate:
                 else:
                     rtf_display = f"RTF: {effective_rtf:.2f}x"
                 
-                print(f"Chunk {stats['index']:05d}/{len(self.chunks):05d}{thread_info} - "
+                print(f"Chunk {stats['index']:05d}/{len(self.indices):05d}{thread_info} - "
                       f"{progress_pct:.1f}% - "
                       f"Character: {stats['character'][:15]} - "
                       f"Duration: {stats['chunk_duration']:.2f}s - "
@@ -450,14 +533,15 @@ class Generate:
                       f"{retry_info}")
                 
                 # Print summary every 10 chunks or when complete
-                if total_processed % 10 == 0 or total_processed == len(self.chunks):
+                if total_processed % 10 == 0 or total_processed == len(self.indices):
                     success_rate = (self.completed_chunks / total_processed) * 100
                     overall_elapsed = current_time - self.start_time
                     overall_avg_time = overall_elapsed / total_processed
                     
                     window_info = f" (based on last {len(self.recent_chunks)} chunks)" if len(self.recent_chunks) >= 10 else ""
                     
-                    print(f"SUMMARY: {total_processed+self.completed_chunks}/{len(self.chunks)} chunks processed - "
+                    self.cost_model.save()
+                    print(f"SUMMARY: {total_processed+self.completed_chunks}/{len(self.indices)} chunks processed - "
                           f"Success rate: {success_rate:.1f}% - "
                           f"Recent avg: {avg_chunk_time:.2f}s{window_info} - "
                           f"Overall avg: {overall_avg_time:.2f}s - "
@@ -481,28 +565,25 @@ class Generate:
     def _load_data(self):
         if not (self.src_path.exists() and self.src_path.is_dir()):
             raise ValueError('Source path does not exist or is a file.')
-        chunks = []
-        src_chunks = Path(os.path.join(self.src_path, 'text', 'chunks.json'))
-        if not (src_chunks.exists() and src_chunks.is_file()):
-            raise ValueError('Chunks file does not exist. Please generate it first.')
         if self.voices_path and (Path(self.voices_path).is_file() or not Path(self.voices_path).exists()):
             raise ValueError('Voices path is not a directory or does not exist.')
         
-        with open(src_chunks, 'r') as f:
-            chunks = json.load(f)
-        total_chunk_len = len(chunks)
+        # Chunks are read lazily, only the pending indices are kept in memory.
+        # When streaming there are no chunks yet, they're handed over as they're made.
+        reader = None if self.streaming else ChunkReader(os.path.join(self.src_path, 'text'))
+        total_chunk_len = len(reader) if reader else 0
         indices = []
-        if not chunks:
+        if not total_chunk_len and not self.streaming:
             raise ValueError('No chunks found in the file.')
         self.dest_path = Path(os.path.join(self.src_path, 'audio'))
         if self.dest_path.exists() and not self.dest_path.is_dir():
             raise ValueError('Destination path exists but is not a directory.')
         if not self.dest_path.exists():
             self.dest_path.mkdir(parents=True, exist_ok=True)
+        recover_realign(self.dest_path)
         
-        generated_indices = [int(f.stem.split('_')[-1]) for f in self.dest_path.glob('chunk_*.wav')]
+        generated_indices = {int(f.stem.split('_')[-1]) for f in self.dest_path.glob('chunk_*.wav')}
         indices = [i for i in range(total_chunk_len) if i not in generated_indices]
-        chunks = [i for j, i in enumerate(chunks) if j not in generated_indices]
         voices = {}
 
         if self.voices_path:
@@ -515,7 +596,7 @@ class Generate:
         if len(voices) < 1:
             voices = {'narrator': self.default_voice}
         
-        self.chunks = chunks
+        self.reader = reader
         self.voices = voices
         self.indices = indices
         self.total_chunk_len = total_chunk_len
@@ -1,7 +1,10 @@
 import os
 import unified_gui
 
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
+# Worker processes started with spawn (PDF extraction, sharded parsing) re-import this module, so the app
+# only starts when it's run directly
+if __name__ == "__main__":
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
-app = unified_gui.AudiobookApplication()
-app.run()
+    app = unified_gui.AudiobookApplication()
+    app.run()
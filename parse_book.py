@@ -1,41 +1,124 @@
+import argparse
+import contextlib
+import gc
+import io
 import shutil
-import pymupdf
-from booknlp.booknlp import BookNLP
+import sys
+import time
+import regex as re
+from threading import Lock, get_ident
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 from pathlib import Path
-import torch
 import os
-import regex as re
-import unidecode
+import json
 import urllib
+from book_text import extract_pdf, extract_epub, sanitize, sanitize_file, file_hash
+import shards as sharding
+import parse_cache
 
 # BookNLP hotfix taken from from https://gist.github.com/furkanakkurt1335/735a78c7ed798b419e6deda6e504e8b4
 
+# Named BookNLP pipelines. chunk.py only reads book.tokens and book.quotes and character labeling only reads
+# names and gender from book.book, so supersense and event tagging are skippable for our purposes.
+PIPELINE_PROFILES = {
+    'full': 'entity,quote,supersense,event,coref',
+    'lean': 'entity,quote,coref',
+}
+DEFAULT_PROFILE = 'full'
+
+# BookNLP prints a "--- component: 1.234 seconds ---" line as it finishes each step
+TIMING_PATTERN = re.compile(r'^--- (.+?): ([\d.]+) seconds ---', re.MULTILINE)
+
+# Patched models are tracked here, next to the models themselves
+PATCHED_MANIFEST = "patched_models.json"
+# Bump whenever the patch itself changes, so old patched copies are regenerated
+PATCH_VERSION = 1
+
+# Copy of the text a book's parsed/ output was made from, so edits to it can be re-parsed incrementally
+PARSED_TEXT = "parsed_text.txt"
+# Unchanged paragraphs re-parsed on each side of an edit, so coref and quote attribution have context
+INCREMENTAL_CONTEXT = 20
+# Past this much of the text changed, a full parse isn't much slower
+MAX_INCREMENTAL_FRACTION = 0.5
+
 # Removes 'position_ids' from a model's state dict and saves the modified model
-def remove_position_ids_and_save(model_file, device, save_path):
-    state_dict = torch.load(model_file, map_location=device)
+def remove_position_ids_and_save(model_file, save_path):
+    import torch
+    # Patched on the CPU so one copy works for every device. mmap avoids reading the whole file up front
+    # where the checkpoint format allows it.
+    try:
+        state_dict = torch.load(model_file, map_location='cpu', mmap=True)
+    except (RuntimeError, TypeError):
+        state_dict = torch.load(model_file, map_location='cpu')
 
     if 'bert.embeddings.position_ids' in state_dict:
         print(f'Removing "position_ids" from the state dictionary of {model_file}')
         del state_dict['bert.embeddings.position_ids']
 
-    torch.save(state_dict, save_path)
+    # Written next to the target and moved into place, so an interrupted save is never picked up as a valid cache
+    tmp_path = save_path + '.tmp'
+    torch.save(state_dict, tmp_path)
+    os.replace(tmp_path, save_path)
     print(f'Modified state dict saved to {save_path}')
 
-# Processes model files in model_params, removing 'position_ids' if present
-def process_model_files(model_params, device):
+def _stat_key(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+# Processes model files in model_params, removing 'position_ids' if present.
+# Patched copies are only rewritten when the source model (or the patch) changes.
+def process_model_files(model_params):
     updated_params = {}
+    manifest_path = None
+    manifest = {}
+    changed = False
     for key, path in model_params.items():
         # Only process files that are .model files and exist
         if isinstance(path, str) and os.path.isfile(path) and path.endswith('.model'):
             save_path = path.replace('.model', '_modified.model')
-            remove_position_ids_and_save(path, device, save_path)
+            if manifest_path is None:
+                manifest_path = os.path.join(os.path.dirname(path), PATCHED_MANIFEST)
+                try:
+                    with open(manifest_path, 'r') as f:
+                        manifest = json.load(f)
+                except (OSError, ValueError):
+                    manifest = {}
+            entry = manifest.get(os.path.basename(path))
+            source_key = _stat_key(path)
+            up_to_date = (
+                entry is not None
+                and entry.get('version') == PATCH_VERSION
+                and os.path.isfile(save_path)
+                and _stat_key(save_path) == entry.get('patched')
+            )
+            if up_to_date and entry.get('source') != source_key:
+                # Touched but maybe not changed, only re-patch if the contents differ
+                up_to_date = file_hash(path) == entry.get('source_sha1')
+                if up_to_date:
+                    entry['source'] = source_key
+                    changed = True
+            if not up_to_date:
+                remove_position_ids_and_save(path, save_path)
+                manifest[os.path.basename(path)] = {
+                    'version': PATCH_VERSION,
+                    'source': source_key,
+                    'source_sha1': file_hash(path),
+                    'patched': _stat_key(save_path),
+                }
+                changed = True
             updated_params[key] = save_path
         else:
             updated_params[key] = path
+    if changed:
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, manifest_path)
     return updated_params
 
-# Main function to parse a book file and process it with BookNLP
-def parse(src_path: os.PathLike, dest_path: os.PathLike):
+# Reads, sanitizes and writes a book's text to dest_path/text. Returns the path of sanitized.txt
+def prepare_text(src_path: os.PathLike, dest_path: os.PathLike) -> Path:
     src_path = Path(src_path)
     dest_path = Path(dest_path)
     # Create destination directory if it doesn't exist
@@ -46,60 +129,54 @@ def parse(src_path: os.PathLike, dest_path: os.PathLike):
         raise ValueError("Source path is not a file or does not exist.")
     
 
-    text_content = ""
-    source_text = ""
-    is_pdf = False
+    text_content = None
+    chapters = None
     sanitized_path = Path(os.path.join(dest_path, "text"))
+    if not sanitized_path.exists():
+        sanitized_path.mkdir(parents=True, exist_ok=True)
     # Read and normalize the text content
     if src_path.suffix == '.pdf':
-        is_pdf = True
-        ta = ''
-        with pymupdf.open(src_path) as doc:
-            for page in doc:
-                blocks = page.get_text("blocks", sort=True)
-                for x0, y0, x1, y1, txt_block, bno, btype in blocks:
-                    clean = txt_block.replace("\n", " ")
-                    ta += clean + "\n\n"
-                if len(ta) > 1 and ta[-2:] == "\n\n":
-                    ta = ta[:-2]
-        ta = ta.strip()
-        source_text = src_path
-        text_content = unidecode.unidecode(ta)
-    else:
-        with open(src_path, 'r') as f:
-            text_content = f.read()
-            source_text = text_content
-            text_content = unidecode.unidecode(text_content)
-    #                      |
-    #                      |   This motherfucker took me goddamn forever,
-    #                      |   (Like literally 5 hours)
-    #                      |
-    #                      V
-    text_content = re.sub(r'((?: |^)"(?=[^"\n]*? "))(?:([^"\n]*?(?: |\'|"))(")([^"\n]*?)(")((?: |\'|")[^"\n]*?))', lambda m: m.group(1) + m.group(2) + "'" + m.group(4) + "'" + m.group(6), text_content, flags=re.MULTILINE)
-    text_content = text_content.replace("...", ".").replace("--", ",")
-    num_content_lines = len(re.findall(r'^...', text_content, re.MULTILINE))
-    num_double_newlines = len(re.findall(r'\n\n^...', text_content, re.MULTILINE))
-    ratio = 1
-    try:
-        ratio = num_double_newlines / num_content_lines
-    except:
-        pass
-    if ratio < .9:
-        text_content = text_content.replace("\n", "\n\n")
-
+        text_content = sanitize(extract_pdf(src_path))
+    elif src_path.suffix == '.epub':
+        chapters = extract_epub(src_path)
+        # Chapters are sanitized separately and recorded with their offsets into sanitized.txt
+        parts = []
+        offset = 0
+        for i, chapter in enumerate(chapters):
+            text = sanitize(chapter.pop('text'), fix_paragraphs=False).strip("\n")
+            chapter['index'] = i
+            chapter['start'] = offset
+            chapter['end'] = offset + len(text)
+            parts.append(text)
+            offset += len(text) + 2
+        text_content = "\n\n".join(parts)
 
-    if not sanitized_path.exists():
-        sanitized_path.mkdir(parents=True, exist_ok=True)
-    
-    if not is_pdf:
-        with open(os.path.join(sanitized_path, "source.txt"), "w") as f:
-            f.write(source_text)
+    # The source can be the book's own text/source.txt, after editing it
+    source_copy = Path(os.path.join(sanitized_path, "source" + (".txt" if text_content is None else src_path.suffix)))
+    copy_source = not (source_copy.exists() and source_copy.samefile(src_path))
+    if text_content is None:
+        # Plain text is copied and sanitized line by line, so huge files never sit in memory whole
+        if copy_source:
+            with open(src_path, 'r') as src, open(source_copy, "w") as dest:
+                shutil.copyfileobj(src, dest)
+        sanitize_file(src_path, os.path.join(sanitized_path, "sanitized.txt"))
     else:
-        shutil.copy(source_text, Path(os.path.join(sanitized_path, "source.pdf")))
+        if copy_source:
+            shutil.copy(src_path, source_copy)
+        with open(os.path.join(sanitized_path, "sanitized.txt"), "w") as f:
+            f.write(text_content)
 
-    with open(os.path.join(sanitized_path, "sanitized.txt"), "w") as f:
-        f.write(text_content)
+    # Chapter manifest, in spine order, for stages that work chapter by chapter
+    if chapters is not None:
+        with open(os.path.join(sanitized_path, "chapters.json"), "w") as f:
+            json.dump(chapters, f, indent=2)
 
+    return Path(os.path.join(sanitized_path, "sanitized.txt"))
+
+# Downloads the BookNLP models if needed and returns BookNLP's model parameters for a pipeline profile
+def get_model_params(profile: str = DEFAULT_PROFILE) -> dict:
+    if profile not in PIPELINE_PROFILES:
+        raise ValueError(f"Unknown pipeline profile '{profile}', expected one of: {', '.join(PIPELINE_PROFILES)}")
     user_dir = Path.home()
 
     # Model file names
@@ -130,25 +207,430 @@ def parse(src_path: os.PathLike, dest_path: os.PathLike):
     
     # Set up model parameters for BookNLP
     model_params = {
-        'pipeline': 'entity,quote,supersense,event,coref',
+        'pipeline': PIPELINE_PROFILES[profile],
         'model': 'custom',
         'entity_model_path': os.path.join(user_dir, "booknlp_models", "entities_google_bert_uncased_L-6_H-768_A-12-v1.0.model"),
         'coref_model_path': os.path.join(user_dir, "booknlp_models", "coref_google_bert_uncased_L-12_H-768_A-12-v1.0.model"),
         'quote_attribution_model_path': os.path.join(user_dir, "booknlp_models", "speaker_google_bert_uncased_L-12_H-768_A-12-v1.0.1.model"),
         'bert_model_path': os.path.join(user_dir,  ".cache", "huggingface", "hub")
     }
+    return model_params
+
+
+class BookParser:
+    """
+    A BookNLP pipeline that can process any number of books. Loading spaCy and the BERT models
+    dominates the cost of parsing a short book, so they're loaded once, on the first book that
+    isn't already in the parse cache, and reused.
+    """
+
+    def __init__(self, profile: str = DEFAULT_PROFILE):
+        self.profile = profile
+        self.model_params = get_model_params(profile)
+        self.booknlp = None
+        self.load_time = 0.0
+        self.process_time = 0.0
+        self.books = 0
+        self.cache_hits = 0
+        self.last_cache_hit = False
+        self.lock = Lock()
+        # Everything besides the text that changes BookNLP's output
+        models = sorted(
+            f"{os.path.basename(path)}:{os.path.getsize(path)}" for path in self.model_params.values()
+            if isinstance(path, str) and path.endswith('.model') and os.path.isfile(path)
+        )
+        self.cache_identity = f"{self.model_params['pipeline']}\n" + "\n".join(models)
+
+    def load(self):
+        if self.booknlp is not None:
+            return
+        start = time.perf_counter()
+        # BookNLP (with torch and spaCy) takes seconds to import, so it's only imported once a book needs parsing
+        from booknlp.booknlp import BookNLP
+        # Process model files to remove position_ids if needed
+        model_params = process_model_files(self.model_params)
+        self.booknlp = BookNLP('en', model_params)
+        self.load_time = time.perf_counter() - start
+        print(f"BookNLP loaded in {self.load_time:.1f}s")
+
+    def process(self, text_path: os.PathLike, out_path: os.PathLike) -> dict:
+        """Runs BookNLP on a sanitized text file, writing book.* into out_path. Returns BookNLP's per-component seconds."""
+        with self.lock:
+            self.load()
+            parse_cache.clear_outputs(out_path)
+            # BookNLP only reports its timings on stdout, so its output is captured while still being shown.
+            # Other threads' prints go straight through.
+            log = _Tee(sys.stdout)
+            with contextlib.redirect_stdout(log):
+                # The pipeline keeps per-book state, so books are processed one at a time
+                self.booknlp.process(text_path, out_path, 'book')
+        return {name: float(seconds) for name, seconds in TIMING_PATTERN.findall(log.getvalue())}
+
+    def parse(self, src_path: os.PathLike, dest_path: os.PathLike) -> float:
+        """Parses one book into dest_path. Returns the seconds spent, excluding model loading."""
+        start = time.perf_counter()
+        sanitized = prepare_text(src_path, dest_path)
+        return self.parse_prepared(sanitized, dest_path, start)
+
+    def parse_prepared(self, sanitized: Path, dest_path: os.PathLike, start: float | None = None) -> float:
+        """Same as `parse`, for text `prepare_text` already wrote. `start` is when preparing it began."""
+        start = time.perf_counter() if start is None else start
+        booknlp_path = Path(os.path.join(dest_path, "parsed"))
+
+        if not booknlp_path.exists():
+            booknlp_path.mkdir(parents=True, exist_ok=True)
+
+        key = parse_cache.cache_key(sanitized, self.cache_identity)
+        self.last_cache_hit = parse_cache.restore(key, booknlp_path)
+        components = {}
+        incremental = None
+        if self.last_cache_hit:
+            self.cache_hits += 1
+            print(f"Reused cached parse results for {dest_path}")
+        else:
+            load_time = self.load_time
+            incremental = self.reparse(sanitized, dest_path)
+            if incremental is not None:
+                components = incremental.pop('components')
+            else:
+                # Run BookNLP processing
+                components = self.process(sanitized, booknlp_path)
+                # Spliced output isn't what a full parse would give, so only full parses are cached
+                parse_cache.store(key, booknlp_path)
+            start += self.load_time - load_time
+        shutil.copy(sanitized, booknlp_path / PARSED_TEXT)
+        elapsed = time.perf_counter() - start
+        self.process_time += elapsed
+        self.books += 1
+        write_timings(dest_path, {
+            'profile': self.profile,
+            'pipeline': self.model_params['pipeline'],
+            'cached': self.last_cache_hit,
+            'model_load_seconds': self.load_time,
+            'seconds': elapsed,
+            'components': components,
+            'incremental': incremental,
+        })
+        return elapsed
+
+    def reparse(self, sanitized_path: os.PathLike, dest_path: os.PathLike) -> dict | None:
+        """
+        Re-runs BookNLP only around the paragraphs that changed since the book was last parsed, and splices the
+        results into parsed/. Returns splice stats, or None if the book needs a full parse instead.
+        """
+        booknlp_path = Path(os.path.join(dest_path, "parsed"))
+        previous_path = booknlp_path / PARSED_TEXT
+        timings_path = Path(os.path.join(dest_path, "parse_timings.json"))
+        if not (previous_path.is_file() and timings_path.is_file() and (booknlp_path / "book.tokens").is_file()):
+            return None
+        with open(timings_path, 'r') as f:
+            timings = json.load(f)
+        # Output from another pipeline, or merged from shards, would be spliced into something it doesn't match
+        if timings.get('pipeline') != self.model_params['pipeline'] or timings.get('shards', 1) > 1:
+            return None
+        with open(previous_path, 'r') as f:
+            old_text = f.read()
+        with open(sanitized_path, 'r') as f:
+            new_text = f.read()
+        regions = sharding.changed_regions(old_text, new_text, INCREMENTAL_CONTEXT)
+        changed = sum(end - start for _, (start, end) in regions)
+        if any(start == end for _, (start, end) in regions) or changed > len(new_text) * MAX_INCREMENTAL_FRACTION:
+            return None
 
-    # Select device: CUDA, MPS, or CPU
-    device = torch.device('cuda' if torch.cuda.is_available() else 'mps' if torch.backends.mps.is_available() else 'cpu')
+        window_root = booknlp_path / "incremental"
+        window_dirs = []
+        components = {}
+        for i, (_, (start, end)) in enumerate(regions):
+            window_dir = window_root / f"{i:03d}"
+            window_dir.mkdir(parents=True, exist_ok=True)
+            with open(window_dir / "text.txt", "w") as f:
+                f.write(new_text[start:end])
+            for name, seconds in self.process(window_dir / "text.txt", window_dir).items():
+                components[name] = components.get(name, 0.0) + seconds
+            window_dirs.append(window_dir)
+        stats = sharding.splice_windows(booknlp_path, regions, window_dirs) if regions else {'regions': 0}
+        sharding.cleanup(window_root)
+        stats['reparsed_chars'] = changed
+        stats['total_chars'] = len(new_text)
+        stats['components'] = components
+        print(f"Re-parsed {len(regions)} changed regions ({changed} of {len(new_text)} characters)")
+        return stats
 
-    # Process model files to remove position_ids if needed
-    model_params = process_model_files(model_params, device)
+    def print_stats(self):
+        print("\n=============== Parse Stats ===============\n")
+        print(f"    Books parsed:               {self.books} ({self.cache_hits} from cache)")
+        print(f"    Model load time:            {self.load_time:.1f}s")
+        print(f"    Processing time:            {self.process_time:.1f}s")
+        if self.books:
+            print(f"    Processing per book:        {self.process_time / self.books:.1f}s")
+        print("\n===========================================\n")
 
+
+class _Tee(io.StringIO):
+    # Passes everything through to `stream`, but only keeps what the thread that created it writes. sys.stdout
+    # is swapped for the whole process, and other threads (the GUI, synthesis workers) print meanwhile.
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+        self.thread = get_ident()
+
+    def write(self, s):
+        self.stream.write(s)
+        if get_ident() != self.thread:
+            return len(s)
+        return super().write(s)
+
+    def flush(self):
+        self.stream.flush()
+
+
+# Records how a book was parsed, and how long each BookNLP component took, in the book folder
+def write_timings(dest_path: os.PathLike, timings: dict):
+    with open(os.path.join(dest_path, "parse_timings.json"), "w") as f:
+        json.dump(timings, f, indent=2)
+
+
+_parsers = {}
+_parser_lock = Lock()
+
+# Returns the process-wide parser for a profile, creating it on first use
+def get_parser(profile: str = DEFAULT_PROFILE) -> BookParser:
+    with _parser_lock:
+        if profile not in _parsers:
+            _parsers[profile] = BookParser(profile)
+        return _parsers[profile]
+
+# Drops the process-wide parser for a profile (every profile if None) and frees the device memory its models held.
+# The command line keeps parsers for a whole batch, the GUI releases them once a book is parsed, so they don't sit
+# on the GPU next to the TTS model.
+def release_parser(profile: str | None = None):
+    with _parser_lock:
+        released = [_parsers.pop(p) for p in ([profile] if profile else list(_parsers)) if p in _parsers]
+    for parser in released:
+        # Waits for a parse in progress
+        with parser.lock:
+            parser.booknlp = None
+    if released and 'torch' in sys.modules:
+        import torch
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        if torch.backends.mps.is_available():
+            torch.mps.empty_cache()
+
+# Main function to parse a book file and process it with BookNLP. Returns True if the results came from the cache
+def parse(src_path: os.PathLike, dest_path: os.PathLike, parser: BookParser | None = None, profile: str = DEFAULT_PROFILE) -> bool:
+    parser = parser or get_parser(profile)
+    parser.parse(src_path, dest_path)
+    return parser.last_cache_hit
+
+# Runs in a worker process. Each worker loads its own parser once and keeps it for every shard it gets
+def _parse_shard(text_path: str, out_path: str, profile: str = DEFAULT_PROFILE) -> tuple:
+    parser = get_parser(profile)
+    Path(out_path).mkdir(parents=True, exist_ok=True)
+    parser.load()
+    start = time.perf_counter()
+    components = parser.process(text_path, out_path)
+    return time.perf_counter() - start, components
+
+# Parses a book as several shards in parallel processes and merges them into one parsed/ folder.
+# Shards are cut at chapter starts (EPUBs) or paragraph breaks. With compare=True the book is also parsed
+# in one pass into parsed_single/ and the quote attribution of the two is compared.
+def parse_sharded(src_path: os.PathLike, dest_path: os.PathLike, shards: int = 4, workers: int | None = None, compare: bool = False, profile: str = DEFAULT_PROFILE) -> dict:
+    start = time.perf_counter()
+    sanitized = prepare_text(src_path, dest_path)
+    with open(sanitized, 'r') as f:
+        text = f.read()
+    chapters = None
+    chapters_path = sanitized.parent / "chapters.json"
+    if chapters_path.is_file():
+        with open(chapters_path, 'r') as f:
+            chapters = json.load(f)
+    ranges = sharding.split_shards(text, shards, chapters)
     booknlp_path = Path(os.path.join(dest_path, "parsed"))
+    if len(ranges) == 1:
+        # The text is already prepared, doing it again would re-extract the book
+        get_parser(profile).parse_prepared(sanitized, dest_path, start)
+        return {'shards': 1}
+    booknlp_path.mkdir(parents=True, exist_ok=True)
+    # Sharded output isn't identical to a single pass, so it's cached separately per shard count
+    key = parse_cache.cache_key(sanitized, get_parser(profile).cache_identity + f"\nshards={len(ranges)}")
+    if not compare and parse_cache.restore(key, booknlp_path):
+        print(f"Reused cached parse results for {src_path}")
+        # Same as a sharded parse, a text copy from an earlier single pass doesn't match the merged output
+        (booknlp_path / PARSED_TEXT).unlink(missing_ok=True)
+        stats = {'shards': len(ranges), 'cached': True, 'seconds': time.perf_counter() - start}
+        write_timings(dest_path, {
+            'profile': profile,
+            'pipeline': PIPELINE_PROFILES[profile],
+            'cached': True,
+            'shards': len(ranges),
+            'seconds': stats['seconds'],
+            'components': {},
+        })
+        return stats
+    parse_cache.clear_outputs(booknlp_path)
+
+    shard_root = booknlp_path / "shards"
+    text_paths = []
+    out_paths = []
+    for i, (s, e) in enumerate(ranges):
+        shard_dir = shard_root / f"{i:03d}"
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        with open(shard_dir / "text.txt", "w") as f:
+            f.write(text[s:e])
+        text_paths.append(str(shard_dir / "text.txt"))
+        out_paths.append(str(shard_dir))
+
+    # Every worker holds a full copy of the models, so memory rather than cores is usually the limit
+    workers = workers or min(len(ranges), 2)
+    # Spawned, not forked, so workers don't inherit CUDA state
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as pool:
+        results = list(pool.map(_parse_shard, text_paths, out_paths, [profile] * len(text_paths)))
+    shard_times = [seconds for seconds, _ in results]
+    # Components run in parallel across shards, so these add up to more than the wall time
+    components = {}
+    for _, shard_components in results:
+        for name, seconds in shard_components.items():
+            components[name] = components.get(name, 0.0) + seconds
+    stats = sharding.merge_shards(out_paths, [s for s, e in ranges], booknlp_path)
+    sharding.cleanup(shard_root)
+    # Merged output can't be spliced into, later edits get a full parse
+    (booknlp_path / PARSED_TEXT).unlink(missing_ok=True)
+    parse_cache.store(key, booknlp_path)
+    stats['shard_seconds'] = shard_times
+    stats['seconds'] = time.perf_counter() - start
+    write_timings(dest_path, {
+        'profile': profile,
+        'pipeline': PIPELINE_PROFILES[profile],
+        'cached': False,
+        'shards': len(ranges),
+        'seconds': stats['seconds'],
+        'shard_seconds': shard_times,
+        'components': components,
+    })
 
-    if not booknlp_path.exists():
-        booknlp_path.mkdir(parents=True, exist_ok=True)
+    print("\n=============== Sharded Parse ===============\n")
+    print(f"    Shards:                         {stats['shards']} ({workers} workers)")
+    print(f"    Slowest shard:                  {max(shard_times):.1f}s")
+    print(f"    Total time:                     {stats['seconds']:.1f}s")
+    print(f"    Tokens:                         {stats['tokens']}")
+    print(f"    Quotes:                         {stats['quotes']}")
+    print(f"    Characters:                     {stats['characters']} ({stats['reconciled']} reconciled across shards)")
+    print("\n=============================================\n")
 
-    # Run BookNLP processing
-    booknlp = BookNLP('en', model_params)
-    booknlp.process(Path(os.path.join(sanitized_path, "sanitized.txt")), booknlp_path, 'book')
+    if compare:
+        single_path = Path(os.path.join(dest_path, "parsed_single"))
+        single_path.mkdir(parents=True, exist_ok=True)
+        get_parser(profile).process(sanitized, single_path)
+        stats['report'] = sharding.attribution_report(single_path, booknlp_path)
+        sharding.print_report(stats['report'])
+    return stats
+
+# Parses a queue of (src_path, dest_path) pairs with one loaded parser. Returns the per-book processing times
+def parse_many(jobs: list, parser: BookParser | None = None, profile: str = DEFAULT_PROFILE) -> list:
+    parser = parser or get_parser(profile)
+    times = []
+    for src_path, dest_path in jobs:
+        print(f"Parsing {src_path}")
+        elapsed = parser.parse(src_path, dest_path)
+        print(f"Parsed {src_path} in {elapsed:.1f}s")
+        times.append(elapsed)
+    parser.print_stats()
+    return times
+
+# What the character labeling screen shows for a parsed book: every character with proper names, their
+# names and gender
+def labeling_summary(book_path: os.PathLike) -> list:
+    with open(Path(book_path) / "parsed" / "book.book", 'r') as f:
+        data = json.load(f)
+    res = []
+    for char in data.get("characters", []):
+        proper = char.get("mentions", {}).get("proper", [])
+        if not char or "id" not in char or not proper:
+            continue
+        res.append((char["id"], sorted((m["n"], m["c"]) for m in proper), (char.get("g") or {}).get("argmax")))
+    return res
+
+# Speaker name for every character id a parse refers to, so chunks show who each quote is attributed to
+def attribution_names(book_path: os.PathLike) -> dict:
+    parsed = Path(book_path) / "parsed"
+    with open(parsed / "book.book", 'r') as f:
+        ids = {c["id"] for c in json.load(f).get("characters", []) if "id" in c}
+    with open(parsed / "book.quotes", 'r', encoding='utf-8') as f:
+        header = f.readline().rstrip('\n').split('\t')
+        col = header.index('char_id')
+        ids.update(int(line.split('\t')[col]) for line in f if line.strip())
+    return {i: f"char{i}" for i in ids if i >= 0}
+
+# Compares two parsed books: their chunks, with every character read by its own voice, and what the character
+# labeling screen would show. Returns which of them match.
+def compare_parses(reference_path: os.PathLike, book_path: os.PathLike) -> dict:
+    from chunk import generate_chunks, ChunkReader
+    res = {}
+    for key, path in (('reference', reference_path), ('book', book_path)):
+        generate_chunks(path, attribution_names(path), multivoice=True)
+        with ChunkReader(Path(path) / "text") as reader:
+            res[key] = ([(c['character'], c['text']) for c in reader], labeling_summary(path))
+    (ref_chunks, ref_labels), (chunks, labels) = res['reference'], res['book']
+    return {
+        'same_chunks': chunks == ref_chunks,
+        'same_labels': labels == ref_labels,
+        'chunks': (len(ref_chunks), len(chunks)),
+        'characters': (len(ref_labels), len(labels)),
+    }
+
+# Parses a book with a profile and with the full pipeline, and checks that chunking (including who each quote
+# is attributed to) and character labeling come out the same. Returns True if they do.
+def verify_profile(src_path: os.PathLike, profile: str, reference: str = 'full', work_path: os.PathLike | None = None) -> bool:
+    work_path = Path(work_path or Path('cache') / 'verify')
+    timings = {}
+    for name in (reference, profile):
+        book_path = work_path / name
+        shutil.rmtree(book_path, ignore_errors=True)
+        get_parser(name).parse(src_path, book_path)
+        # Both pipelines loaded at once would double memory use
+        release_parser(name)
+        with open(book_path / "parse_timings.json", 'r') as f:
+            timings[name] = json.load(f)
+
+    report = compare_parses(work_path / reference, work_path / profile)
+    ref_timings, profile_timings = timings[reference], timings[profile]
+    print(f"\n=============== Profile Check: {profile} vs. {reference} ===============\n")
+    print(f"    Chunks:                     {'same' if report['same_chunks'] else 'DIFFERENT'} ({report['chunks'][1]} vs. {report['chunks'][0]})")
+    print(f"    Character labeling:         {'same' if report['same_labels'] else 'DIFFERENT'} ({report['characters'][1]} vs. {report['characters'][0]} characters)")
+    for component in sorted(set(ref_timings['components']) | set(profile_timings['components'])):
+        a = ref_timings['components'].get(component)
+        b = profile_timings['components'].get(component)
+        print(f"    {component + ':':<28}{f'{a:.1f}s' if a is not None else '-':>8} -> {f'{b:.1f}s' if b is not None else '-'}")
+    print(f"\n==================={'=' * (len(profile) + len(reference) + 30)}\n")
+    return report['same_chunks'] and report['same_labels']
+
+
+# Book folder a source file is parsed into. A book's own text/source file, after fixing typos in it, goes back into that book
+def book_folder(src_path: os.PathLike, books_path: os.PathLike) -> Path:
+    src_path = Path(src_path)
+    if src_path.stem == 'source' and src_path.parent.name == 'text':
+        return src_path.parent.parent
+    return Path(books_path) / src_path.stem
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Parse books with BookNLP, loading the models once.")
+    arg_parser.add_argument('sources', nargs='+', help="Book files (.txt, .pdf or .epub)")
+    arg_parser.add_argument('--books', default='books', help="Folder to create book folders in, named after each file")
+    arg_parser.add_argument('--shards', type=int, default=1, help="Split each book into this many shards, parsed in parallel")
+    arg_parser.add_argument('--workers', type=int, default=None, help="Worker processes for sharded parsing")
+    arg_parser.add_argument('--compare', action='store_true', help="Also parse in one pass and report attribution agreement")
+    arg_parser.add_argument('--profile', default=DEFAULT_PROFILE, choices=list(PIPELINE_PROFILES), help="BookNLP pipeline profile")
+    arg_parser.add_argument('--verify-profile', action='store_true', help="Check that chunks and character labeling match the full pipeline instead of parsing")
+    args = arg_parser.parse_args()
+    if args.verify_profile:
+        ok = all([verify_profile(src, args.profile) for src in args.sources])
+        sys.exit(0 if ok else 1)
+    jobs = [(src, book_folder(src, args.books)) for src in args.sources]
+    if args.shards > 1:
+        for src, dest in jobs:
+            parse_sharded(src, dest, args.shards, args.workers, args.compare, args.profile)
+    else:
+        parse_many(jobs, profile=args.profile)
@@ -0,0 +1,105 @@
+import hashlib
+import os
+import shutil
+import time
+from pathlib import Path
+
+# Cache of BookNLP output, keyed by the sanitized text and everything that affects how it's parsed.
+# Restoring hard-links the cached files into the book's parsed/ folder where the filesystem allows it.
+
+CACHE_PATH = Path('cache') / 'parsed'
+# Bump whenever the parse output changes in a way the key doesn't capture
+CACHE_VERSION = 1
+MAX_CACHE_BYTES = 5 << 30
+MAX_CACHE_AGE_DAYS = 90
+# BookNLP output files, anything else in parsed/ (like chunk.py's book.npz) is derived and not cached
+OUTPUT_SUFFIXES = ('.tokens', '.quotes', '.entities', '.supersense', '.book', '.book.html')
+
+
+def cache_key(sanitized_path: os.PathLike, identity: str) -> str:
+    h = hashlib.sha1(f"{CACHE_VERSION}\n{identity}\n".encode('utf-8'))
+    with open(sanitized_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _outputs(folder: Path, name: str) -> list:
+    return [p for p in folder.iterdir() if p.is_file() and p.name.startswith(name + '.') and p.name[len(name):] in OUTPUT_SUFFIXES]
+
+
+def _link(src: Path, dest: Path):
+    # Replaced rather than overwritten, a hard-linked file written in place would change the cache too
+    if dest.exists():
+        dest.unlink()
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+def clear_outputs(parsed_path: os.PathLike, name: str = 'book'):
+    """Removes BookNLP output from parsed_path, so it's never written into files shared with the cache."""
+    parsed_path = Path(parsed_path)
+    if parsed_path.is_dir():
+        for p in _outputs(parsed_path, name):
+            p.unlink()
+
+
+def restore(key: str, parsed_path: os.PathLike, name: str = 'book') -> bool:
+    """Links the cached output for `key` into parsed_path. Returns False on a cache miss."""
+    entry = CACHE_PATH / key
+    complete = entry / 'complete'
+    if not complete.is_file():
+        return False
+    parsed_path = Path(parsed_path)
+    parsed_path.mkdir(parents=True, exist_ok=True)
+    clear_outputs(parsed_path, name)
+    for p in _outputs(entry, name):
+        _link(p, parsed_path / p.name)
+    # Eviction goes by last use
+    complete.touch()
+    return True
+
+
+def store(key: str, parsed_path: os.PathLike, name: str = 'book'):
+    """Adds a book's BookNLP output to the cache under `key`, then evicts old entries."""
+    entry = CACHE_PATH / key
+    tmp = CACHE_PATH / f"{key}.tmp"
+    try:
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        for p in _outputs(Path(parsed_path), name):
+            _link(p, tmp / p.name)
+        (tmp / 'complete').touch()
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp, entry)
+    except OSError as e:
+        print(f"Could not cache parse results: {e}")
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+    evict()
+
+
+def evict(max_bytes: int = MAX_CACHE_BYTES, max_age_days: float = MAX_CACHE_AGE_DAYS) -> int:
+    """Removes entries unused for more than max_age_days, then least recently used ones until under max_bytes. Returns entries removed."""
+    if not CACHE_PATH.is_dir():
+        return 0
+    entries = []
+    for entry in CACHE_PATH.iterdir():
+        complete = entry / 'complete'
+        if not complete.is_file():
+            continue
+        size = sum(p.stat().st_size for p in entry.iterdir() if p.is_file())
+        entries.append((complete.stat().st_mtime, size, entry))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for used, size, entry in entries:
+        if used >= cutoff and total <= max_bytes:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+        removed += 1
+    return removed
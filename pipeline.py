@@ -0,0 +1,270 @@
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from pathlib import Path
+from queue import Queue
+from threading import Event, Thread
+import numpy as np
+
+from parse_book import prepare_text, get_parser, release_parser, PIPELINE_PROFILES, DEFAULT_PROFILE, PARSED_TEXT
+import parse_cache
+import shards as sharding
+from chunk import BookData, ChunkReader, prepare_data, heuristic_chunks, chunk_entries, write_chunks, chapter_token_starts, tag_chapters
+from generate_audio import Generate, Device
+
+# Streaming mode: the book is parsed and chunked in chapter-sized windows, and every window's chunks are
+# handed to synthesis as soon as the window is done, so the TTS model isn't idle for the whole BookNLP run.
+# There's no labeling step in between, characters get voices from a SpeakerPolicy as they're first seen.
+
+# About a long chapter. Smaller windows get to the first audio sooner, but give BookNLP less context for coref.
+WINDOW_CHARS = 60_000
+SPEAKERS_FILE = 'speakers.json'
+
+
+class SpeakerPolicy:
+    """
+    Picks a voice for every character as windows are parsed. Labels carried over from an earlier run win,
+    matched by most used proper name, otherwise voices go by gender like CharacterLabelingGUI.auto_assign_names.
+    A character keeps its voice once it has one, even if later windows change its merged gender.
+    """
+
+    def __init__(self, narrator: str = 'Narrator', male: str = 'GenericMale', female: str = 'GenericFemale',
+                 ungendered: str = 'GenericUngendered', labels: dict | None = None):
+        self.narrator = narrator
+        self.male = male
+        self.female = female
+        self.ungendered = ungendered
+        self.labels = {k.lower(): v for k, v in (labels or {}).items()}
+        self.assigned = {}
+
+    @staticmethod
+    def from_file(path: os.PathLike, **kwargs) -> "SpeakerPolicy":
+        """Carries over the labels of a speakers.json written by an earlier run."""
+        with open(path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        kwargs.setdefault('narrator', saved.get('narrator', 'Narrator'))
+        labels = {c['name']: c['voice'] for c in saved.get('characters', []) if c.get('name')}
+        return SpeakerPolicy(labels=labels, **kwargs)
+
+    def voice(self, char: dict, name: str | None) -> str:
+        if name and name in self.labels:
+            return self.labels[name]
+        gender = (char.get('g') or {}).get('argmax', 'they/them/their')
+        if gender == 'he/him/his':
+            return self.male
+        if gender == 'she/her':
+            return self.female
+        return self.ungendered
+
+    def script_names(self, registry: sharding.CharacterRegistry) -> dict:
+        """Character id -> voice for everything in `registry`, in the form generate_chunks takes."""
+        for char in registry.characters():
+            if char['id'] not in self.assigned:
+                self.assigned[char['id']] = self.voice(char, registry.name(char['id']))
+        return {**self.assigned, -1: self.narrator}
+
+    def save(self, registry: sharding.CharacterRegistry, path: os.PathLike):
+        characters = [
+            {'id': c['id'], 'name': registry.name(c['id']), 'voice': self.assigned[c['id']]}
+            for c in registry.characters() if c['id'] in self.assigned
+        ]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'narrator': self.narrator, 'characters': characters}, f, indent=2)
+
+
+def stream_book(src_path: os.PathLike, dest_path: os.PathLike, voices_path: os.PathLike | None = None, device: str | None = None,
+                max_workers: int = 1, window_chars: int = WINDOW_CHARS, profile: str = DEFAULT_PROFILE, policy: SpeakerPolicy | None = None,
+                min_length: float = 1.5, max_length: float = 20, length_model = 'seconds', quit_event: Event | None = None) -> dict:
+    """
+    Parses, chunks and synthesizes a book with the three overlapping: windows are parsed one after another
+    while finished windows' chunks are synthesized. Writes the same parsed/, text/chunks.jsonl and audio/
+    a sequential run would, plus text/speakers.json with the voices picked. Returns timing stats.
+    """
+    start = time.time()
+    dest_path = Path(dest_path)
+    quit_event = quit_event or Event()
+    policy = policy or SpeakerPolicy()
+    sanitized = prepare_text(src_path, dest_path)
+    with open(sanitized, 'r') as f:
+        text = f.read()
+    chapters = None
+    chapters_path = sanitized.parent / "chapters.json"
+    if chapters_path.is_file():
+        with open(chapters_path, 'r') as f:
+            chapters = json.load(f)
+    ranges = sharding.split_shards(text, math.ceil(len(text) / window_chars), chapters)
+
+    text_path = dest_path / 'text'
+    audio_path = dest_path / 'audio'
+    booknlp_path = dest_path / 'parsed'
+    window_root = booknlp_path / 'windows'
+    # Audio from an earlier run is kept where the chunk at its index hasn't changed
+    previous = []
+    if ChunkReader.exists(text_path):
+        with ChunkReader(text_path) as reader:
+            previous = [c['id'] for c in reader]
+
+    parser = get_parser(profile)
+    registry = sharding.CharacterRegistry()
+    queue = Queue()
+    entries = []
+    errors = []
+    stats = {'windows': len(ranges), 'window_seconds': [], 'chunks': 0, 'reused': 0, 'first_chunk': None}
+
+    def _produce():
+        try:
+            token_offset = 0
+            for i, (s, e) in enumerate(ranges):
+                if quit_event.is_set():
+                    break
+                window_start = time.time()
+                window_dir = window_root / f"{i:03d}"
+                window_dir.mkdir(parents=True, exist_ok=True)
+                with open(window_dir / "text.txt", "w") as f:
+                    f.write(text[s:e])
+                # A window parses the same as a book with just its text, so windows are cached like books
+                key = parse_cache.cache_key(window_dir / "text.txt", parser.cache_identity)
+                if not parse_cache.restore(key, window_dir):
+                    parser.process(window_dir / "text.txt", window_dir)
+                    parse_cache.store(key, window_dir)
+
+                id_map = registry.read_shard(window_dir, token_offset)
+                book = BookData.from_tsv(window_dir / "book.tokens", window_dir / "book.quotes")
+                book.quote_chars = np.array([id_map.get(int(c), int(c)) for c in book.quote_chars], dtype=np.int64)
+                book.set_length_model(length_model)
+                charchunks = [
+                    {'character': seg['character'], 'chunks': heuristic_chunks(book, seg['paragraphs'], min_length, max_length)}
+                    for seg in prepare_data(book, policy.script_names(registry))
+                ]
+                window_entries = chunk_entries(charchunks, token_offset)
+                first = len(entries)
+                entries.extend(window_entries)
+                # Rewritten every window, so chunks.jsonl always lines up with the audio written so far
+                write_chunks(entries, text_path)
+                for index, chunk in enumerate(window_entries, first):
+                    wav = audio_path / f"chunk_{index:05d}.wav"
+                    if index < len(previous) and previous[index] == chunk['id'] and wav.is_file():
+                        stats['reused'] += 1
+                        continue
+                    if wav.is_file():
+                        wav.unlink()
+                    if stats['first_chunk'] is None:
+                        stats['first_chunk'] = time.time()
+                    queue.put((index, chunk))
+                token_offset += len(book)
+                stats['window_seconds'].append(time.time() - window_start)
+        except Exception as e:
+            errors.append(e)
+            quit_event.set()
+        finally:
+            stats['produced'] = time.time()
+            # Every window is parsed, synthesis gets the device to itself
+            release_parser(profile)
+            for _ in range(max_workers):
+                queue.put(None)
+
+    producer = Thread(target=_produce, daemon=True)
+    producer.start()
+    # The TTS model loads while the first window is being parsed
+    load_start = time.time()
+    try:
+        generator = Generate(Device(device), dest_path, voices_path, max_workers, quit_event, streaming=True)
+    except Exception:
+        quit_event.set()
+        producer.join()
+        raise
+    tts_load = time.time() - load_start
+    synth_start = time.time()
+    generator.generate_stream(queue)
+    synth_end = time.time()
+    producer.join()
+    if errors:
+        raise errors[0]
+    if quit_event.is_set():
+        return stats
+
+    # Leave the book as a sequential run would, so it can still be relabeled and re-chunked as usual
+    window_dirs = [window_root / f"{i:03d}" for i in range(len(ranges))]
+    parse_cache.clear_outputs(booknlp_path)
+    sharding.merge_shards(window_dirs, [s for s, e in ranges], booknlp_path)
+    sharding.cleanup(window_root)
+    (booknlp_path / PARSED_TEXT).unlink(missing_ok=True)
+    # Chapters are tagged once the windows' tokens are merged, their offsets are only book-wide from then on
+    chapter_starts = chapter_token_starts(dest_path, parsed=True)
+    if chapter_starts:
+        tag_chapters(entries, chapter_starts)
+        write_chunks(entries, text_path)
+    policy.save(registry, text_path / SPEAKERS_FILE)
+    for wav in audio_path.glob('chunk_*.wav'):
+        if int(wav.stem.split('_')[-1]) >= len(entries):
+            wav.unlink()
+
+    # A sequential run parses everything, then loads the TTS model, then synthesizes. Its times are estimated
+    # from this run's: all parsing and chunking, plus model loading, plus the time synthesis wasn't waiting on chunks.
+    end = time.time()
+    parse_seconds = stats['produced'] - start
+    synth_busy = (synth_end - synth_start) - generator.wait_time / max_workers
+    stats.update({
+        'chunks': len(entries),
+        'parse_seconds': parse_seconds,
+        'tts_load_seconds': tts_load,
+        'synthesis_seconds': synth_end - synth_start,
+        'synthesis_idle_seconds': generator.wait_time / max_workers,
+        'seconds': end - start,
+        'sequential_seconds': parse_seconds + tts_load + synth_busy,
+        'first_audio_seconds': None,
+        'sequential_first_audio_seconds': None,
+    })
+    if generator.first_audio_time is not None and stats['first_chunk'] is not None:
+        stats['first_audio_seconds'] = generator.first_audio_time - start
+        # The first chunk takes as long to synthesize either way, it just can't start until parsing is done
+        first_chunk_latency = generator.first_audio_time - max(stats['first_chunk'], synth_start)
+        stats['sequential_first_audio_seconds'] = parse_seconds + tts_load + first_chunk_latency
+    with open(dest_path / "stream_timings.json", 'w') as f:
+        json.dump({k: v for k, v in stats.items() if k not in ('first_chunk', 'produced')}, f, indent=2)
+    print_stream_stats(stats)
+    return stats
+
+
+def print_stream_stats(stats: dict):
+    _fmt = lambda x: f"{x:.1f}s" if x is not None else "-"
+    print("\n=============== Streaming ===============\n")
+    print(f"    Windows:                        {stats['windows']} (avg {sum(stats['window_seconds']) / max(len(stats['window_seconds']), 1):.1f}s to parse and chunk)")
+    print(f"    Chunks:                         {stats['chunks']} ({stats['reused']} reused)")
+    print(f"    Time to first audio:            {_fmt(stats['first_audio_seconds'])} (sequential est. {_fmt(stats['sequential_first_audio_seconds'])})")
+    print(f"    Total time:                     {_fmt(stats['seconds'])} (sequential est. {_fmt(stats['sequential_seconds'])})")
+    print(f"    Parsing and chunking:           {_fmt(stats['parse_seconds'])}")
+    print(f"    TTS model load:                 {_fmt(stats['tts_load_seconds'])}")
+    print(f"    Synthesis waiting on chunks:    {_fmt(stats['synthesis_idle_seconds'])}")
+    print("\n=========================================\n")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Parse, chunk and synthesize a book in overlapping windows.")
+    arg_parser.add_argument('source', help="Book file (.txt, .pdf or .epub)")
+    arg_parser.add_argument('--books', default='books', help="Folder to create the book folder in, named after the file")
+    arg_parser.add_argument('--voices', default='voices', help="Voices folder")
+    arg_parser.add_argument('--device', default=None, help="TTS device, picked automatically by default")
+    arg_parser.add_argument('--threads', type=int, default=1, help="Synthesis threads")
+    arg_parser.add_argument('--window', type=int, default=WINDOW_CHARS, help="Characters per window, windows are cut at chapters where known")
+    arg_parser.add_argument('--profile', default=DEFAULT_PROFILE, choices=list(PIPELINE_PROFILES), help="BookNLP pipeline profile")
+    arg_parser.add_argument('--narrator', default=None, help="Narrator voice, Narrator or the one saved in --labels by default")
+    arg_parser.add_argument('--male', default='GenericMale', help="Voice for characters BookNLP thinks are male")
+    arg_parser.add_argument('--female', default='GenericFemale', help="Voice for characters BookNLP thinks are female")
+    arg_parser.add_argument('--ungendered', default='GenericUngendered', help="Voice for everyone else")
+    arg_parser.add_argument('--labels', default=None, help="speakers.json from an earlier run to carry voices over from")
+    args = arg_parser.parse_args()
+    voices = {'male': args.male, 'female': args.female, 'ungendered': args.ungendered}
+    # Only an explicit narrator overrides the one saved with the labels
+    if args.narrator:
+        voices['narrator'] = args.narrator
+    policy = SpeakerPolicy.from_file(args.labels, **voices) if args.labels else SpeakerPolicy(**voices)
+    dest = Path(args.books) / Path(args.source).stem
+    try:
+        stream_book(args.source, dest, args.voices, args.device, args.threads, args.window, args.profile, policy)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
@@ -0,0 +1,634 @@
+import argparse
+import bisect
+import csv
+import json
+import os
+import shutil
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from pathlib import Path
+
+# Splitting a book into shards for BookNLP, and merging the shards' output back into one book.
+# Kept free of torch/BookNLP imports so merges and reports can run anywhere.
+
+# Token columns holding document-level token indices, and the character offset columns
+TOKEN_INDEX_COLUMNS = ['token_ID_within_document', 'syntactic_head_ID']
+CHAR_OFFSET_COLUMNS = ['byte_onset', 'byte_offset']
+QUOTE_TOKEN_COLUMNS = ['quote_start', 'quote_end', 'mention_start', 'mention_end']
+# Character attributes in book.book that point at tokens
+CHARACTER_TOKEN_LISTS = ['agent', 'patient', 'mod', 'poss']
+# Shard output files with (start, end) token columns, merged the same way
+SPAN_FILES = {'entities': ['start_token', 'end_token'], 'supersense': ['start_token', 'end_token']}
+
+
+def split_shards(text: str, shards: int, chapters: list | None = None) -> list:
+    """
+    Returns (start, end) character ranges covering `text`, cut only at paragraph breaks, roughly `shards` of them.
+    With a chapter manifest, cuts are made at chapter starts instead, so each shard holds whole chapters.
+    """
+    if shards <= 1 or not text:
+        return [(0, len(text))]
+    if chapters:
+        cuts = [c['start'] for c in chapters if 0 < c['start'] < len(text)]
+    else:
+        cuts = []
+        i = text.find("\n\n")
+        while i != -1:
+            # Cut after the whole run of newlines, so every shard starts on a paragraph's first character
+            j = i
+            while j < len(text) and text[j] == "\n":
+                j += 1
+            if j < len(text):
+                cuts.append(j)
+            i = text.find("\n\n", j)
+    bounds = [0]
+    target = len(text) / shards
+    for cut in cuts:
+        if len(bounds) < shards and cut - bounds[-1] >= target * 0.9 and cut >= target * len(bounds):
+            bounds.append(cut)
+    bounds.append(len(text))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _read_tsv(path: Path) -> tuple:
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE)
+        header = next(reader, [])
+        return header, [row for row in reader if row]
+
+
+def _write_tsv(path: Path, header: list, rows: list):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\t'.join(header) + '\n')
+        for row in rows:
+            f.write('\t'.join(row) + '\n')
+
+
+def _shift(value: str, offset: int) -> str:
+    # Negative values mean "none" in BookNLP's output and stay as they are
+    v = int(value)
+    return value if v < 0 else str(v + offset)
+
+
+def _best_name(char: dict) -> str | None:
+    proper = char.get('mentions', {}).get('proper', [])
+    if not proper:
+        return None
+    return max(proper, key=lambda m: m.get('c', 0)).get('n', '').lower()
+
+
+def _names(char: dict) -> Counter:
+    return Counter({m['n'].lower(): m.get('c', 0) for m in char.get('mentions', {}).get('proper', [])})
+
+
+def _gender(char: dict) -> str | None:
+    g = char.get('g')
+    if not g or g.get('argmax') in (None, 'they/them/their'):
+        return None
+    return g.get('argmax')
+
+
+def _match(char: dict, merged: dict, candidate_ids: set) -> int | None:
+    """Finds the already merged character that `char` is the same person as, by proper names and gender."""
+    best = _best_name(char)
+    if best is None:
+        return None
+    names = _names(char)
+    gender = _gender(char)
+    candidates = []
+    for cid in candidate_ids:
+        other = merged[cid]
+        other_names = _names(other)
+        if best not in other_names and _best_name(other) not in names:
+            continue
+        other_gender = _gender(other)
+        if gender and other_gender and gender != other_gender:
+            continue
+        score = sum(min(c, other_names[n]) for n, c in names.items() if n in other_names)
+        candidates.append((score, other.get('count', 0), cid))
+    if not candidates:
+        return None
+    return max(candidates)[2]
+
+
+def _merge_mentions(a: list, b: list) -> list:
+    counts = Counter()
+    for m in a + b:
+        counts[m['n']] += m.get('c', 0)
+    return [{'c': c, 'n': n} for n, c in counts.most_common()]
+
+
+def _merge_gender(a: dict | None, b: dict | None) -> dict | None:
+    if not a or not b or 'inference' not in a or 'inference' not in b:
+        return a or b
+    ta, tb = a.get('total', 1.0), b.get('total', 1.0)
+    total = ta + tb
+    inference = {}
+    for k in set(a['inference']) | set(b['inference']):
+        inference[k] = (a['inference'].get(k, 0.0) * ta + b['inference'].get(k, 0.0) * tb) / total if total else 0.0
+    argmax = max(inference, key=inference.get)
+    return {'inference': inference, 'argmax': argmax, 'max': inference[argmax], 'total': total}
+
+
+def _merge_character(a: dict, b: dict) -> dict:
+    res = dict(a)
+    res['count'] = a.get('count', 0) + b.get('count', 0)
+    mentions = {}
+    for kind in set(a.get('mentions', {})) | set(b.get('mentions', {})):
+        mentions[kind] = _merge_mentions(a.get('mentions', {}).get(kind, []), b.get('mentions', {}).get(kind, []))
+    res['mentions'] = mentions
+    res['g'] = _merge_gender(a.get('g'), b.get('g'))
+    for key in CHARACTER_TOKEN_LISTS:
+        if key in a or key in b:
+            res[key] = a.get(key, []) + b.get(key, [])
+    return res
+
+
+# Entity types in book.entities and the book.book mention lists they're counted in
+MENTION_KINDS = {'PROP': 'proper', 'NOM': 'common', 'PRON': 'pronoun'}
+# Pronouns behind each of BookNLP's gender classes
+GENDER_PRONOUNS = {
+    'he/him/his': {'he', 'him', 'his', 'himself'},
+    'she/her': {'she', 'her', 'hers', 'herself'},
+    'they/them/their': {'they', 'them', 'their', 'theirs', 'themselves', 'themself'},
+}
+
+
+def _remove_mentions(char: dict, mentions: list) -> dict:
+    """Takes (entity type, text) mentions back out of a character's count, mention lists and gender."""
+    res = dict(char)
+    res['count'] = max(char.get('count', 0) - len(mentions), 0)
+    removed = Counter((MENTION_KINDS.get(prop), text) for prop, text in mentions)
+    res['mentions'] = {}
+    for kind, items in char.get('mentions', {}).items():
+        kept = []
+        for m in items:
+            c = m.get('c', 0) - removed.pop((kind, m.get('n')), 0)
+            if c > 0:
+                kept.append(dict(m, c=c))
+        res['mentions'][kind] = kept
+    g = char.get('g')
+    if g and 'inference' in g:
+        total = g.get('total', 1.0)
+        counts = {k: v * total for k, v in g['inference'].items()}
+        for prop, text in mentions:
+            for k, pronouns in GENDER_PRONOUNS.items():
+                if prop == 'PRON' and k in counts and text.lower() in pronouns:
+                    counts[k] -= 1
+                    total -= 1
+        if total > 0:
+            inference = {k: max(v, 0.0) / total for k, v in counts.items()}
+            argmax = max(inference, key=inference.get)
+            res['g'] = dict(g, inference=inference, argmax=argmax, max=inference[argmax], total=total)
+    return res
+
+
+class CharacterRegistry:
+    """
+    Characters seen so far across consecutive shards, under merged ids. Each shard's characters are matched to
+    earlier ones by proper names and gender, and renumbered otherwise. Call add_shard() with a shard's book.book
+    characters, map() for every character id the shard's other output refers to, then end_shard().
+    """
+
+    def __init__(self):
+        self.merged = {}
+        self.order = []
+        self.reconciled = 0
+        self.next_id = 0
+        self.id_map = {}
+        self.shard_ids = set()
+
+    def add_shard(self, characters: list, token_offset: int = 0) -> dict:
+        """Registers a shard's characters, returns their shard id -> merged id."""
+        self.id_map = {}
+        self.shard_ids = set()
+        # Only characters from earlier shards are candidates, each at most once. Two characters BookNLP kept
+        # apart within one shard stay apart.
+        candidate_ids = set(self.merged)
+        for char in characters:
+            for key in CHARACTER_TOKEN_LISTS:
+                char[key] = [dict(x, i=x['i'] + token_offset) if 'i' in x else x for x in char.get(key, [])]
+            target = _match(char, self.merged, candidate_ids) if candidate_ids else None
+            if target is None:
+                target = self.next_id + char['id']
+                self.merged[target] = dict(char, id=target)
+                self.order.append(target)
+            else:
+                candidate_ids.discard(target)
+                self.merged[target] = _merge_character(self.merged[target], char)
+                self.reconciled += 1
+            self.id_map[char['id']] = target
+            self.shard_ids.add(char['id'])
+        return dict(self.id_map)
+
+    def map(self, char_id: int) -> int:
+        # Ids without a book.book entry (minor clusters) still need to stay distinct from every other shard's,
+        # so they're renumbered past everything seen so far
+        if char_id < 0:
+            return char_id
+        self.shard_ids.add(char_id)
+        return self.id_map.get(char_id, self.next_id + char_id)
+
+    def end_shard(self):
+        self.next_id += max(self.shard_ids, default=-1) + 1
+        self.id_map = {}
+        self.shard_ids = set()
+
+    def read_shard(self, shard_dir: os.PathLike, token_offset: int = 0, name: str = 'book') -> dict:
+        """
+        Registers a shard straight from its BookNLP output, ending it. Returns shard id -> merged id for every
+        character id in the shard, numbered exactly as merge_shards() would number them.
+        """
+        shard_dir = Path(shard_dir)
+        with open(shard_dir / f"{name}.book", 'r', encoding='utf-8') as f:
+            self.add_shard(json.load(f).get('characters', []), token_offset)
+        ids = {}
+        sources = [(f"{name}.quotes", 'char_id')] + [(f"{name}.{kind}", 'COREF') for kind in SPAN_FILES]
+        for file_name, column in sources:
+            if not (shard_dir / file_name).is_file():
+                continue
+            header, rows = _read_tsv(shard_dir / file_name)
+            if column not in header:
+                continue
+            c = header.index(column)
+            for row in rows:
+                v = int(row[c])
+                ids[v] = self.map(v)
+        ids.update(self.id_map)
+        self.end_shard()
+        return ids
+
+    def get(self, merged_id: int) -> dict | None:
+        return self.merged.get(merged_id)
+
+    def name(self, merged_id: int) -> str | None:
+        """Most used proper name of a character, lowercased."""
+        char = self.merged.get(merged_id)
+        return _best_name(char) if char else None
+
+    def characters(self) -> list:
+        """Merged characters, most mentioned first, as in book.book."""
+        return sorted((self.merged[cid] for cid in self.order), key=lambda c: -c.get('count', 0))
+
+
+def merge_shards(shard_dirs: list, char_starts: list, dest: os.PathLike, name: str = 'book') -> dict:
+    """
+    Merges the BookNLP output of consecutive shards into one book in `dest`, as if it were parsed in one pass.
+    Paragraph, sentence and token indices and character offsets are shifted by each shard's start. Characters
+    from later shards are matched to earlier ones by proper names and gender, and renumbered otherwise.
+    Returns merge stats.
+    """
+    dest = Path(dest)
+    dest.mkdir(parents=True, exist_ok=True)
+    token_rows = []
+    quote_rows = []
+    span_rows = {k: [] for k in SPAN_FILES}
+    headers = {}
+    registry = CharacterRegistry()
+    token_offset = paragraph_offset = sentence_offset = 0
+    stats = {'shards': len(shard_dirs), 'characters': 0, 'reconciled': 0}
+
+    for shard_dir, char_start in zip(shard_dirs, char_starts):
+        shard_dir = Path(shard_dir)
+        header, rows = _read_tsv(shard_dir / f"{name}.tokens")
+        headers['tokens'] = header
+        col = {n: header.index(n) for n in header}
+        max_paragraph = max_sentence = -1
+        for row in rows:
+            max_paragraph = max(max_paragraph, int(row[col['paragraph_ID']]))
+            max_sentence = max(max_sentence, int(row[col['sentence_ID']]))
+            row[col['paragraph_ID']] = _shift(row[col['paragraph_ID']], paragraph_offset)
+            row[col['sentence_ID']] = _shift(row[col['sentence_ID']], sentence_offset)
+            for c in TOKEN_INDEX_COLUMNS:
+                if c in col:
+                    row[col[c]] = _shift(row[col[c]], token_offset)
+            for c in CHAR_OFFSET_COLUMNS:
+                if c in col:
+                    row[col[c]] = _shift(row[col[c]], char_start)
+        token_rows.extend(rows)
+        shard_tokens = len(rows)
+
+        with open(shard_dir / f"{name}.book", 'r', encoding='utf-8') as f:
+            characters = json.load(f).get('characters', [])
+        registry.add_shard(characters, token_offset)
+
+        def _char(value: str) -> str:
+            v = int(value)
+            return value if v < 0 else str(registry.map(v))
+
+        header, rows = _read_tsv(shard_dir / f"{name}.quotes")
+        headers['quotes'] = header
+        qcol = {n: header.index(n) for n in header}
+        for row in rows:
+            for c in QUOTE_TOKEN_COLUMNS:
+                if c in qcol:
+                    row[qcol[c]] = _shift(row[qcol[c]], token_offset)
+            row[qcol['char_id']] = _char(row[qcol['char_id']])
+        quote_rows.extend(rows)
+
+        for kind, columns in SPAN_FILES.items():
+            path = shard_dir / f"{name}.{kind}"
+            if not path.is_file():
+                continue
+            header, rows = _read_tsv(path)
+            headers[kind] = header
+            scol = {n: header.index(n) for n in header}
+            for row in rows:
+                for c in columns:
+                    row[scol[c]] = _shift(row[scol[c]], token_offset)
+                if 'COREF' in scol:
+                    row[scol['COREF']] = _char(row[scol['COREF']])
+            span_rows[kind].extend(rows)
+
+        token_offset += shard_tokens
+        paragraph_offset += max_paragraph + 1
+        sentence_offset += max_sentence + 1
+        registry.end_shard()
+
+    characters = registry.characters()
+    stats['characters'] = len(characters)
+    stats['reconciled'] = registry.reconciled
+    stats['tokens'] = len(token_rows)
+    stats['quotes'] = len(quote_rows)
+
+    _write_tsv(dest / f"{name}.tokens", headers['tokens'], token_rows)
+    _write_tsv(dest / f"{name}.quotes", headers['quotes'], quote_rows)
+    for kind, rows in span_rows.items():
+        if kind in headers:
+            _write_tsv(dest / f"{name}.{kind}", headers[kind], rows)
+    with open(dest / f"{name}.book", 'w', encoding='utf-8') as f:
+        json.dump({'characters': characters}, f)
+    return stats
+
+
+def attribution_report(single_dir: os.PathLike, sharded_dir: os.PathLike, name: str = 'book') -> dict:
+    """
+    Compares quote attribution of a sharded parse against a single-pass parse of the same text.
+    Quotes are matched by token span. Character ids differ between the two runs, so each sharded id is
+    mapped to the single-pass id it most often agrees with before counting agreement.
+    """
+    def _quotes(d):
+        header, rows = _read_tsv(Path(d) / f"{name}.quotes")
+        col = {n: header.index(n) for n in header}
+        return {(int(r[col['quote_start']]), int(r[col['quote_end']])): int(r[col['char_id']]) for r in rows}
+
+    def _token_count(d):
+        return len(_read_tsv(Path(d) / f"{name}.tokens")[1])
+
+    def _characters(d):
+        with open(Path(d) / f"{name}.book", 'r', encoding='utf-8') as f:
+            return len(json.load(f).get('characters', []))
+
+    single = _quotes(single_dir)
+    sharded = _quotes(sharded_dir)
+    shared = [span for span in single if span in sharded]
+    votes = defaultdict(Counter)
+    for span in shared:
+        votes[sharded[span]][single[span]] += 1
+    mapping = {cid: v.most_common(1)[0][0] for cid, v in votes.items()}
+    agree = sum(1 for span in shared if mapping[sharded[span]] == single[span])
+    return {
+        'single_tokens': _token_count(single_dir),
+        'sharded_tokens': _token_count(sharded_dir),
+        'single_quotes': len(single),
+        'sharded_quotes': len(sharded),
+        'matched_quotes': len(shared),
+        'agreeing_quotes': agree,
+        'agreement': agree / len(shared) if shared else 1.0,
+        'single_characters': _characters(single_dir),
+        'sharded_characters': _characters(sharded_dir),
+    }
+
+
+def print_report(res: dict):
+    print("\n=============== Shard Quality ===============\n")
+    print(f"    Tokens (single/sharded):        {res['single_tokens']} / {res['sharded_tokens']}")
+    print(f"    Quotes (single/sharded):        {res['single_quotes']} / {res['sharded_quotes']}")
+    print(f"    Quotes matched by span:         {res['matched_quotes']}")
+    print(f"    Attribution agreement:          {res['agreement']:.1%} ({res['agreeing_quotes']}/{res['matched_quotes']})")
+    print(f"    Characters (single/sharded):    {res['single_characters']} / {res['sharded_characters']}")
+    print("\n=============================================\n")
+
+
+def paragraph_pieces(text: str) -> list:
+    """Splits text into paragraphs that each keep the newlines after them, so the pieces join back into `text`."""
+    pieces = []
+    start = 0
+    i = text.find("\n\n")
+    while i != -1:
+        j = i
+        while j < len(text) and text[j] == "\n":
+            j += 1
+        pieces.append(text[start:j])
+        start = j
+        i = text.find("\n\n", j)
+    if start < len(text):
+        pieces.append(text[start:])
+    return pieces
+
+
+def changed_regions(old_text: str, new_text: str, context: int = 20) -> list:
+    """
+    Diffs two versions of a text by paragraph. Returns the changed regions as ((old_start, old_end), (new_start, new_end))
+    character ranges, each grown by up to `context` unchanged paragraphs on both sides, overlapping ones joined.
+    """
+    old = paragraph_pieces(old_text)
+    new = paragraph_pieces(new_text)
+    ops = SequenceMatcher(None, old, new, autojunk=False).get_opcodes()
+    regions = []
+    for k, (tag, i1, i2, j1, j2) in enumerate(ops):
+        if tag == 'equal':
+            continue
+        # Unchanged blocks sit between changes, so growing into them keeps the old and new sides lined up
+        before = ops[k - 1][2] - ops[k - 1][1] if k > 0 else 0
+        after = ops[k + 1][2] - ops[k + 1][1] if k + 1 < len(ops) else 0
+        grow_before = min(context, before)
+        grow_after = min(context, after)
+        region = [i1 - grow_before, i2 + grow_after, j1 - grow_before, j2 + grow_after]
+        if regions and region[0] <= regions[-1][1]:
+            regions[-1][1] = region[1]
+            regions[-1][3] = region[3]
+        else:
+            regions.append(region)
+    old_starts = [0]
+    for piece in old:
+        old_starts.append(old_starts[-1] + len(piece))
+    new_starts = [0]
+    for piece in new:
+        new_starts.append(new_starts[-1] + len(piece))
+    return [((old_starts[i1], old_starts[i2]), (new_starts[j1], new_starts[j2])) for i1, i2, j1, j2 in regions]
+
+
+def _replace_tsv(path: Path, header: list, rows: list):
+    # Parsed files may be hard links into the parse cache, so they're replaced rather than rewritten
+    tmp = path.with_name(path.name + '.tmp')
+    _write_tsv(tmp, header, rows)
+    os.replace(tmp, path)
+
+
+def splice_windows(parsed_dir: os.PathLike, regions: list, window_dirs: list, name: str = 'book') -> dict:
+    """
+    Replaces the parts of a book's BookNLP output in `parsed_dir` that cover changed regions of its text with the
+    output of re-parsing just those regions. `regions` come from changed_regions(), `window_dirs` hold BookNLP's
+    output for each region's new text. Everything after a region is shifted as it would be in a full re-parse,
+    and characters in the windows are matched to the book's by name. Returns splice stats.
+    """
+    parsed_dir = Path(parsed_dir)
+    token_header, tokens = _read_tsv(parsed_dir / f"{name}.tokens")
+    quote_header, quotes = _read_tsv(parsed_dir / f"{name}.quotes")
+    spans = {}
+    for kind in SPAN_FILES:
+        if (parsed_dir / f"{name}.{kind}").is_file():
+            spans[kind] = _read_tsv(parsed_dir / f"{name}.{kind}")
+    with open(parsed_dir / f"{name}.book", 'r', encoding='utf-8') as f:
+        characters = json.load(f).get('characters', [])
+
+    tcol = {n: i for i, n in enumerate(token_header)}
+    qcol = {n: i for i, n in enumerate(quote_header)}
+    # The book's own characters keep their ids, anything new in the windows is numbered past them
+    registry = CharacterRegistry()
+    registry.add_shard(characters)
+    for row in quotes:
+        registry.map(int(row[qcol['char_id']]))
+    for header, rows in spans.values():
+        if 'COREF' in header:
+            c = header.index('COREF')
+            for row in rows:
+                registry.map(int(row[c]))
+    registry.end_shard()
+    stats = {'regions': len(regions), 'replaced_tokens': 0, 'window_tokens': 0, 'reconciled': 0}
+
+    # Regions are applied in order. Everything before a region already matches the new text,
+    # so its start is the same in both and only its old end moves by what earlier regions changed.
+    char_delta = 0
+    for ((old_start, old_end), (new_start, new_end)), window_dir in zip(regions, window_dirs):
+        window_dir = Path(window_dir)
+        start, end = new_start, old_end + char_delta
+        onsets = [int(row[tcol['byte_onset']]) for row in tokens]
+        t0 = bisect.bisect_left(onsets, start)
+        t1 = bisect.bisect_left(onsets, end)
+        # Paragraph and sentence ids the window's take over from
+        first = tokens[t0] if t0 < len(tokens) else None
+        p0 = int(first[tcol['paragraph_ID']]) if first else int(tokens[-1][tcol['paragraph_ID']]) + 1 if tokens else 0
+        s0 = int(first[tcol['sentence_ID']]) if first else int(tokens[-1][tcol['sentence_ID']]) + 1 if tokens else 0
+        p1 = int(tokens[t1][tcol['paragraph_ID']]) if t1 < len(tokens) else None
+        s1 = int(tokens[t1][tcol['sentence_ID']]) if t1 < len(tokens) else None
+
+        header, window_tokens = _read_tsv(window_dir / f"{name}.tokens")
+        wcol = {n: i for i, n in enumerate(header)}
+        window_paragraphs = window_sentences = 0
+        for row in window_tokens:
+            window_paragraphs = max(window_paragraphs, int(row[wcol['paragraph_ID']]) + 1)
+            window_sentences = max(window_sentences, int(row[wcol['sentence_ID']]) + 1)
+            row[wcol['paragraph_ID']] = _shift(row[wcol['paragraph_ID']], p0)
+            row[wcol['sentence_ID']] = _shift(row[wcol['sentence_ID']], s0)
+            for c in TOKEN_INDEX_COLUMNS:
+                if c in wcol:
+                    row[wcol[c]] = _shift(row[wcol[c]], t0)
+            for c in CHAR_OFFSET_COLUMNS:
+                if c in wcol:
+                    row[wcol[c]] = _shift(row[wcol[c]], start)
+        window_tokens = [[row[wcol[n]] if n in wcol else '' for n in token_header] for row in window_tokens]
+        token_delta = len(window_tokens) - (t1 - t0)
+        paragraph_delta = (p0 + window_paragraphs - p1) if p1 is not None else 0
+        sentence_delta = (s0 + window_sentences - s1) if s1 is not None else 0
+        char_shift = (new_end - new_start) - (end - start)
+        for row in tokens[t1:]:
+            row[tcol['paragraph_ID']] = _shift(row[tcol['paragraph_ID']], paragraph_delta)
+            row[tcol['sentence_ID']] = _shift(row[tcol['sentence_ID']], sentence_delta)
+            for c in TOKEN_INDEX_COLUMNS:
+                if c in tcol:
+                    row[tcol[c]] = _shift(row[tcol[c]], token_delta)
+            for c in CHAR_OFFSET_COLUMNS:
+                if c in tcol:
+                    row[tcol[c]] = _shift(row[tcol[c]], char_shift)
+        tokens[t0:t1] = window_tokens
+        stats['replaced_tokens'] += t1 - t0
+        stats['window_tokens'] += len(window_tokens)
+
+        # Mentions in the region being replaced, by character
+        removed = defaultdict(list)
+        if 'entities' in spans and 'COREF' in spans['entities'][0]:
+            header, rows = spans['entities']
+            ecol = {n: i for i, n in enumerate(header)}
+            for row in rows:
+                if t0 <= int(row[ecol['start_token']]) < t1:
+                    removed[int(row[ecol['COREF']])].append((row[ecol['prop']] if 'prop' in ecol else '', row[ecol['text']] if 'text' in ecol else ''))
+
+        # Token lists of the book's characters lose whatever was in the region and shift like the tokens
+        for char in registry.merged.values():
+            for key in CHARACTER_TOKEN_LISTS:
+                if key in char:
+                    char[key] = [x if 'i' not in x or x['i'] < t0 else dict(x, i=x['i'] + token_delta)
+                                 for x in char[key] if 'i' not in x or not t0 <= x['i'] < t1]
+        reconciled = registry.reconciled
+        id_map = registry.read_shard(window_dir, t0)
+        stats['reconciled'] += registry.reconciled - reconciled
+        # Taken out once the window's characters are matched, which goes by the names they had, or counts would
+        # grow with every edit. Characters left without any mentions are dropped.
+        for cid, mentions in removed.items():
+            if cid in registry.merged:
+                char = _remove_mentions(registry.merged[cid], mentions)
+                if char['count'] > 0:
+                    registry.merged[cid] = char
+                else:
+                    del registry.merged[cid]
+                    registry.order.remove(cid)
+
+        def _splice(rows: list, header: list, window_rows: list, window_header: list, columns: list, char_column: str | None):
+            col = {n: i for i, n in enumerate(header)}
+            wc = {n: i for i, n in enumerate(window_header)}
+            spliced = []
+            for row in window_rows:
+                for c in columns:
+                    if c in wc:
+                        row[wc[c]] = _shift(row[wc[c]], t0)
+                if char_column in wc:
+                    v = int(row[wc[char_column]])
+                    row[wc[char_column]] = str(id_map.get(v, v))
+                spliced.append([row[wc[n]] if n in wc else '' for n in header])
+            res = []
+            for row in rows:
+                first_token = int(row[col[columns[0]]])
+                if first_token < t0:
+                    res.append(row)
+                elif first_token >= t1:
+                    for c in columns:
+                        if c in col:
+                            row[col[c]] = _shift(row[col[c]], token_delta)
+                    res.append(row)
+            # Rows stay in token order, as BookNLP writes them
+            at = next((i for i, row in enumerate(res) if int(row[col[columns[0]]]) >= t0 + len(window_tokens)), len(res))
+            return res[:at] + spliced + res[at:]
+
+        header, window_quotes = _read_tsv(window_dir / f"{name}.quotes")
+        quotes = _splice(quotes, quote_header, window_quotes, header, QUOTE_TOKEN_COLUMNS, 'char_id')
+        for kind, columns in SPAN_FILES.items():
+            if kind in spans and (window_dir / f"{name}.{kind}").is_file():
+                header, window_rows = _read_tsv(window_dir / f"{name}.{kind}")
+                spans[kind] = (spans[kind][0], _splice(spans[kind][1], spans[kind][0], window_rows, header, columns, 'COREF'))
+        char_delta += char_shift
+
+    _replace_tsv(parsed_dir / f"{name}.tokens", token_header, tokens)
+    _replace_tsv(parsed_dir / f"{name}.quotes", quote_header, quotes)
+    for kind, (header, rows) in spans.items():
+        _replace_tsv(parsed_dir / f"{name}.{kind}", header, rows)
+    tmp = parsed_dir / f"{name}.book.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'characters': registry.characters()}, f)
+    os.replace(tmp, parsed_dir / f"{name}.book")
+    stats['tokens'] = len(tokens)
+    stats['characters'] = len(registry.merged)
+    return stats
+
+
+def cleanup(shard_root: os.PathLike):
+    shutil.rmtree(shard_root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare quote attribution of a sharded BookNLP parse against a single-pass one.")
+    parser.add_argument('single', help="parsed/ folder of a single-pass parse")
+    parser.add_argument('sharded', help="parsed/ folder of a sharded parse")
+    args = parser.parse_args()
+    print_report(attribution_report(args.single, args.sharded))
@@ -0,0 +1,50 @@
+import zipfile
+
+from book_text import extract_epub
+
+CONTAINER = ('<?xml version="1.0"?><container xmlns="urn:oasis:names:tc:opendocument:xmlns:container" version="1.0">'
+             '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles></container>')
+
+
+def write_epub(path, manifest: str, spine: str, files: dict, toc: str = ''):
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('mimetype', 'application/epub+zip')
+        zf.writestr('META-INF/container.xml', CONTAINER)
+        zf.writestr('OEBPS/content.opf', f'<?xml version="1.0"?><package xmlns="http://www.idpf.org/2007/opf" version="3.0">'
+                                         f'<manifest>{manifest}</manifest><spine{toc}>{spine}</spine></package>')
+        for name, content in files.items():
+            zf.writestr(f'OEBPS/{name}', content)
+
+
+def chapter(text: str, heading: str = '') -> str:
+    return f'<html><body>{f"<h1>{heading}</h1>" if heading else ""}<p>{text}</p></body></html>'
+
+
+def test_nav_with_html_entities(tmp_path):
+    nav = ('<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops"><body><nav epub:type="toc"><ol>'
+           '<li><a href="c1.xhtml">Chapter&nbsp;One</a></li><li><a href="c2.xhtml#start">The &amp; End</a></li></ol></nav></body></html>')
+    write_epub(
+        tmp_path / 'book.epub',
+        '<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>'
+        '<item id="c1" href="c1.xhtml" media-type="application/xhtml+xml"/>'
+        '<item id="c2" href="c2.xhtml" media-type="application/xhtml+xml"/>'
+        '<item id="notes" href="notes.xhtml" media-type="application/xhtml+xml"/>',
+        '<itemref idref="nav"/><itemref idref="c1"/><itemref idref="c2"/><itemref idref="notes" linear="no"/>',
+        {'nav.xhtml': nav, 'c1.xhtml': chapter('It began.'), 'c2.xhtml': chapter('It ended.'), 'notes.xhtml': chapter('A note.')},
+    )
+    chapters = extract_epub(tmp_path / 'book.epub')
+    # The nav document and the non-linear notes aren't chapters
+    assert [(c['title'], c['text']) for c in chapters] == [('Chapter One', 'It began.'), ('The & End', 'It ended.')]
+
+
+def test_unreadable_ncx_falls_back_to_headings(tmp_path):
+    write_epub(
+        tmp_path / 'book.epub',
+        '<item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml"/>'
+        '<item id="c1" href="c1.xhtml" media-type="application/xhtml+xml"/>',
+        '<itemref idref="c1"/>',
+        {'toc.ncx': '<ncx><navMap><navPoint><navLabel><text>Broken&nbsp;</text></navLabel><content src="c1.xhtml"/></navPoint></navMap></ncx>',
+         'c1.xhtml': chapter('It began.', heading='Prologue')},
+        toc=' toc="ncx"',
+    )
+    assert [c['title'] for c in extract_epub(tmp_path / 'book.epub')] == ['Prologue']
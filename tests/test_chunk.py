@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from chunk import BookData, REALIGN_JOURNAL, _split_tokens, realign_audio, recover_realign
+
+
+@pytest.mark.parametrize('text, tokens', [
+    ("said I. Then we left.", ['said', 'I', '.', 'Then', 'we', 'left', '.']),
+    ("5 p.m. OK", ['5', 'p.m.', 'OK']),
+    ("J. R. R. Tolkien wrote.", ['J.', 'R.', 'R.', 'Tolkien', 'wrote', '.']),
+    ("Mr. Smith met Dr. Who.", ['Mr.', 'Smith', 'met', 'Dr.', 'Who', '.']),
+    ("in the U.S. Army, e.g. here", ['in', 'the', 'U.S.', 'Army', ',', 'e.g.', 'here']),
+    ("I don't know John's dog.", ['I', 'do', "n't", 'know', 'John', "'s", 'dog', '.']),
+])
+def test_tokens(text, tokens):
+    assert _split_tokens(text) == tokens
+
+
+def test_sentences():
+    book = BookData.from_text("He said I. Then we left at 5 p.m. OK then.\n\nA new paragraph.")
+    words = [book.vocab[w] for w in book.word_ids]
+    sentences = {}
+    for word, sentence in zip(words, book.sentence_ids.tolist()):
+        sentences.setdefault(sentence, []).append(word)
+    assert list(sentences.values()) == [
+        ['He', 'said', 'I', '.'],
+        ['Then', 'we', 'left', 'at', '5', 'p.m.', 'OK', 'then', '.'],
+        ['A', 'new', 'paragraph', '.'],
+    ]
+
+
+def _audio(path, names):
+    for name, content in names.items():
+        (path / name).write_text(content)
+
+
+def _contents(path):
+    return {f.relative_to(path).as_posix(): f.read_text() for f in path.rglob('*') if f.is_file()}
+
+
+def test_realign(tmp_path):
+    _audio(tmp_path, {'chunk_00000.wav': 'a', 'chunk_00001.wav': 'b', 'chunk_00002.wav': 'c'})
+    realign_audio({'kept': [[0, 1], [2, 0]]}, tmp_path)
+    assert _contents(tmp_path) == {'chunk_00000.wav': 'c', 'chunk_00001.wav': 'a', 'stale/chunk_00001.wav': 'b'}
+
+
+@pytest.mark.parametrize('phase, files', [
+    # Interrupted while moving files aside, the remaining ones still have their old index
+    ('aside', {'.chunk_00000.wav.realign': 'a', 'chunk_00001.wav': 'b', 'chunk_00002.wav': 'c'}),
+    # Interrupted while placing them, chunk 2 already moved to 0
+    ('placing', {'.chunk_00000.wav.realign': 'a', '.chunk_00001.wav.realign': 'b', 'chunk_00000.wav': 'c'}),
+])
+def test_recover_realign(tmp_path, phase, files):
+    _audio(tmp_path, files)
+    (tmp_path / REALIGN_JOURNAL).write_text(json.dumps({'kept': [[0, 1], [2, 0]], 'phase': phase}))
+    assert recover_realign(tmp_path)
+    assert _contents(tmp_path) == {'chunk_00000.wav': 'c', 'chunk_00001.wav': 'a', 'stale/chunk_00001.wav': 'b'}
+    assert not recover_realign(tmp_path)
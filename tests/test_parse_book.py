@@ -0,0 +1,90 @@
+import contextlib
+import io
+import json
+import threading
+from pathlib import Path
+
+import parse_book
+
+TOKEN_HEADER = ['paragraph_ID', 'sentence_ID', 'token_ID_within_sentence', 'token_ID_within_document', 'word', 'lemma',
+                'byte_onset', 'byte_offset', 'POS_tag', 'fine_POS_tag', 'dependency_relation', 'syntactic_head_ID', 'event']
+TEXT = '" Hello , " said Anna . " Hi , " said Bob .'
+
+
+def write_parse(book_path: Path, char_ids: list):
+    """BookNLP-style output for TEXT, with its two quotes attributed to `char_ids`."""
+    parsed = book_path / "parsed"
+    parsed.mkdir(parents=True)
+    (book_path / "text").mkdir()
+    rows = []
+    offset = 0
+    for i, word in enumerate(TEXT.split()):
+        rows.append(['0', str(i // 6), '0', str(i), word, word, str(offset), str(offset + len(word)), 'X', 'X', 'X', str(i), 'O'])
+        offset += len(word) + 1
+    with open(parsed / "book.tokens", 'w', encoding='utf-8') as f:
+        f.write('\t'.join(TOKEN_HEADER) + '\n')
+        f.writelines('\t'.join(row) + '\n' for row in rows)
+    with open(parsed / "book.quotes", 'w', encoding='utf-8') as f:
+        f.write("quote_start\tquote_end\tmention_start\tmention_end\tmention_phrase\tchar_id\tquote\n")
+        f.write(f"0\t3\t5\t5\tAnna\t{char_ids[0]}\tHello ,\n")
+        f.write(f"7\t10\t12\t12\tBob\t{char_ids[1]}\tHi ,\n")
+    characters = [{'id': 1, 'count': 1, 'mentions': {'proper': [{'c': 1, 'n': 'Anna'}]}, 'g': {'argmax': 'she/her'}},
+                  {'id': 2, 'count': 1, 'mentions': {'proper': [{'c': 1, 'n': 'Bob'}]}, 'g': {'argmax': 'he/him/his'}}]
+    with open(parsed / "book.book", 'w') as f:
+        json.dump({'characters': characters}, f)
+
+
+def test_same_parses_match(tmp_path):
+    write_parse(tmp_path / "full", [1, 2])
+    write_parse(tmp_path / "lean", [1, 2])
+    report = parse_book.compare_parses(tmp_path / "full", tmp_path / "lean")
+    assert report['same_chunks'] and report['same_labels']
+
+
+def test_attribution_differences_are_caught(tmp_path):
+    # Same tokens, but the second quote goes to Anna instead of Bob
+    write_parse(tmp_path / "full", [1, 2])
+    write_parse(tmp_path / "lean", [1, 1])
+    report = parse_book.compare_parses(tmp_path / "full", tmp_path / "lean")
+    assert not report['same_chunks']
+    assert report['same_labels']
+
+
+def test_every_quoted_character_gets_its_own_name(tmp_path):
+    # Ids without a book.book entry (minor clusters) still count
+    write_parse(tmp_path / "book", [1, 7])
+    assert parse_book.attribution_names(tmp_path / "book") == {1: 'char1', 2: 'char2', 7: 'char7'}
+
+
+def test_timings_only_come_from_the_parsing_thread():
+    out = io.StringIO()
+    log = parse_book._Tee(out)
+    other = threading.Thread(target=lambda: print("--- synthesis: 9.0 seconds ---"))
+    with contextlib.redirect_stdout(log):
+        other.start()
+        other.join()
+        print("--- entity: 1.5 seconds ---")
+    assert parse_book.TIMING_PATTERN.findall(log.getvalue()) == [('entity', '1.5')]
+    # Everything is still shown
+    assert out.getvalue().count('seconds') == 2
+
+
+def test_single_shard_prepares_the_text_once(tmp_path, monkeypatch):
+    src = tmp_path / "book.txt"
+    src.write_text("A short book.\n")
+    prepared = []
+    prepare_text = parse_book.prepare_text
+    monkeypatch.setattr(parse_book, 'prepare_text', lambda *args: prepared.append(args) or prepare_text(*args))
+    parsed = []
+
+    class Parser:
+        def parse(self, src_path, dest_path):
+            parsed.append(parse_book.prepare_text(src_path, dest_path))
+
+        def parse_prepared(self, sanitized, dest_path, start=None):
+            parsed.append(sanitized)
+
+    monkeypatch.setattr(parse_book, 'get_parser', lambda profile: Parser())
+    assert parse_book.parse_sharded(src, tmp_path / "out", shards=4) == {'shards': 1}
+    assert len(prepared) == 1
+    assert parsed == [tmp_path / "out" / "text" / "sanitized.txt"]
@@ -2,15 +2,25 @@ import os
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import threading
+import importlib
 import json
 import atexit
 import shutil
-from pydub import AudioSegment
 from pathlib import Path
-from parse_book import parse
-from generate_audio import *
+from parse_book import parse, release_parser, prepare_text, PIPELINE_PROFILES, DEFAULT_PROFILE
 from chunk import generate_chunks
-import simpleaudio
+
+# torch, chatterbox and BookNLP take seconds to import, so they're imported where they're first used
+# rather than before the main menu can show. Once it's up they're imported in the background, which has
+# usually finished by the time a screen needs them.
+PREWARM_MODULES = ['generate_audio', 'booknlp.booknlp', 'simpleaudio']
+
+def prewarm(modules: list = PREWARM_MODULES):
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f"Could not preload {name}: {e}")
 
 class AudiobookApplication:
     def __init__(self):
@@ -20,6 +30,7 @@ class AudiobookApplication:
         self.book_data = None
         self.script_names = {}
         self.show_main_menu()
+        self.root.after_idle(lambda: threading.Thread(target=prewarm, daemon=True).start())
     
     def show_main_menu(self):
         """Display the main menu GUI"""
@@ -210,6 +221,7 @@ class AudiobookCreationGUI:
         self.file_path = None
         self.title_var = tk.StringVar()
         self.multi_voice = tk.BooleanVar(value=True)
+        self.profile_var = tk.StringVar(value=DEFAULT_PROFILE)
         self.output_var = tk.StringVar(value="Ready to start...")
         
         self.build_ui()
@@ -233,7 +245,13 @@ class AudiobookCreationGUI:
         ttk.Button(mainframe, text="Browse", command=self.browse_file).grid(row=1, column=2, sticky="E")
         
         # Multi-voice toggle
-        ttk.Checkbutton(mainframe, text="Use Multiple Voices", variable=self.multi_voice).grid(row=2, column=0, columnspan=3, sticky="W", pady=10)
+        ttk.Checkbutton(mainframe, text="Use Multiple Voices", variable=self.multi_voice).grid(row=2, column=0, columnspan=2, sticky="W", pady=10)
+        
+        # BookNLP pipeline profile
+        profile_frame = ttk.Frame(mainframe)
+        profile_frame.grid(row=2, column=2, sticky="E")
+        ttk.Label(profile_frame, text="Parsing:").grid(row=0, column=0, sticky="E", padx=(0, 5))
+        ttk.Combobox(profile_frame, textvariable=self.profile_var, values=list(PIPELINE_PROFILES), state="readonly", width=8).grid(row=0, column=1, sticky="E")
         
         # Status label
         ttk.Label(mainframe, text="Status:").grid(row=3, column=0, sticky="W")
@@ -251,7 +269,7 @@ class AudiobookCreationGUI:
     
     def browse_file(self):
         """Browse for a book file"""
-        filetypes = [("Text or PDF Files", "*.txt *.pdf")]
+        filetypes = [("Text, PDF or EPUB Files", "*.txt *.pdf *.epub")]
         path = filedialog.askopenfilename(title="Select Book File", filetypes=filetypes)
         if path:
             self.file_path = Path(path)
@@ -287,21 +305,22 @@ class AudiobookCreationGUI:
             book_folder = Path('books') / self.title_var.get()
             book_folder.mkdir(parents=True, exist_ok=True)
 
-            # TODO: Call your parse function here
-            parse(self.file_path, book_folder)
-            
-            # Simulate processing
-            self.root.after(0, lambda: self.output_var.set("Parsing complete!"))
-            
             # Move to next step based on multi-voice setting
             if self.multi_voice.get():
+                try:
+                    cached = parse(self.file_path, book_folder, profile=self.profile_var.get())
+                finally:
+                    # BookNLP isn't needed again for this book, and would hold device memory while it's rendered
+                    release_parser()
+                status = "Parsing complete! (reused cached results)" if cached else "Parsing complete!"
+                self.root.after(0, lambda: self.output_var.set(status))
                 # Go to character labeling
                 self.root.after(1000, lambda: self.app.show_character_labeling(book_folder))
             else:
-                # TODO: Call your chunking function with multivoice=False
-                # TODO: Call your chunking function with multivoice=False
-                # create_chunks(book_folder, multivoice=False)
-                generate_chunks(book_folder, {}, multivoice = False, max_length = 80)
+                # A single voice doesn't need speakers, so BookNLP is skipped and the text is chunked directly
+                prepare_text(self.file_path, book_folder)
+                generate_chunks(book_folder, {}, multivoice = False, min_length = 1.5, max_length = 20, length_model = "seconds")
+                self.root.after(0, lambda: self.output_var.set("Chunking complete!"))
                 
                 # Go directly to processing
                 self.root.after(1000, lambda: self.app.show_processing_gui(book_folder))
@@ -545,7 +564,7 @@ class CharacterLabelingGUI:
         """Continue to the processing GUI"""
         # TODO: Call your chunking function with the script_names
         # create_chunks(self.book_path, script_names=self.script_names, multivoice=True)
-        generate_chunks(self.book_path, self.script_names, max_length = 80)
+        generate_chunks(self.book_path, self.script_names, min_length = 1.5, max_length = 20, length_model = "seconds")
 
         self.app.show_processing_gui(self.book_path)
     
@@ -747,6 +766,7 @@ class VoiceEditorGUI:
         self.root.after(100, lambda: self.root.focus_force())
         
         # TODO: Initialize VoiceArguments class
+        from generate_audio import VoiceArguments
         self.voice_args = VoiceArguments(name="Untitled")
         
         self.sample_text = tk.StringVar(value="That quick beige fox jumped in the air over each thin dog. \"Look out!\" I shout, for he's foiled you again, creating chaos.")
@@ -841,6 +861,7 @@ class VoiceEditorGUI:
         entry.grid(row=0, column=1)
 
     def play_sample(self, sample, sr):
+        import simpleaudio
         simpleaudio.play_buffer(sample, num_channels=1, bytes_per_sample=2, sample_rate=sr)
 
     def show_parameter_info(self):
@@ -900,6 +921,7 @@ class VoiceEditorGUI:
                 self.voice_args.temperature = self.temperature.get()
                 self.voice_args.pitch = self.pitch.get()
 
+                from generate_audio import Generate
                 audio, sr = Generate.generate_sample(self.sample_text.get(), self.voice_args)
                 self.play_sample(audio, sr)
                 self.status_label.config(text="Done.")
@@ -1069,7 +1091,7 @@ class ExportBookGUI:
             title="Save MP3 As",
             defaultextension=".mp3",
             initialfile=initial_name,
-            filetypes=[("MP3 Files", "*.mp3"), ("All Files", "*.*")]
+            filetypes=[("MP3 Files", "*.mp3"), ("M4B Audiobooks", "*.m4b"), ("All Files", "*.*")]
         )
         
         if file_path:
@@ -1086,28 +1108,16 @@ class ExportBookGUI:
     
     def combine_wavs_to_mp3(self, wav_dir, output_mp3_path):
         """Combine WAV files into MP3"""
-        combined = AudioSegment.empty()
-        self.root.after(0, lambda: self.output_var.set("Combining WAVs..."))
-        wav_files = sorted([f for f in os.listdir(wav_dir) if f.lower().endswith(".wav")])
-        
-        total_files = len(wav_files)
-        
-        segments = [AudioSegment.from_wav(os.path.join(wav_dir, f)) for f in wav_files]
-        combined = sum(segments[1:], segments[0]) if segments else AudioSegment.empty()
-
-        # for i, fname in enumerate(wav_files):
-        #     path = os.path.join(wav_dir, fname)
-        #     audio = AudioSegment.from_wav(path)
-        #     combined += audio
-            
-        #     # Update status
-        #     progress = (i + 1) / total_files * 100
-        #     self.root.after(0, lambda p=progress, f=fname: 
-        #                   self.output_var.set(f"Processing: {f} ({p:.1f}%)"))
-        
-        # Export to MP3
+        from export_audio import export_book
         self.root.after(0, lambda: self.output_var.set("Exporting to MP3..."))
-        combined.export(output_mp3_path, format="mp3")
+
+        # Chunks are streamed into the encoder one by one, so only the status needs updating
+        def progress(done, total):
+            if done % 100 == 0 or done == total:
+                self.root.after(0, lambda: self.output_var.set(f"Exporting to MP3... ({done / total * 100:.1f}%)"))
+
+        # Parts of the book are encoded at once, one per CPU core
+        export_book(wav_dir, output_mp3_path, progress=progress)
     
     def start_export(self):
         """Start the export process"""
@@ -1150,6 +1160,7 @@ class ExportBookGUI:
 
 
 def start_processing(path, threaded, num_threads, device, voices, event):
+    from generate_audio import Generate, Device
     gen = Generate(
         Device(device=device),
         path,